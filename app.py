@@ -1,12 +1,31 @@
+import time
+
+# Startup diagnostics time the first paint from here, imports included
+script_started = time.monotonic()
+
 import streamlit as st
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
+from chat_render import HISTORY_PAGE_SIZE, exchange_html, inject_static_assets, render_history
+from chat_turn import BEST_OF_N, TURN_PRIORITIES, Turn, run_turn
+from conversation_store import ConversationStore, new_session_id
+from fanout_policy import FanOutPolicy
+from job_queue import CANCELLED, DONE, FAILED, QUEUED, JobQueue
+from knowledge_index import KnowledgeIndex
+from prompts import get_prompt_template
+from provider_health import CLOSED, OPEN, get_health
+from providers import PROVIDER_KEYS, build_llms
+from response_cache import ResponseCache, model_name_of
+from router import build_query_router
+from sharded_report import SHARDED_REPORTS
+from telemetry import (
+    HEAVY_MODULES, METRICS_PORT, STARTUP_TIMES, TurnTrace, call_label, get_metrics, import_time_report,
+    record_startup, start_metrics_server
+)
+from watchlist import Watchlist, configured_companies
+from web_evidence import WEB_EVIDENCE, WebEvidenceFetcher
+import concurrent.futures
+import html
 import os
-import re
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,498 +37,302 @@ st.set_page_config(
     page_icon="🚀"
 )
 
-# Enhanced Custom CSS with modern design
-st.markdown("""
-    <style>
-    /* Import Google Fonts */
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-    
-    /* Modern dark theme variables */
-    :root {
-        --primary-gradient: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        --secondary-gradient: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-        --bg-primary: #0a0e1a;
-        --bg-secondary: #1a1f2e;
-        --bg-tertiary: #252b3b;
-        --text-primary: #ffffff;
-        --text-secondary: #b4bcd0;
-        --text-muted: #6b7280;
-        --accent-blue: #3b82f6;
-        --accent-purple: #8b5cf6;
-        --accent-green: #10b981;
-        --border-color: #374151;
-        --shadow-light: 0 4px 6px -1px rgba(0, 0, 0, 0.1);
-        --shadow-medium: 0 10px 15px -3px rgba(0, 0, 0, 0.1);
-        --shadow-heavy: 0 25px 50px -12px rgba(0, 0, 0, 0.25);
-    }
-    
-    /* Base styles */
-    html, body {
-        font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-        background: var(--bg-primary);
-        color: var(--text-primary);
-    }
-    
-    /* Main app container */
-    .stApp {
-        background: var(--bg-primary);
-        color: var(--text-primary);
-    }
-    
-    /* Header section - compact */
-    .header-section {
-        background: var(--primary-gradient);
-        padding: 1rem;
-        margin: -1rem -1rem 1rem -1rem;
-        border-radius: 0 0 16px 16px;
-        text-align: center;
-        position: relative;
-    }
-    
-    .header-title {
-        font-size: 1.8rem;
-        font-weight: 700;
-        color: white;
-        margin: 0;
-        text-shadow: 0 2px 4px rgba(0,0,0,0.2);
-    }
-    
-    /* Chat container */
-    .chat-container {
-        background: rgba(26, 31, 46, 0.8);
-        backdrop-filter: blur(20px);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        border-radius: 16px;
-        padding: 1.5rem;
-        margin-bottom: 100px;
-        max-height: calc(100vh - 220px);
-        overflow-y: auto;
-        box-shadow: var(--shadow-medium);
-    }
-    
-    /* Message bubbles */
-    .message {
-        padding: 0.8rem 1rem;
-        border-radius: 16px;
-        margin-bottom: 0.8rem;
-        font-size: 0.9rem;
-        line-height: 1.5;
-        box-shadow: var(--shadow-light);
-        max-width: fit-content;
-        animation: messageSlideIn 0.3s ease-out;
-    }
-    
-    .user-message {
-        background: var(--primary-gradient);
-        color: white;
-        margin-left: auto;
-        max-width: 75%;
-    }
-    
-    .bot-message {
-        background: rgba(37, 43, 59, 0.9);
-        color: var(--text-primary);
-        margin-right: auto;
-        max-width: 85%;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    
-    /* Message labels */
-    .message strong {
-        font-weight: 600;
-        font-size: 0.8rem;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-        opacity: 0.8;
-    }
-    
-    /* Fixed input container at bottom */
-    .input-container {
-        position: fixed;
-        bottom: 0;
-        left: 0;
-        right: 0;
-        background: rgba(26, 31, 46, 0.95);
-        backdrop-filter: blur(20px);
-        border-top: 1px solid rgba(255, 255, 255, 0.1);
-        padding: 1rem;
-        z-index: 1000;
-    }
-    
-    /* Input wrapper with send button inside */
-    .input-wrapper {
-        max-width: 1200px;
-        margin: 0 auto;
-        position: relative;
-        display: flex;
-        align-items: center;
-    }
-    
-    /* Enhanced input field */
-    .stTextInput > div > div > input {
-        background: rgba(37, 43, 59, 0.9) !important;
-        border: 2px solid rgba(255, 255, 255, 0.1) !important;
-        border-radius: 25px !important;
-        color: var(--text-primary) !important;
-        padding: 0.8rem 3rem 0.8rem 1.2rem !important;
-        font-size: 0.95rem !important;
-        transition: all 0.3s ease !important;
-        font-family: 'Inter', sans-serif !important;
-        width: 100% !important;
-    }
-    
-    .stTextInput > div > div > input:focus {
-        outline: none !important;
-        border-color: var(--accent-blue) !important;
-        box-shadow: 0 0 0 3px rgba(59, 130, 246, 0.2) !important;
-    }
-    
-    .stTextInput > div > div > input::placeholder {
-        color: var(--text-muted) !important;
-    }
-    
-    /* Send button inside input */
-    .send-button {
-        position: absolute;
-        right: 8px;
-        top: 50%;
-        transform: translateY(-50%);
-        background: var(--primary-gradient);
-        border: none;
-        border-radius: 50%;
-        width: 36px;
-        height: 36px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        cursor: pointer;
-        transition: all 0.3s ease;
-        z-index: 10;
-    }
-    
-    .send-button:hover {
-        transform: translateY(-50%) scale(1.05);
-        box-shadow: var(--shadow-medium);
-    }
-    
-    .send-button:disabled {
-        opacity: 0.5;
-        cursor: not-allowed;
-    }
-    
-    /* Tips section */
-    .tips-section {
-        background: rgba(37, 43, 59, 0.6);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        border-radius: 12px;
-        padding: 1rem;
-        backdrop-filter: blur(10px);
-        margin-bottom: 1rem;
-    }
-    
-    .tips-section h4 {
-        color: var(--accent-blue);
-        font-size: 0.9rem;
-        font-weight: 600;
-        margin-bottom: 0.5rem;
-        display: flex;
-        align-items: center;
-        gap: 0.3rem;
-    }
-    
-    .tips-section p {
-        color: var(--text-secondary);
-        font-size: 0.8rem;
-        line-height: 1.4;
-        margin-bottom: 0.3rem;
-    }
-    
-    .tips-section code {
-        background: rgba(59, 130, 246, 0.1);
-        color: var(--accent-blue);
-        padding: 0.2rem 0.4rem;
-        border-radius: 4px;
-        font-size: 0.75rem;
-    }
-    
-    /* Sidebar styling */
-    [data-testid="stSidebar"] {
-        background: var(--bg-secondary) !important;
-        border-right: 1px solid var(--border-color) !important;
-    }
-    
-    [data-testid="stSidebar"] .stTextInput > div > div > input {
-        background: var(--bg-tertiary) !important;
-        border: 1px solid var(--border-color) !important;
-        border-radius: 8px !important;
-        color: var(--text-primary) !important;
-        padding: 0.5rem !important;
-    }
-    
-    [data-testid="stSidebar"] .stButton > button {
-        background: var(--secondary-gradient) !important;
-        border-radius: 8px !important;
-        font-weight: 500 !important;
-        width: 100% !important;
-        border: none !important;
-        color: white !important;
-    }
-    
-    /* Status indicators */
-    .status-indicator {
-        display: inline-flex;
-        align-items: center;
-        gap: 0.3rem;
-        padding: 0.2rem 0.5rem;
-        border-radius: 8px;
-        font-size: 0.7rem;
-        font-weight: 500;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-    }
-    
-    .status-openai {
-        background: rgba(16, 185, 129, 0.1);
-        color: var(--accent-green);
-        border: 1px solid rgba(16, 185, 129, 0.2);
-    }
-    
-    .status-gemini {
-        background: rgba(139, 92, 246, 0.1);
-        color: var(--accent-purple);
-        border: 1px solid rgba(139, 92, 246, 0.2);
-    }
-    
-    /* Loading indicator */
-    .loading-indicator {
-        display: flex;
-        align-items: center;
-        gap: 0.5rem;
-        color: var(--text-secondary);
-        font-size: 0.85rem;
-        margin: 1rem 0;
-        justify-content: center;
-    }
-    
-    .loading-dots {
-        display: flex;
-        gap: 3px;
-    }
-    
-    .loading-dots div {
-        width: 5px;
-        height: 5px;
-        background: var(--accent-blue);
-        border-radius: 50%;
-        animation: pulse 1.4s infinite;
-    }
-    
-    .loading-dots div:nth-child(2) { animation-delay: 0.2s; }
-    .loading-dots div:nth-child(3) { animation-delay: 0.4s; }
-    
-    /* Enhanced scrollbar */
-    ::-webkit-scrollbar {
-        width: 6px;
-    }
-    
-    ::-webkit-scrollbar-track {
-        background: transparent;
-    }
-    
-    ::-webkit-scrollbar-thumb {
-        background: linear-gradient(180deg, var(--accent-blue), var(--accent-purple));
-        border-radius: 10px;
-    }
-    
-    /* Animations */
-    @keyframes messageSlideIn {
-        from {
-            opacity: 0;
-            transform: translateY(15px);
-        }
-        to {
-            opacity: 1;
-            transform: translateY(0);
-        }
-    }
-    
-    @keyframes pulse {
-        0%, 100% { opacity: 1; }
-        50% { opacity: 0.3; }
-    }
-    
-    /* Responsive design */
-    @media (max-width: 768px) {
-        .header-title {
-            font-size: 1.5rem;
-        }
-        
-        .user-message, .bot-message {
-            max-width: 90%;
-        }
-        
-        .chat-container {
-            padding: 1rem;
-            margin-bottom: 80px;
-        }
-        
-        .input-container {
-            padding: 0.8rem;
-        }
-    }
-    </style>
-""", unsafe_allow_html=True)
+# Styles and scripts are injected once per session
+inject_static_assets()
 
-# Function to calculate matching score based on format
-def calculate_format_score(response, is_competitor_query=False):
-    if not response:
-        return 0.0
-    
-    score = 0.0
-    max_score = 100.0
-    
-    if is_competitor_query:
-        regions = [
-            "North America", "Europe", "Asia-Pacific", "Middle East", "Latin America", "Africa"
-        ]
-        
-        if re.search(r"^[^\n#]+\n", response):
-            score += 20.0
-        
-        headers_found = sum(1 for region in regions if f"## {region}" in response)
-        score += (headers_found / len(regions)) * 30.0
-        
-        bullet_pattern = r"^\s*[-*]\s+([^\(]+)\s*\(([^\)]+)\)\s*–\s*([^\n]+)$"
-        bullets = re.findall(bullet_pattern, response, re.MULTILINE)
-        if bullets:
-            score += min(len(bullets) / 5, 1.0) * 30.0
-        
-        if re.search(r"\n\n[^\n#]+$", response):
-            score += 20.0
-            
-    else:
-        paragraphs = [p.strip() for p in response.split("\n\n") if p.strip()]
-        if paragraphs:
-            score += min(len(paragraphs), 3) * 20.0
-            if len(response.split()) > 50:
-                score += 20.0
-            if not re.search(r"^[#-*]", response, re.MULTILINE):
-                score += 20.0
-                
-    return score / max_score * 100
-
-# Enhanced conversation chains with detailed prompt
+# How often a session with questions in flight repaints their progress
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.25"))
+
+# Provider SDKs, langchain chains and the semantic index are slow to import,
+# so they load on this pool while the first page paints
 @st.cache_resource
-def get_conversation_chains():
-    enhanced_prompt_template = PromptTemplate(
-        input_variables=["input", "history"],
-        template="""You are an expert AI assistant with deep knowledge across all domains. Your responses should be comprehensive, well-structured, and highly informative.
-
-**RESPONSE GUIDELINES:**
-
-**For Competitor Analysis Queries:**
-When a user asks about competitors of any company, provide an extremely detailed and comprehensive analysis following this EXACT structure:
-
-1. **Introduction (2-3 sentences):** Briefly introduce the company and the competitive landscape overview.
-
-2. **Regional Analysis:** Organize competitors by these geographical regions:
-   - **North America** (US, Canada, Mexico)
-   - **Europe** (EU countries, UK, Norway, Switzerland, etc.)
-   - **Asia-Pacific** (China, Japan, India, South Korea, Australia, Southeast Asia)
-   - **Middle East & North Africa** (UAE, Saudi Arabia, Israel, Egypt, etc.)
-   - **Latin America** (Brazil, Argentina, Chile, Colombia, etc.)
-   - **Sub-Saharan Africa** (South Africa, Nigeria, Kenya, etc.)
-   - **Russia & CIS** (Russia, Kazakhstan, Ukraine, etc.)
-
-3. **Format for each region:**
-   ```
-   ## [Region Name]
-   [2-3 sentence description of the competitive landscape in this region, market characteristics, and key trends]
-   
-   - **[Company Name] ([Country])** – [Detailed description of company focus, specialties, market position, key products/services, and competitive advantages. Include revenue size if known (small/medium/large), founding year, and any notable achievements or market share information]
-   - **[Next company]** – [Similar detailed description]
-   ```
-
-4. **For regions with no competitors:** Still include the region header and state: "No significant competitors identified in this region based on current market analysis."
-
-5. **Conclusion (2-3 sentences):** Summarize the global competitive landscape and key market dynamics.
-
-**For General Queries:**
-Provide comprehensive, well-researched responses with:
-- Clear structure with logical flow
-- Detailed explanations with context
-- Multiple perspectives when relevant
-- Practical examples and applications
-- Current industry insights when applicable
-- Professional yet conversational tone
-
-**QUALITY STANDARDS:**
-- Use specific details, numbers, and facts whenever possible
-- Include recent developments and market trends
-- Explain technical concepts clearly
-- Provide actionable insights
-- Maintain accuracy and cite general knowledge appropriately
-- Use professional language with appropriate technical terminology
-- Elaborate on subtopics and provide comprehensive coverage of all aspects
-
-**Conversation History:** {history}
-
-**User Query:** {input}
-
-**Your Response:**"""
-    )
+def get_background_loader():
+    return concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="warmup")
+
+def configured_api_keys():
+    return tuple((llm_name, os.getenv(env_var)) for llm_name, env_var in PROVIDER_KEYS.items())
+
+# Shared LLM clients, one set per API key. They hold no conversation state,
+# so every session can reuse them. Only providers with a key are imported.
+@st.cache_resource
+def get_llms_future(api_keys):
+    return get_background_loader().submit(build_llms, dict(api_keys))
+
+def get_llms():
+    llms, errors = get_llms_future(configured_api_keys()).result()
+    for llm_name, error in errors.items():
+        st.error(f"❌ {llm_name} initialization error: {error}")
+    return llms
+
+# Process-wide response cache (in-memory LRU backed by SQLite on disk)
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
+
+# Near-duplicate competitor queries ("Tesla rivals", "who competes with Tesla"),
+# warmed from the competitor queries already in the response cache
+def build_semantic_index(response_cache):
+    from semantic_cache import SEMANTIC_CACHE_MAX_ENTRIES, SemanticQueryIndex
+    
+    started = time.monotonic()
+    semantic_index = SemanticQueryIndex()
+    semantic_index.add_many(reversed(
+        response_cache.recent_queries(SEMANTIC_CACHE_MAX_ENTRIES, intent="competitor")
+    ))
+    record_startup("semantic index", time.monotonic() - started)
+    return semantic_index
+
+@st.cache_resource
+def get_semantic_index_future():
+    return get_background_loader().submit(build_semantic_index, get_response_cache())
+
+# Local intent classifier; trains on its seed examples in the background
+@st.cache_resource
+def get_query_router_future():
+    return get_background_loader().submit(build_query_router)
+
+def get_query_router():
+    return get_query_router_future().result()
+
+# Learns which provider wins each intent and decides who to call
+@st.cache_resource
+def get_fanout_policy():
+    return FanOutPolicy()
+
+# Company pages and news for competitor reports; started on first use
+@st.cache_resource
+def get_evidence_fetcher():
+    return WebEvidenceFetcher()
+
+# Precomputed reports for watched companies, refreshed off-peak on a
+# background thread with the shared LLM clients. The thread, the clients
+# and the knowledge index are only brought in once a company is watched.
+@st.cache_resource
+def get_watchlist():
+    llms_future = get_llms_future(configured_api_keys())
+    watchlist = Watchlist(llms=lambda: llms_future.result()[0], knowledge_index=get_knowledge_index)
+    for company in configured_companies():
+        watchlist.add(company)
+    return watchlist.start()
+
+# One template object per intent, shared by every session
+@st.cache_resource
+def get_intent_template(intent):
+    return get_prompt_template(intent)
+
+def get_semantic_index():
+    future = get_semantic_index_future()
+    try:
+        return future.result()
+    except Exception:
+        # Don't keep a failed build around; the next query retries it
+        get_semantic_index_future.clear()
+        raise
+
+# /metrics endpoint, started once per process when METRICS_PORT is set
+@st.cache_resource
+def get_metrics_server():
+    return start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+
+# Enhanced conversation chains with detailed prompt. Built once per session
+# (and on "Clear Chat"): each chain gets its own token-bounded memory, so
+# history never leaks between users and the prompt size stays flat.
+def build_conversation_chains(llms):
+    from langchain.chains import ConversationChain
+    from memory import TokenWindowMemory
     
-    chains = {}
+    enhanced_prompt_template = get_prompt_template()
     
+    chains = {}
+    for llm_name, llm in llms.items():
+        chains[llm_name] = ConversationChain(
+            llm=llm,
+            memory=TokenWindowMemory(return_messages=True, tokenizer_model=model_name_of(llm)),
+            verbose=False,
+            prompt=enhanced_prompt_template
+        )
+    return chains
+
+def get_conversation_chains():
     try:
-        # Initialize OpenAI if API key is available
-        openai_key = os.getenv("OPENAI_API_KEY")
-        if openai_key:
-            try:
-                openai_llm = ChatOpenAI(
-                    model_name="gpt-4o", 
-                    temperature=0.3, 
-                    openai_api_key=openai_key,
-                    max_tokens=8000
-                )
-                openai_memory = ConversationBufferMemory(return_messages=True)
-                chains["OpenAI"] = ConversationChain(
-                    llm=openai_llm,
-                    memory=openai_memory,
-                    verbose=False,
-                    prompt=enhanced_prompt_template
-                )
-                print("✅ OpenAI initialized successfully")
-            except Exception as e:
-                st.error(f"❌ OpenAI initialization error: {str(e)}")
-                print(f"❌ OpenAI error: {str(e)}")
-        
-        # Initialize Gemini if API key is available
-        google_key = os.getenv("GOOGLE_API_KEY")
-        if google_key:
-            try:
-                gemini_llm = ChatGoogleGenerativeAI(
-                    model="gemini-2.5-flash",  # FIXED: Changed from gemini-2.5-flash
-                    temperature=0.3, 
-                    google_api_key=google_key
-                )
-                gemini_memory = ConversationBufferMemory(return_messages=True)
-                chains["Gemini"] = ConversationChain(
-                    llm=gemini_llm,
-                    memory=gemini_memory,
-                    verbose=False,
-                    prompt=enhanced_prompt_template
-                )
-                print("✅ Gemini initialized successfully")
-            except Exception as e:
-                st.error(f"❌ Gemini initialization error: {str(e)}")
-                print(f"❌ Gemini error: {str(e)}")
-        
-        return chains
+        return build_conversation_chains(get_llms())
     except Exception as e:
         st.error(f"Error initializing conversation chains: {str(e)}")
         return {}
 
+# Start building a new session's chains in the background
+def start_conversation_chains():
+    llms_future = get_llms_future(configured_api_keys())
+    return get_background_loader().submit(
+        lambda: build_conversation_chains(llms_future.result()[0])
+    )
+
+# This session's chains, waiting for the background build if it's still running
+def session_chains():
+    if "conversation_chains" not in st.session_state:
+        future = st.session_state.pop("chains_future", None)
+        if future is None:
+            st.session_state.conversation_chains = get_conversation_chains()
+        else:
+            get_llms()  # surfaces provider initialization errors
+            try:
+                st.session_state.conversation_chains = future.result()
+            except Exception as e:
+                st.error(f"Error initializing conversation chains: {str(e)}")
+                st.session_state.conversation_chains = {}
+        
+        # A resumed conversation's recent turns become the chains' memory
+        for chat in st.session_state.pop("resumed_turns", []):
+            for chain in st.session_state.conversation_chains.values():
+                chain.memory.save_context({chain.input_key: chat["user"]}, {chain.output_key: chat["bot"]})
+    return st.session_state.conversation_chains
+
+# Competitors from every report so far, by target company
+@st.cache_resource
+def get_knowledge_index():
+    return KnowledgeIndex()
+
+# Durable chat history shared by every session
+@st.cache_resource
+def get_conversation_store():
+    return ConversationStore()
+
+# Resume the conversation named in the URL (?session=...), e.g. after a
+# reconnect or a redeploy; otherwise start a new one. Only the newest page
+# of turns is loaded.
+def start_conversation():
+    store = get_conversation_store()
+    session_id = st.query_params.get("session")
+    if session_id and store.has_session(session_id):
+        st.session_state.conversation_id = session_id
+        st.session_state.chat_history = store.load_turns(session_id, HISTORY_PAGE_SIZE)
+        st.session_state.resumed_turns = list(st.session_state.chat_history)
+        print(f"📂 Resumed conversation {session_id} ({store.turn_count(session_id)} turns)")
+    else:
+        st.session_state.conversation_id = new_session_id()
+        st.session_state.chat_history = []
+
+def load_earlier_turns(count):
+    chat_history = st.session_state.chat_history
+    before = chat_history[0]["seq"] if chat_history else None
+    return get_conversation_store().load_turns(st.session_state.conversation_id, count, before)
+
+# Chat turns run here, off the script thread, so a slow report never
+# freezes the session that asked for it
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
+# Route the question and queue it as a job; the session keeps the job id
+# and polls for the answer. Routing happens now so the job gets its
+# intent's priority.
+def submit_turn(user_input):
+    trace = TurnTrace(user_input)
+    chains = session_chains()
+    queue = get_job_queue()
+    pending = [queue.get(job_id) for job_id in st.session_state.pending_jobs]
+    earlier_questions = [chat["user"] for chat in st.session_state.chat_history]
+    earlier_questions += [job.label for job in pending if job is not None and not job.cancelled]
+    with trace.span("routing"):
+        intent, confidence = get_query_router().route(user_input, bool(earlier_questions))
+    trace.intent = intent
+    print(f"🔀 Routed to {intent} ({confidence:.2f})")
+    
+    turn = Turn(
+        user_input=user_input,
+        chains=chains,
+        intent=intent,
+        prompt_template=get_intent_template(intent),
+        trace=trace,
+        conversation_id=st.session_state.conversation_id,
+        fanout_policy=get_fanout_policy(),
+        response_cache=get_response_cache(),
+        semantic_index=get_semantic_index(),
+        knowledge_index=get_knowledge_index(),
+        conversation_store=get_conversation_store(),
+        earlier_questions=earlier_questions,
+        stream_responses=st.session_state.get("stream_responses", True),
+        sharded_reports=st.session_state.get("sharded_reports", SHARDED_REPORTS),
+        best_of=st.session_state.get("best_of", BEST_OF_N),
+        evidence_fetcher=get_evidence_fetcher() if st.session_state.get("web_evidence", WEB_EVIDENCE) else None,
+        watchlist=get_watchlist(),
+    )
+    job = queue.submit(
+        run_turn, turn,
+        session_id=st.session_state.conversation_id,
+        priority=TURN_PRIORITIES.get(intent, 1),
+        label=user_input
+    )
+    st.session_state.pending_jobs.append(job.id)
+
+# Move this session's finished jobs, in the order they were asked, into the
+# chat history (trimmed to the on-screen window), and their notices into
+# job_errors; returns whether any were collected
+def collect_finished_jobs():
+    queue = get_job_queue()
+    collected = False
+    while st.session_state.pending_jobs:
+        job = queue.get(st.session_state.pending_jobs[0])
+        if job is not None and not job.finished:
+            break
+        st.session_state.pending_jobs.pop(0)
+        collected = True
+        if job is None:
+            continue
+        queue.forget(job.id)
+        if job.state != CANCELLED:
+            st.session_state.job_errors.extend(job.notices)
+        if job.state == DONE and job.result is not None:
+            st.session_state.chat_history.append(job.result)
+            st.query_params["session"] = st.session_state.conversation_id
+        elif job.state == DONE:
+            st.session_state.job_errors.append(f"❌ No model answered \"{job.label}\"; please try again")
+        elif job.state == FAILED:
+            st.session_state.job_errors.append(f"❌ An error occurred: {str(job.error)}")
+        if job.args[0].trace.summary is not None:
+            st.session_state.last_trace = job.args[0].trace.summary
+    if collected:
+        window = max(HISTORY_PAGE_SIZE, st.session_state.get("history_shown", HISTORY_PAGE_SIZE))
+        del st.session_state.chat_history[:-window]
+    return collected
+
+# Questions still queued or running, with the leading partial answer and a
+# cancel button each. Reruns on its own every JOB_POLL_SECONDS and reruns
+# the whole page once an answer is ready.
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_pending_jobs():
+    if collect_finished_jobs():
+        st.rerun()
+    queue = get_job_queue()
+    jobs = [queue.get(job_id) for job_id in st.session_state.pending_jobs]
+    jobs = [job for job in jobs if job is not None and job.state != CANCELLED]
+    for index, job in enumerate(jobs):
+        progress = job.progress
+        if progress:
+            st.markdown(exchange_html(job.label, progress["llm"], progress["text"]), unsafe_allow_html=True)
+        else:
+            if job.state != QUEUED:
+                status = "🤖 AI is thinking"
+            elif index > 0:
+                status = "⏳ Waiting for the previous question"
+            else:
+                status = f"⏳ Queued, {queue.position(job)} ahead"
+            st.markdown(f'''
+                <div class="loading-indicator">
+                    <span>{html.escape(job.label)} · {status}</span>
+                    <div class="loading-dots">
+                        <div></div>
+                        <div></div>
+                        <div></div>
+                    </div>
+                </div>
+            ''', unsafe_allow_html=True)
+        for notice in list(job.notices):
+            st.error(notice)
+        st.button("✖️ Cancel", key=f"cancel_{job.id}", on_click=queue.cancel, args=(job.id,))
+
+get_metrics_server()
+
 # Compact header section
 st.markdown("""
     <div class="header-section">
@@ -561,11 +384,51 @@ with st.sidebar:
         if google_input:
             os.environ["GOOGLE_API_KEY"] = google_input
     
+    # Stream tokens from the leading provider as they are generated
+    st.toggle(
+        "⚡ Stream responses",
+        value=True,
+        key="stream_responses",
+        help="Show the answer while it is generated and stop providers that are clearly losing on format"
+    )
+    
+    # Competitor reports as parallel per-region calls
+    st.toggle(
+        "🧩 Region-sharded reports",
+        value=SHARDED_REPORTS,
+        key="sharded_reports",
+        help="Generate each region of a competitor report in parallel and assemble them; sections are cached separately"
+    )
+    
+    # Sources from the web under competitor reports
+    st.toggle(
+        "🔎 Web evidence",
+        value=WEB_EVIDENCE,
+        key="web_evidence",
+        help="Fetch company pages and news for the target and its competitors and list them under the report"
+    )
+    
+    # Competitor reports sampled several times per provider, best one kept
+    st.slider(
+        "🎲 Samples per report",
+        min_value=1,
+        max_value=5,
+        value=max(1, min(BEST_OF_N, 5)),
+        key="best_of",
+        help="Ask each provider for several competitor reports at once and keep the best-formatted one"
+    )
+    
     st.markdown("---")
     
     # Clear chat button
     if st.button("🗑️ Clear Chat", help="Start fresh", use_container_width=True):
+        get_job_queue().cancel_session(st.session_state.get("conversation_id"))
+        st.session_state.pending_jobs = []
+        get_conversation_store().delete_session(st.session_state.get("conversation_id"))
+        st.query_params.pop("session", None)
+        st.session_state.conversation_id = new_session_id()
         st.session_state.chat_history = []
+        st.session_state.pop("history_shown", None)
         if 'conversation_chains' in st.session_state:
             st.session_state.conversation_chains = get_conversation_chains()
         st.session_state.input_key = st.session_state.get('input_key', 0) + 1
@@ -573,42 +436,127 @@ with st.sidebar:
     
     # Model status
     st.markdown("### 🤖 Models")
-    openai_status = "🟢 Ready" if os.getenv("OPENAI_API_KEY") else "🔴 No Key"
-    google_status = "🟢 Ready" if os.getenv("GOOGLE_API_KEY") else "🔴 No Key"
-    st.markdown(f"**OpenAI:** {openai_status}")
-    st.markdown(f"**Gemini:** {google_status}")
+    for llm_name, env_var in PROVIDER_KEYS.items():
+        if not os.getenv(env_var):
+            st.markdown(f"**{llm_name}:** 🔴 No Key")
+            continue
+        health = get_health(llm_name).snapshot()
+        if health["state"] == OPEN:
+            status = f"🔴 Down, retrying in {get_health(llm_name).retry_in():.0f}s"
+        elif health["state"] != CLOSED:
+            status = "🟡 Probing"
+        elif health["error_rate"] > 0:
+            status = "🟡 Degraded"
+        else:
+            status = "🟢 Healthy"
+        st.markdown(f"**{llm_name}:** {status}")
+        if health["recent_calls"]:
+            latency = f"{health['latency_p50']:.1f}s" if health["latency_p50"] is not None else "–"
+            st.caption(
+                f"{health['error_rate']:.0%} errors in last {health['recent_calls']} · "
+                f"p50 {latency} · {health['timeouts']} timeouts"
+            )
+    
+    # Response cache effectiveness
+    cache_stats = get_response_cache().stats()
+    # The semantic index may still be loading; don't wait for it here
+    semantic_future = get_semantic_index_future()
+    semantic_hits = 0
+    if semantic_future.done() and not semantic_future.exception():
+        semantic_hits = semantic_future.result().stats()["hits"]
+    st.markdown("### 💾 Cache")
+    st.caption(
+        f"{cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+        f"{cache_stats['bytes_saved'] / 1024:.0f} KB saved · "
+        f"{semantic_hits} near-duplicate hits"
+    )
+    knowledge_index = get_knowledge_index()
+    st.caption(f"📚 {len(knowledge_index)} competitors indexed · {knowledge_index.hits} answers without a model")
+    if st.session_state.get("web_evidence", WEB_EVIDENCE):
+        evidence_stats = get_evidence_fetcher().stats
+        st.caption(
+            f"🔎 {evidence_stats['fresh'] + evidence_stats['revalidated']} pages from cache · "
+            f"{evidence_stats['fetched']} fetched ({evidence_stats['rendered']} rendered) · "
+            f"{evidence_stats['errors']} failed"
+        )
+    
+    watchlist_stats = get_watchlist().stats()
+    if watchlist_stats["watched"]:
+        refreshing = f" · refreshing {watchlist_stats['refreshing']}" if watchlist_stats["refreshing"] else ""
+        st.caption(
+            f"👀 {watchlist_stats['fresh']}/{watchlist_stats['watched']} watched reports fresh · "
+            f"{watchlist_stats['hits']} served · "
+            f"{watchlist_stats['tokens_today']}/{watchlist_stats['daily_tokens']} tokens today{refreshing}"
+        )
+    
+    # Turns waiting for or running on the shared job workers
+    job_stats = get_job_queue().stats()
+    st.markdown("### 📬 Queue")
+    st.caption(
+        f"{job_stats['queued']} queued · {job_stats['running']}/{job_stats['workers']} running · "
+        f"wait p50 {job_stats['wait_p50'] or 0:.2f}s · p95 {job_stats['wait_p95'] or 0:.2f}s · "
+        f"oldest {job_stats['oldest_wait']:.1f}s"
+    )
+    
+    # Where the last turn's time went, plus per-provider latency percentiles
+    with st.expander("🩺 Diagnostics"):
+        last_trace = st.session_state.get("last_trace")
+        if last_trace:
+            st.caption(
+                f"Last turn: {last_trace['total']:.2f}s · {last_trace['intent']} · "
+                f"fan-out {last_trace['fanout'] or '—'} · "
+                f"selected {last_trace['selected'] or '—'}"
+            )
+            for c in last_trace["calls"]:
+                st.caption(
+                    f"**{call_label(c)}** {c['outcome']} · queue {c['queue_wait'] or 0:.2f}s · "
+                    f"ttft {c['ttft'] or 0:.2f}s · total {c['total']:.2f}s · "
+                    f"{c['history_tokens']} history / {c['prompt_tokens']} prompt / "
+                    f"{c['completion_tokens']} completion tokens"
+                )
+            if last_trace["cached"]:
+                st.caption(f"Served from cache: {', '.join(last_trace['cached'])}")
+            st.caption(" · ".join(f"{span['name']} {span['duration'] * 1000:.0f} ms" for span in last_trace["spans"]))
+        else:
+            st.caption("No turns yet.")
+        if STARTUP_TIMES:
+            st.caption("**Startup:** " + " · ".join(
+                f"{component} {seconds:.2f}s" for component, seconds in STARTUP_TIMES.items()
+            ))
+        if st.button("📦 Profile cold imports", help="Run -X importtime on the lazily loaded modules"):
+            for module, _, cumulative in import_time_report(HEAVY_MODULES, top=10):
+                st.caption(f"`{module}` {cumulative * 1000:.0f} ms")
+        for llm_name, row in get_metrics().provider_summary().items():
+            if "llm_total_seconds_p50" in row:
+                st.caption(
+                    f"**{llm_name}:** p50 {row['llm_total_seconds_p50']:.2f}s · p95 {row['llm_total_seconds_p95']:.2f}s"
+                    f" · ttft p50 {row.get('llm_ttft_seconds_p50') or 0:.2f}s · {row.get('ok', 0)} ok"
+                    f" · {row.get('error', 0) + row.get('timeout', 0)} failed"
+                )
 
 with col1:
     # Initialize session state
-    if "conversation_chains" not in st.session_state:
-        st.session_state.conversation_chains = get_conversation_chains()
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+    if "conversation_chains" not in st.session_state and "chains_future" not in st.session_state:
+        st.session_state.chains_future = start_conversation_chains()
+        get_query_router_future()
+    if "conversation_id" not in st.session_state:
+        start_conversation()
     if "input_key" not in st.session_state:
         st.session_state.input_key = 0
-    if "is_processing" not in st.session_state:
-        st.session_state.is_processing = False
+    if "pending_jobs" not in st.session_state:
+        st.session_state.pending_jobs = []
+        st.session_state.job_errors = []
+    collect_finished_jobs()
 
     # Chat history display
+    render_started = time.monotonic()
     if st.session_state.chat_history:
         st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-        for chat in st.session_state.chat_history:
-            # User message
-            st.markdown(f'''
-                <div class="message user-message">
-                    <strong>You</strong><br>
-                    {chat["user"]}
-                </div>
-            ''', unsafe_allow_html=True)
-            
-            # Bot message with model indicator
-            model_indicator = f'<span class="status-indicator status-{chat["llm"].lower()}">{chat["llm"]}</span>'
-            st.markdown(f'''
-                <div class="message bot-message">
-                    <strong>AI Assistant {model_indicator}</strong><br>
-                    {chat["bot"]}
-                </div>
-            ''', unsafe_allow_html=True)
+        render_history(
+            st.session_state.chat_history,
+            get_conversation_store().turn_count(st.session_state.conversation_id),
+            load_earlier_turns
+        )
         st.markdown('</div>', unsafe_allow_html=True)
     else:
         # Welcome message
@@ -623,18 +571,15 @@ with col1:
             </div>
         ''', unsafe_allow_html=True)
 
-    # Processing indicator
-    if st.session_state.is_processing:
-        st.markdown('''
-            <div class="loading-indicator">
-                <span>🤖 AI is thinking</span>
-                <div class="loading-dots">
-                    <div></div>
-                    <div></div>
-                    <div></div>
-                </div>
-            </div>
-        ''', unsafe_allow_html=True)
+    get_metrics().observe("chat_render_seconds", time.monotonic() - render_started)
+    get_metrics().inc("script_runs_total")
+
+    # Questions in flight, then anything that failed since the last run
+    if st.session_state.pending_jobs:
+        render_pending_jobs()
+    for error in st.session_state.job_errors:
+        st.error(error)
+    st.session_state.job_errors = []
 
 # Fixed input container at bottom
 st.markdown('<div class="input-container">', unsafe_allow_html=True)
@@ -645,104 +590,30 @@ user_input = st.text_input(
     "Message",
     key=f"input_{st.session_state.input_key}",
     label_visibility="collapsed",
-    placeholder="Ask about competitors, market analysis, or anything else...",
-    disabled=st.session_state.is_processing
+    placeholder="Ask about competitors, market analysis, or anything else..."
 )
 
 st.markdown('</div>', unsafe_allow_html=True)
 st.markdown('</div>', unsafe_allow_html=True)
 
-# Handle input processing
-if user_input and user_input.strip() and not st.session_state.is_processing:
+# Time to the first usable page in this session; the first session of a
+# fresh process is the cold start
+if "first_paint" not in st.session_state:
+    st.session_state.first_paint = time.monotonic() - script_started
+    record_startup("first paint", st.session_state.first_paint)
+
+# Queue the question; the answer arrives through render_pending_jobs, and
+# the input stays free for the next question meanwhile
+if user_input and user_input.strip():
     # Check if API keys are available
     if not os.getenv("OPENAI_API_KEY") and not os.getenv("GOOGLE_API_KEY"):
         st.error("⚠️ Please provide at least one API key to continue.")
     else:
-        st.session_state.is_processing = True
-        
         try:
-            # Check if the query is about competitors
-            is_competitor_query = any(keyword in user_input.lower() for keyword in [
-                "competitor", "competition", "rival", "versus", "vs", "compare", "competing"
-            ])
-            
-            # Get responses from available LLMs
-            responses = {}
-            
-            for llm_name, chain in st.session_state.conversation_chains.items():
-                try:
-                    if ((llm_name == "OpenAI" and os.getenv("OPENAI_API_KEY")) or 
-                        (llm_name == "Gemini" and os.getenv("GOOGLE_API_KEY"))):
-                        response = chain.predict(input=user_input)
-                        responses[llm_name] = response
-                        print(f"✅ Got response from {llm_name}")
-                except Exception as e:
-                    st.error(f"Error with {llm_name}: {str(e)}")
-                    print(f"❌ Error with {llm_name}: {str(e)}")
-            
-            if responses:
-                # Calculate format matching scores
-                scores = {}
-                for llm_name, response in responses.items():
-                    score = calculate_format_score(response, is_competitor_query)
-                    scores[llm_name] = score
-                    print(f"Score for {llm_name}: {score}")
-                
-                # Select the response with the highest score
-                best_llm = max(scores, key=scores.get)
-                best_response = responses[best_llm]
-                
-                # Append to chat history
-                st.session_state.chat_history.append({
-                    "user": user_input,
-                    "bot": best_response,
-                    "llm": best_llm
-                })
-                
-                # Clear input by updating key
-                st.session_state.input_key += 1
-        
+            submit_turn(user_input)
         except Exception as e:
-            st.error(f"❌ An error occurred: {str(e)}")
+            st.session_state.job_errors.append(f"❌ An error occurred: {str(e)}")
             print(f"❌ General error: {str(e)}")
-        
-        finally:
-            st.session_state.is_processing = False
-            st.rerun()
-
-# JavaScript for Enter key and auto-scroll
-st.markdown("""
-    <script>
-    function handleEnterKey() {
-        document.addEventListener('keydown', function(e) {
-            if (e.key === 'Enter' && e.target.tagName === 'INPUT' && e.target.type === 'text') {
-                e.preventDefault();
-                // Trigger Streamlit to process the input
-                e.target.blur();
-                e.target.focus();
-            }
-        });
-    }
-    
-    function scrollToBottom() {
-        setTimeout(function() {
-            const chatContainer = document.querySelector('.chat-container');
-            if (chatContainer) {
-                chatContainer.scrollTop = chatContainer.scrollHeight;
-            }
-        }, 100);
-    }
-    
-    // Initialize
-    document.addEventListener('DOMContentLoaded', function() {
-        handleEnterKey();
-        scrollToBottom();
-    });
-    
-    // Handle Streamlit updates
-    window.addEventListener('load', function() {
-        handleEnterKey();
-        scrollToBottom();
-    });
-    </script>
-""", unsafe_allow_html=True)
+        # Clear input by updating key
+        st.session_state.input_key += 1
+        st.rerun()
@@ -0,0 +1,326 @@
+"""Headless competitor analysis for a list of companies.
+
+    python batch.py companies.csv -o reports.jsonl --concurrency 8
+
+Reads company names from a CSV (a "company" column, else the first column),
+a JSONL file ({"company": ...}) or a plain text file (one per line). Every
+company goes to all configured providers with the same prompt as the chat
+app and the best-formatted answer is appended to the output JSONL as soon as
+it finishes. Re-running with the same output file skips companies that
+already have a result, and individual provider answers are served from the
+response cache, so a crash never pays twice for finished work.
+
+With --sharded every report is generated as parallel per-region sections
+(see sharded_report.py); --refresh-region Europe regenerates just that
+section of already cached reports. A refresh reruns every company, finished
+ones included, and rewrites the output with one line per company. Its
+progress is kept in <output>.refresh until every company is refreshed, so
+rerunning an interrupted refresh of the same sections resumes it.
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import time
+from dataclasses import asdict
+
+from dotenv import load_dotenv
+
+from fanout import fan_out
+from prompts import get_prompt_template
+from providers import PROVIDER_KEYS, build_llm, configured_providers
+from rate_limit import get_limiter
+from response_cache import ResponseCache, cache_key, model_name_of, template_hash
+from scoring import select_best_response
+from sharded_report import SECTIONS, assemble_report, generate_sharded
+from telemetry import TurnTrace, start_metrics_server
+
+DEFAULT_QUESTION = "What are the competitors of {company}?"
+
+
+# Same prompt as the chat app, but stateless: every company starts with an
+# empty history. fan_out calls the llm under the provider's rate limiter.
+class BatchChain:
+    memory = None
+
+    def __init__(self, llm_name, llm, prompt):
+        self.llm_name = llm_name
+        self.llm = llm
+        self.prompt = prompt
+        self.prompt_hash = template_hash(prompt.template)
+
+    def cache_key(self, query):
+        return cache_key(query, self.llm_name, model_name_of(self.llm), self.prompt_hash)
+
+
+def read_companies(path):
+    companies = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    companies.append(json.loads(line)["company"])
+        elif path.endswith(".csv"):
+            rows = list(csv.reader(f))
+            if rows:
+                header = [cell.strip().lower() for cell in rows[0]]
+                column = header.index("company") if "company" in header else 0
+                body = rows[1:] if "company" in header else rows
+                companies.extend(row[column] for row in body if row and row[column].strip())
+        else:
+            companies.extend(line.strip() for line in f if line.strip())
+
+    # Keep the first occurrence of each company
+    seen = set()
+    return [c.strip() for c in companies if not (c.strip() in seen or seen.add(c.strip()))]
+
+
+# Companies that already have a successful result in the output file. A
+# half-written last line from a crash is ignored and that company reruns.
+def completed_companies(path):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "response" in record:
+                done.add(record["company"])
+    return done
+
+
+# Rewrite the output with one line per company, in the order they first
+# appear: its latest complete record, else its latest one with a report,
+# else its latest one. A refresh appends new records for companies already
+# in the file; this drops the lines they replace, and keeps the old report
+# where a refresh failed or came back with sections missing.
+def compact_output(path):
+    def rank(record):
+        return ("response" in record) + ("response" in record and "errors" not in record)
+
+    latest = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            company = record["company"]
+            if company not in latest or rank(record) >= rank(latest[company]):
+                latest[company] = record
+    with open(path + ".tmp", "w", encoding="utf-8") as out:
+        for record in latest.values():
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(path + ".tmp", path)
+
+
+# Companies a --refresh-region run has already redone, kept in a file next
+# to the output until every company is refreshed, so a restarted refresh
+# resumes instead of paying for those sections again. The file's first line
+# names the refreshed sections; progress of a refresh of other sections is
+# started over.
+def refresh_progress_path(path):
+    return path + ".refresh"
+
+
+def refresh_progress(path, refresh):
+    progress_path = refresh_progress_path(path)
+    header = json.dumps(sorted(refresh))
+    done = set()
+    if os.path.exists(progress_path):
+        with open(progress_path, encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        if lines[0] == header:
+            for line in lines[1:]:
+                try:
+                    done.add(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+            return done
+    with open(progress_path, "w", encoding="utf-8") as f:
+        f.write(header + "\n")
+    return done
+
+
+def analyze_company(company, chains, question, response_cache=None, sharded=False, refresh=()):
+    started = time.monotonic()
+    query = question.format(company=company)
+    trace = TurnTrace(query, intent="competitor")
+    responses = {}
+    errors = {}
+
+    # Providers that already answered (e.g. before a crash) are not called
+    # again, unless sections are being refreshed
+    pending = dict(chains)
+    if response_cache is not None and not refresh:
+        for llm_name, chain in chains.items():
+            cached = response_cache.get(chain.cache_key(query))
+            if cached is not None:
+                responses[llm_name] = cached
+                del pending[llm_name]
+
+    # Sharded reports missing a failed section; their sections are cached on
+    # their own, so the whole report isn't
+    partial = set()
+    if sharded:
+        sections = {llm_name: {} for llm_name in pending}
+        failed_sections = {llm_name: {} for llm_name in pending}
+        llms = {llm_name: chain.llm for llm_name, chain in pending.items()}
+        for llm_name, section, text, error in generate_sharded(llms, query, response_cache, trace, refresh):
+            if error is not None:
+                failed_sections[llm_name][section] = str(error)
+            else:
+                sections[llm_name][section] = text
+
+        # A report is assembled from whatever sections finished, failed
+        # regions marked as missing; only a provider with none fails
+        results = []
+        for llm_name in pending:
+            failed = "; ".join(f"{section}: {error}" for section, error in failed_sections[llm_name].items())
+            if not sections[llm_name]:
+                results.append((llm_name, None, failed))
+                continue
+            if failed:
+                partial.add(llm_name)
+                errors[llm_name] = failed
+            results.append((llm_name, assemble_report(sections[llm_name], failed_sections[llm_name]), None))
+    else:
+        results = fan_out(pending, query, trace=trace)
+
+    for llm_name, response, error in results:
+        if error is not None:
+            errors[llm_name] = str(error)
+            continue
+        responses[llm_name] = response
+        if response_cache is not None and llm_name not in partial:
+            response_cache.put(
+                chains[llm_name].cache_key(query), response, provider=llm_name,
+                model=model_name_of(chains[llm_name].llm), query=query, intent="competitor"
+            )
+
+    record = {"company": company, "query": query}
+    best_llm = None
+    if responses:
+        with trace.span("selection"):
+            best_llm, scores, reports = select_best_response(responses, is_competitor_query=True)
+        record.update({"llm": best_llm, "score": scores[best_llm], "scores": scores,
+                       "response": responses[best_llm],
+                       "competitors": [asdict(c) for c in reports[best_llm].competitors]})
+    if errors:
+        record["errors"] = errors
+    summary = trace.finish(selected=best_llm, cached=[n for n in responses if n not in pending])
+    record["tokens"] = sum(call["prompt_tokens"] + call["completion_tokens"] for call in summary["calls"])
+    record["elapsed"] = round(time.monotonic() - started, 2)
+    record["finished_at"] = time.time()
+    return record
+
+
+def run_batch(companies, output_path, chains, question=DEFAULT_QUESTION, concurrency=4,
+              response_cache=None, sharded=False, refresh=()):
+    # A refresh regenerates sections of finished reports, so only companies
+    # this refresh already redid are skipped
+    done = refresh_progress(output_path, refresh) if refresh else completed_companies(output_path)
+    todo = [c for c in companies if c not in done]
+    if refresh:
+        print(f"📋 {len(companies)} companies, refreshing {', '.join(refresh)}, "
+              f"{len(done & set(companies))} already refreshed, {len(todo)} to run")
+    else:
+        print(f"📋 {len(companies)} companies, {len(done & set(companies))} already done, {len(todo)} to run")
+
+    succeeded = failed = unfinished = 0
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    try:
+        futures = {
+            executor.submit(analyze_company, c, chains, question, response_cache, sharded, refresh): c
+            for c in todo
+        }
+        with open(output_path, "a", encoding="utf-8") as out:
+            for i, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                company = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = {"company": company, "errors": {"batch": str(e)}, "finished_at": time.time()}
+
+                # One flushed line per company is the checkpoint
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+
+                # A company counts as refreshed once every section came back
+                if refresh and "response" in record and "errors" not in record:
+                    with open(refresh_progress_path(output_path), "a", encoding="utf-8") as progress:
+                        progress.write(json.dumps(company, ensure_ascii=False) + "\n")
+                elif refresh:
+                    unfinished += 1
+                if "response" in record:
+                    succeeded += 1
+                    print(f"✅ [{i}/{len(todo)}] {company} → {record['llm']} ({record['score']:.1f}, {record['elapsed']}s)")
+                else:
+                    failed += 1
+                    print(f"❌ [{i}/{len(todo)}] {company}: {record.get('errors')}")
+    except KeyboardInterrupt:
+        print("⏹️ Interrupted; finished companies are saved, rerun to resume")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+    if refresh:
+        compact_output(output_path)
+        if not unfinished:
+            os.remove(refresh_progress_path(output_path))
+    return succeeded, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run competitor analysis for a list of companies.")
+    parser.add_argument("input", help="CSV, JSONL or text file of company names")
+    parser.add_argument("-o", "--output", default="reports.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=4, help="companies in flight at once")
+    parser.add_argument("--per-provider", type=int, default=4, help="max concurrent calls per provider")
+    parser.add_argument("--providers", help="comma-separated subset of providers, e.g. OpenAI,Gemini")
+    parser.add_argument("--question", default=DEFAULT_QUESTION, help="query template with a {company} placeholder")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the response cache")
+    parser.add_argument("--sharded", action="store_true", help="generate each report as parallel per-region sections")
+    parser.add_argument("--refresh-region", action="append", choices=SECTIONS, default=[], metavar="SECTION",
+                        help="with --sharded, regenerate this section even if cached (repeatable)")
+    parser.add_argument("--metrics-port", type=int, help="serve /metrics and /metrics.json while running")
+    args = parser.parse_args(argv)
+
+    if args.refresh_region and not args.sharded:
+        parser.error("--refresh-region needs --sharded")
+
+    load_dotenv()
+    providers = args.providers.split(",") if args.providers else configured_providers()
+    missing = [p for p in providers if p not in PROVIDER_KEYS or not os.getenv(PROVIDER_KEYS[p])]
+    if missing or not providers:
+        print(f"⚠️ No API key for: {', '.join(missing) or 'any provider'}")
+        return 2
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    response_cache = None if args.no_cache else ResponseCache()
+    prompt = get_prompt_template("competitor")
+    chains = {}
+    for llm_name in providers:
+        chains[llm_name] = BatchChain(llm_name, build_llm(llm_name, os.getenv(PROVIDER_KEYS[llm_name])), prompt)
+        get_limiter(llm_name).set_max_concurrency(args.per_provider)
+
+    companies = read_companies(args.input)
+    succeeded, failed = run_batch(
+        companies, args.output, chains, args.question, args.concurrency, response_cache,
+        args.sharded, args.refresh_region
+    )
+    print(f"🏁 {succeeded} succeeded, {failed} failed → {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""Offline micro-benchmarks for our own per-turn code path.
+
+    python benchmarks/bench_pipeline.py                  # run and compare to baseline
+    python benchmarks/bench_pipeline.py --save-baseline  # record a new baseline (several runs)
+    python benchmarks/bench_pipeline.py --check          # exit 1 on regressions
+
+Provider latency is excluded: a deterministic fake LLM replays generated
+reports, so every number here is time spent in this repository's code.
+Needs no network and no API keys.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from langchain.chains import ConversationChain  # noqa: E402
+from langchain_core.language_models.fake_chat_models import FakeListChatModel  # noqa: E402
+
+from chat_render import HISTORY_PAGE_SIZE, bot_message_html, turn_html, user_message_html  # noqa: E402
+from fanout import fan_out  # noqa: E402
+from memory import TokenWindowMemory  # noqa: E402
+from prompts import get_prompt_template  # noqa: E402
+from report_parser import REGIONS  # noqa: E402
+from scoring import calculate_format_score, select_best_response  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+CORPUS_SIZES = {"1kb": 1024, "10kb": 10 * 1024, "100kb": 100 * 1024}
+# A benchmark whose p50 grows by more than this fraction, or by more than
+# NOISE_MULTIPLIER times the spread it showed across the baseline's runs if
+# that is larger, is a regression. Growth under MIN_REGRESSION_US never is:
+# at that scale it's timer and scheduler noise.
+REGRESSION_THRESHOLD = 0.25
+NOISE_MULTIPLIER = 2.0
+MIN_REGRESSION_US = 20.0
+# Separate processes --save-baseline runs the suite in; the baseline keeps
+# each benchmark's median p50 and its spread
+BASELINE_RUNS = 5
+
+WORDS = (
+    "market share revenue growth platform enterprise customers pricing strategy "
+    "regional presence manufacturing supply chain innovation portfolio partnerships "
+    "battery software services logistics retail digital cloud analytics brand"
+).split()
+COUNTRIES = ["USA", "Canada", "Germany", "France", "UK", "China", "Japan", "India",
+             "UAE", "Israel", "Brazil", "Chile", "South Africa", "Nigeria", "Russia"]
+
+
+def sentence(rng, words=14):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+# Deterministic competitor report in the prompt's format, about size bytes
+def make_report(size, seed=0):
+    rng = random.Random(seed)
+    parts = [f"{sentence(rng)} {sentence(rng)}", ""]
+    region = 0
+    while len("\n".join(parts)) < size:
+        name, _ = REGIONS[region % len(REGIONS)]
+        parts += [f"## {name}", sentence(rng, 30), ""]
+        for i in range(rng.randint(3, 8)):
+            parts.append(f"- **Company{region}x{i} ({rng.choice(COUNTRIES)})** – {sentence(rng, 40)}")
+        parts.append("")
+        region += 1
+    parts.append(f"{sentence(rng)} {sentence(rng)}")
+    return "\n".join(parts)[:size]
+
+
+# Deterministic plain-prose answer, about size bytes
+def make_answer(size, seed=0):
+    rng = random.Random(seed)
+    paragraphs = []
+    while len("\n\n".join(paragraphs)) < size:
+        paragraphs.append(" ".join(sentence(rng) for _ in range(5)))
+    return "\n\n".join(paragraphs)[:size]
+
+
+def measure(fn, repeat, warmup=3):
+    for _ in range(warmup):
+        fn()
+
+    gc.collect()
+    gc.disable()
+    samples = []
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            fn()
+            samples.append(time.perf_counter_ns() - started)
+    finally:
+        gc.enable()
+    samples.sort()
+
+    # Allocations are measured in a separate call so tracing doesn't skew timing
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))] / 1000
+
+    return {
+        "p50_us": round(percentile(50), 2),
+        "p95_us": round(percentile(95), 2),
+        "p99_us": round(percentile(99), 2),
+        "peak_kib": round(peak / 1024, 1),
+        "live_blocks": blocks,
+        "runs": repeat,
+    }
+
+
+def build_benchmarks(quick=False):
+    repeat = 20 if quick else 200
+    prompt = get_prompt_template()
+    benchmarks = {}
+
+    # Prompt rendering with an empty and a full {history}
+    memory = TokenWindowMemory(return_messages=True)
+    for turn in range(20):
+        memory.save_context({"input": f"Question {turn}?"}, {"response": make_report(4096, turn)})
+    history = memory.load_memory_variables({})["history"]
+    benchmarks["prompt_render/empty_history"] = (
+        lambda: prompt.format(input="Tesla competitors", history=""), repeat)
+    benchmarks["prompt_render/full_history"] = (
+        lambda: prompt.format(input="Tesla competitors", history=history), repeat)
+
+    # Memory: save one 8 KB turn (with pruning) and load the history
+    report_8k = make_report(8 * 1024, 99)
+
+    def memory_turn():
+        memory.save_context({"input": "Tesla competitors"}, {"response": report_8k})
+        memory.load_memory_variables({})
+    benchmarks["memory/save_and_load_8kb_turn"] = (memory_turn, repeat)
+
+    # Format scoring on 1 KB - 100 KB responses
+    for label, size in CORPUS_SIZES.items():
+        report, answer = make_report(size, 1), make_answer(size, 2)
+        runs = max(10, repeat // (size // 1024))
+        benchmarks[f"score/competitor_{label}"] = (
+            lambda report=report: calculate_format_score(report, True), runs)
+        benchmarks[f"score/general_{label}"] = (
+            lambda answer=answer: calculate_format_score(answer, False), runs)
+
+    # Best-response selection between two 10 KB candidates
+    candidates = {"OpenAI": make_report(10 * 1024, 3), "Gemini": make_answer(10 * 1024, 4)}
+    benchmarks["select/best_of_2_10kb"] = (lambda: select_best_response(candidates, True), repeat)
+
+    # Chat history HTML for a 20-turn session of 8 KB answers
+    chat_history = [
+        {"user": f"Question {turn}?", "bot": make_report(8 * 1024, turn), "llm": "OpenAI"}
+        for turn in range(20)
+    ]
+
+    def render_history():
+        return "".join(
+            user_message_html(chat["user"]) + bot_message_html(chat["llm"], chat["bot"])
+            for chat in chat_history
+        )
+    benchmarks["render/history_20_turns"] = (render_history, repeat)
+
+    # What a rerun builds now: the latest page, from markup cached per turn
+    def render_history_page():
+        return [turn_html(chat) for chat in chat_history[-HISTORY_PAGE_SIZE:]]
+    benchmarks["render/history_page_cached"] = (render_history_page, repeat)
+
+    # One whole turn through two fake providers: fan-out, rate limiter,
+    # ConversationChain, memory and selection
+    replies = [make_report(8 * 1024, 5)] * 10000
+    chains = {
+        llm_name: ConversationChain(
+            llm=FakeListChatModel(responses=replies),
+            memory=TokenWindowMemory(return_messages=True),
+            prompt=prompt
+        )
+        for llm_name in ("OpenAI", "Gemini")
+    }
+
+    def full_turn():
+        responses = {name: response for name, response, error in fan_out(chains, "Tesla competitors")}
+        return select_best_response(responses, True)
+    benchmarks["turn/fake_providers_8kb"] = (full_turn, max(10, repeat // 4))
+    return benchmarks
+
+
+def regression_threshold(before):
+    return max(REGRESSION_THRESHOLD, NOISE_MULTIPLIER * before.get("noise", 0.0))
+
+
+def compare(results, baseline):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        change = result["p50_us"] / before["p50_us"] - 1 if before["p50_us"] else 0.0
+        result["p50_change"] = round(change, 3)
+        if change > regression_threshold(before) and result["p50_us"] - before["p50_us"] >= MIN_REGRESSION_US:
+            regressions.append(name)
+    return regressions
+
+
+# Run the suite in BASELINE_RUNS fresh processes (a process's memory layout
+# alone moves some timings by a third) and merge them: the run with each
+# benchmark's median p50, plus "noise", the spread of its p50s
+def record_baseline(args):
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for run in range(BASELINE_RUNS):
+            path = os.path.join(workdir, f"run{run}.json")
+            command = [sys.executable, os.path.abspath(__file__), "--json", path, "--filter", args.filter]
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            with open(path, encoding="utf-8") as f:
+                runs.append(json.load(f)["results"])
+            print(f"⏱️ Baseline run {run + 1}/{BASELINE_RUNS} done")
+
+    results = {}
+    for name in runs[0]:
+        ordered = sorted((run[name] for run in runs), key=lambda result: result["p50_us"])
+        p50s = [result["p50_us"] for result in ordered]
+        results[name] = dict(ordered[len(ordered) // 2])
+        results[name].pop("p50_change", None)
+        results[name]["noise"] = round(max(p50s) / statistics.median(p50s) - 1, 3)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the response-selection pipeline.")
+    parser.add_argument("--save-baseline", action="store_true", help=f"write results to {BASELINE_PATH}")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if any benchmark regressed")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations (smoke run)")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    if args.save_baseline:
+        results = record_baseline(args)
+    else:
+        results = {}
+        for name, (fn, repeat) in build_benchmarks(args.quick).items():
+            if args.filter in name:
+                results[name] = measure(fn, repeat)
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH) and not args.save_baseline:
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline)
+
+    print(f"{'benchmark':<34}{'p50 µs':>11}{'p95 µs':>11}{'p99 µs':>11}{'peak KiB':>10}{'vs base':>9}")
+    for name, result in results.items():
+        change = result.get("p50_change")
+        marker = " ⚠️" if name in regressions else ""
+        print(f"{name:<34}{result['p50_us']:>11.1f}{result['p95_us']:>11.1f}{result['p99_us']:>11.1f}"
+              f"{result['peak_kib']:>10.1f}{'' if change is None else f'{change:+.0%}':>9}{marker}")
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"💾 Baseline saved to {BASELINE_PATH}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if regressions:
+        print(f"⚠️ {len(regressions)} regression(s) over {REGRESSION_THRESHOLD:.0%} (or the benchmark's noise): "
+              f"{', '.join(regressions)}")
+        return 1 if args.check else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
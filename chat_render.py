@@ -0,0 +1,465 @@
+import json
+import os
+import textwrap
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+# Older turns beyond this many are collapsed behind a "show earlier" button,
+# so a rerun renders the same amount of history however long the chat gets
+HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "10"))
+
+# Enhanced Custom CSS with modern design
+APP_CSS = """
+    /* Import Google Fonts */
+    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
+    
+    /* Modern dark theme variables */
+    :root {
+        --primary-gradient: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        --secondary-gradient: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
+        --bg-primary: #0a0e1a;
+        --bg-secondary: #1a1f2e;
+        --bg-tertiary: #252b3b;
+        --text-primary: #ffffff;
+        --text-secondary: #b4bcd0;
+        --text-muted: #6b7280;
+        --accent-blue: #3b82f6;
+        --accent-purple: #8b5cf6;
+        --accent-green: #10b981;
+        --border-color: #374151;
+        --shadow-light: 0 4px 6px -1px rgba(0, 0, 0, 0.1);
+        --shadow-medium: 0 10px 15px -3px rgba(0, 0, 0, 0.1);
+        --shadow-heavy: 0 25px 50px -12px rgba(0, 0, 0, 0.25);
+    }
+    
+    /* Base styles */
+    html, body {
+        font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
+        background: var(--bg-primary);
+        color: var(--text-primary);
+    }
+    
+    /* Main app container */
+    .stApp {
+        background: var(--bg-primary);
+        color: var(--text-primary);
+    }
+    
+    /* Header section - compact */
+    .header-section {
+        background: var(--primary-gradient);
+        padding: 1rem;
+        margin: -1rem -1rem 1rem -1rem;
+        border-radius: 0 0 16px 16px;
+        text-align: center;
+        position: relative;
+    }
+    
+    .header-title {
+        font-size: 1.8rem;
+        font-weight: 700;
+        color: white;
+        margin: 0;
+        text-shadow: 0 2px 4px rgba(0,0,0,0.2);
+    }
+    
+    /* Chat container */
+    .chat-container {
+        background: rgba(26, 31, 46, 0.8);
+        backdrop-filter: blur(20px);
+        border: 1px solid rgba(255, 255, 255, 0.1);
+        border-radius: 16px;
+        padding: 1.5rem;
+        margin-bottom: 100px;
+        max-height: calc(100vh - 220px);
+        overflow-y: auto;
+        box-shadow: var(--shadow-medium);
+    }
+    
+    /* Message bubbles */
+    .message {
+        padding: 0.8rem 1rem;
+        border-radius: 16px;
+        margin-bottom: 0.8rem;
+        font-size: 0.9rem;
+        line-height: 1.5;
+        box-shadow: var(--shadow-light);
+        max-width: fit-content;
+        animation: messageSlideIn 0.3s ease-out;
+    }
+    
+    .user-message {
+        background: var(--primary-gradient);
+        color: white;
+        margin-left: auto;
+        max-width: 75%;
+    }
+    
+    .bot-message {
+        background: rgba(37, 43, 59, 0.9);
+        color: var(--text-primary);
+        margin-right: auto;
+        max-width: 85%;
+        border: 1px solid rgba(255, 255, 255, 0.1);
+    }
+    
+    /* Message labels */
+    .message strong {
+        font-weight: 600;
+        font-size: 0.8rem;
+        text-transform: uppercase;
+        letter-spacing: 0.5px;
+        opacity: 0.8;
+    }
+    
+    /* Fixed input container at bottom */
+    .input-container {
+        position: fixed;
+        bottom: 0;
+        left: 0;
+        right: 0;
+        background: rgba(26, 31, 46, 0.95);
+        backdrop-filter: blur(20px);
+        border-top: 1px solid rgba(255, 255, 255, 0.1);
+        padding: 1rem;
+        z-index: 1000;
+    }
+    
+    /* Input wrapper with send button inside */
+    .input-wrapper {
+        max-width: 1200px;
+        margin: 0 auto;
+        position: relative;
+        display: flex;
+        align-items: center;
+    }
+    
+    /* Enhanced input field */
+    .stTextInput > div > div > input {
+        background: rgba(37, 43, 59, 0.9) !important;
+        border: 2px solid rgba(255, 255, 255, 0.1) !important;
+        border-radius: 25px !important;
+        color: var(--text-primary) !important;
+        padding: 0.8rem 3rem 0.8rem 1.2rem !important;
+        font-size: 0.95rem !important;
+        transition: all 0.3s ease !important;
+        font-family: 'Inter', sans-serif !important;
+        width: 100% !important;
+    }
+    
+    .stTextInput > div > div > input:focus {
+        outline: none !important;
+        border-color: var(--accent-blue) !important;
+        box-shadow: 0 0 0 3px rgba(59, 130, 246, 0.2) !important;
+    }
+    
+    .stTextInput > div > div > input::placeholder {
+        color: var(--text-muted) !important;
+    }
+    
+    /* Send button inside input */
+    .send-button {
+        position: absolute;
+        right: 8px;
+        top: 50%;
+        transform: translateY(-50%);
+        background: var(--primary-gradient);
+        border: none;
+        border-radius: 50%;
+        width: 36px;
+        height: 36px;
+        display: flex;
+        align-items: center;
+        justify-content: center;
+        cursor: pointer;
+        transition: all 0.3s ease;
+        z-index: 10;
+    }
+    
+    .send-button:hover {
+        transform: translateY(-50%) scale(1.05);
+        box-shadow: var(--shadow-medium);
+    }
+    
+    .send-button:disabled {
+        opacity: 0.5;
+        cursor: not-allowed;
+    }
+    
+    /* Tips section */
+    .tips-section {
+        background: rgba(37, 43, 59, 0.6);
+        border: 1px solid rgba(255, 255, 255, 0.1);
+        border-radius: 12px;
+        padding: 1rem;
+        backdrop-filter: blur(10px);
+        margin-bottom: 1rem;
+    }
+    
+    .tips-section h4 {
+        color: var(--accent-blue);
+        font-size: 0.9rem;
+        font-weight: 600;
+        margin-bottom: 0.5rem;
+        display: flex;
+        align-items: center;
+        gap: 0.3rem;
+    }
+    
+    .tips-section p {
+        color: var(--text-secondary);
+        font-size: 0.8rem;
+        line-height: 1.4;
+        margin-bottom: 0.3rem;
+    }
+    
+    .tips-section code {
+        background: rgba(59, 130, 246, 0.1);
+        color: var(--accent-blue);
+        padding: 0.2rem 0.4rem;
+        border-radius: 4px;
+        font-size: 0.75rem;
+    }
+    
+    /* Sidebar styling */
+    [data-testid="stSidebar"] {
+        background: var(--bg-secondary) !important;
+        border-right: 1px solid var(--border-color) !important;
+    }
+    
+    [data-testid="stSidebar"] .stTextInput > div > div > input {
+        background: var(--bg-tertiary) !important;
+        border: 1px solid var(--border-color) !important;
+        border-radius: 8px !important;
+        color: var(--text-primary) !important;
+        padding: 0.5rem !important;
+    }
+    
+    [data-testid="stSidebar"] .stButton > button {
+        background: var(--secondary-gradient) !important;
+        border-radius: 8px !important;
+        font-weight: 500 !important;
+        width: 100% !important;
+        border: none !important;
+        color: white !important;
+    }
+    
+    /* Status indicators */
+    .status-indicator {
+        display: inline-flex;
+        align-items: center;
+        gap: 0.3rem;
+        padding: 0.2rem 0.5rem;
+        border-radius: 8px;
+        font-size: 0.7rem;
+        font-weight: 500;
+        text-transform: uppercase;
+        letter-spacing: 0.5px;
+    }
+    
+    .status-openai {
+        background: rgba(16, 185, 129, 0.1);
+        color: var(--accent-green);
+        border: 1px solid rgba(16, 185, 129, 0.2);
+    }
+    
+    .status-gemini {
+        background: rgba(139, 92, 246, 0.1);
+        color: var(--accent-purple);
+        border: 1px solid rgba(139, 92, 246, 0.2);
+    }
+    
+    .status-index {
+        background: rgba(245, 158, 11, 0.1);
+        color: #f59e0b;
+        border: 1px solid rgba(245, 158, 11, 0.2);
+    }
+    
+    /* Loading indicator */
+    .loading-indicator {
+        display: flex;
+        align-items: center;
+        gap: 0.5rem;
+        color: var(--text-secondary);
+        font-size: 0.85rem;
+        margin: 1rem 0;
+        justify-content: center;
+    }
+    
+    .loading-dots {
+        display: flex;
+        gap: 3px;
+    }
+    
+    .loading-dots div {
+        width: 5px;
+        height: 5px;
+        background: var(--accent-blue);
+        border-radius: 50%;
+        animation: pulse 1.4s infinite;
+    }
+    
+    .loading-dots div:nth-child(2) { animation-delay: 0.2s; }
+    .loading-dots div:nth-child(3) { animation-delay: 0.4s; }
+    
+    /* Enhanced scrollbar */
+    ::-webkit-scrollbar {
+        width: 6px;
+    }
+    
+    ::-webkit-scrollbar-track {
+        background: transparent;
+    }
+    
+    ::-webkit-scrollbar-thumb {
+        background: linear-gradient(180deg, var(--accent-blue), var(--accent-purple));
+        border-radius: 10px;
+    }
+    
+    /* Animations */
+    @keyframes messageSlideIn {
+        from {
+            opacity: 0;
+            transform: translateY(15px);
+        }
+        to {
+            opacity: 1;
+            transform: translateY(0);
+        }
+    }
+    
+    @keyframes pulse {
+        0%, 100% { opacity: 1; }
+        50% { opacity: 0.3; }
+    }
+    
+    /* Responsive design */
+    @media (max-width: 768px) {
+        .header-title {
+            font-size: 1.5rem;
+        }
+        
+        .user-message, .bot-message {
+            max-width: 90%;
+        }
+        
+        .chat-container {
+            padding: 1rem;
+            margin-bottom: 80px;
+        }
+        
+        .input-container {
+            padding: 0.8rem;
+        }
+    }
+    """
+
+# JavaScript for Enter key and auto-scroll
+APP_SCRIPT = """
+    function handleEnterKey() {
+        document.addEventListener('keydown', function(e) {
+            if (e.key === 'Enter' && e.target.tagName === 'INPUT' && e.target.type === 'text') {
+                e.preventDefault();
+                // Trigger Streamlit to process the input
+                e.target.blur();
+                e.target.focus();
+            }
+        });
+    }
+    
+    function scrollToBottom() {
+        setTimeout(function() {
+            const chatContainer = document.querySelector('.chat-container');
+            if (chatContainer) {
+                chatContainer.scrollTop = chatContainer.scrollHeight;
+            }
+        }, 100);
+    }
+    
+    // Injected after the page has loaded, so initialize right away
+    handleEnterKey();
+    scrollToBottom();
+"""
+
+# Appends the stylesheet and script to the parent page's <head> from a
+# zero-height component. Streamlit drops elements a rerun doesn't emit,
+# but not nodes outside its own tree, so this only has to run once.
+INJECT_ASSETS_JS = """
+<script>
+const doc = window.parent.document;
+if (!doc.getElementById("ai-assistant-pro-css")) {
+    const style = doc.createElement("style");
+    style.id = "ai-assistant-pro-css";
+    style.textContent = %s;
+    doc.head.appendChild(style);
+    const script = doc.createElement("script");
+    script.textContent = %s;
+    doc.head.appendChild(script);
+}
+</script>
+"""
+
+
+# Chat bubble markup shared by the history and the live stream
+def user_message_html(text):
+    return f'''
+        <div class="message user-message">
+            <strong>You</strong><br>
+            {text}
+        </div>
+    '''
+
+
+def bot_message_html(llm_name, text):
+    model_indicator = f'<span class="status-indicator status-{llm_name.lower()}">{llm_name}</span>'
+    return f'''
+        <div class="message bot-message">
+            <strong>AI Assistant {model_indicator}</strong><br>
+            {text}
+        </div>
+    '''
+
+
+# One exchange as a single element. Each bubble is dedented on its own,
+# as separate st.markdown calls would be.
+def exchange_html(user_text, llm_name, bot_text):
+    return "\n\n".join(
+        textwrap.dedent(html).strip()
+        for html in (user_message_html(user_text), bot_message_html(llm_name, bot_text))
+    )
+
+
+# Markup for a history entry, built once and kept on the entry
+def turn_html(chat):
+    if "html" not in chat:
+        chat["html"] = exchange_html(chat["user"], chat["llm"], chat["bot"])
+    return chat["html"]
+
+
+# Static CSS/JS, sent once per browser session instead of on every rerun
+def inject_static_assets():
+    if st.session_state.get("static_assets_injected"):
+        return
+    components.html(INJECT_ASSETS_JS % (json.dumps(APP_CSS), json.dumps(APP_SCRIPT)), height=0)
+    st.session_state.static_assets_injected = True
+
+
+# Render the latest page of history, one element per exchange. Each
+# element's markup is cached and identical across reruns, so Streamlit sends
+# large ones (over its 10 KB message-cache threshold) as a hash reference.
+# chat_history holds only the newest turns; total_turns counts the whole
+# conversation and load_earlier(n) returns up to n turns from before the
+# first loaded one, read only when the user pages back.
+def render_history(chat_history, total_turns=0, load_earlier=None):
+    total = max(total_turns, len(chat_history))
+    shown = min(st.session_state.get("history_shown", HISTORY_PAGE_SIZE), total)
+    if shown > len(chat_history) and load_earlier is not None:
+        chat_history[:0] = load_earlier(shown - len(chat_history))
+    shown = min(shown, len(chat_history))
+    hidden = total - shown
+    if hidden and st.button(f"⬆️ Show earlier messages ({hidden} more)", key="show_earlier_history"):
+        st.session_state.history_shown = shown + HISTORY_PAGE_SIZE
+        st.rerun()
+    for chat in chat_history[len(chat_history) - shown:]:
+        st.markdown(turn_html(chat), unsafe_allow_html=True)
@@ -0,0 +1,473 @@
+import os
+import time
+from dataclasses import dataclass, field
+
+from context_budget import ContextOverflowError, fit_context
+from fanout import StreamingFanOut, fan_out, fan_out_samples
+from knowledge_index import KNOWLEDGE_INDEX, extract_target
+from prompts import grounded_template
+from provider_health import available_providers
+from providers import PROVIDER_KEYS, max_tokens_kwargs, samples_kwargs
+from response_cache import cache_key, model_name_of, template_hash
+from report_parser import ReportParser, parse_report
+from router import INTENT_MAX_TOKENS
+from scoring import select_best_response
+from sharded_report import assemble_report, generate_sharded
+from watchlist import WATCHLIST_PROVIDER
+from web_evidence import (
+    EVIDENCE_GROUNDING_WAIT_SECONDS, EVIDENCE_MAX_COMPANIES, EVIDENCE_SOURCES_WAIT_SECONDS, format_evidence,
+    format_evidence_prompt
+)
+
+# Job priority per intent (lower runs first): quick answers go ahead of
+# long competitor reports when the queue is busy
+TURN_PRIORITIES = {
+    "followup": 0,
+    "general": 0,
+    "comparison": 1,
+    "competitor": 2,
+}
+
+# Best-of-N: candidate reports sampled per provider for competitor queries
+# (1 turns it off; the chat sidebar can change it per session), and the
+# format score at which the turn stops waiting for the remaining samples
+BEST_OF_N = int(os.getenv("BEST_OF_N", "1"))
+BEST_OF_STOP_SCORE = float(os.getenv("BEST_OF_STOP_SCORE", "85"))
+
+# Streaming: re-score a partial response every N new characters, and only
+# cancel a provider once both streams are long enough to judge
+STREAM_SCORE_EVERY_CHARS = 400
+STREAM_MIN_CHARS_TO_CANCEL = 1500
+STREAM_CANCEL_MARGIN = 40.0
+
+
+# Return the providers whose partial stream is clearly losing on format.
+# score_history maps each live provider to its (chars, score) snapshots;
+# streams are compared at the same prefix length so a faster provider isn't
+# favoured just for having produced more text.
+def find_losing_streams(score_history):
+    if len(score_history) < 2 or not all(score_history.values()):
+        return []
+
+    prefix_len = min(history[-1][0] for history in score_history.values())
+    if prefix_len < STREAM_MIN_CHARS_TO_CANCEL:
+        return []
+
+    prefix_scores = {}
+    for llm_name, history in score_history.items():
+        earlier = [score for chars, score in history if chars <= prefix_len]
+        prefix_scores[llm_name] = earlier[-1] if earlier else 0.0
+    best_score = max(prefix_scores.values())
+    return [
+        llm_name for llm_name, score in prefix_scores.items()
+        if best_score - score >= STREAM_CANCEL_MARGIN
+    ]
+
+
+def chain_cache_key(llm_name, chain, user_input):
+    return cache_key(user_input, llm_name, model_name_of(chain.llm), template_hash(chain.prompt.template))
+
+
+# Everything one chat turn needs, gathered on the script thread when the
+# question is asked: the session's chains, its routing, its settings and
+# the shared stores. The turn itself runs on a job_queue worker.
+@dataclass
+class Turn:
+    user_input: str
+    chains: dict
+    intent: str
+    prompt_template: object
+    trace: object
+    conversation_id: str
+    fanout_policy: object
+    response_cache: object
+    semantic_index: object
+    knowledge_index: object
+    conversation_store: object
+    # Questions asked earlier in the session, oldest first, queued ones included
+    earlier_questions: list = field(default_factory=list)
+    stream_responses: bool = True
+    sharded_reports: bool = False
+    best_of: int = BEST_OF_N
+    # web_evidence.WebEvidenceFetcher when the session wants sources, else None
+    evidence_fetcher: object = None
+    # watchlist.Watchlist whose precomputed reports may answer, else None
+    watchlist: object = None
+
+
+# Answer one question: call the providers the fan-out plan picks, score
+# what comes back and persist the best answer. Runs as a job (see
+# job_queue): the leading partial answer goes to job.progress as
+# {"llm", "text"} and provider errors to job.notices. Returns the chat
+# history entry, or None when no provider answered.
+def run_turn(job, turn):
+    user_input = turn.user_input
+    chains = turn.chains
+    intent = turn.intent
+    trace = turn.trace
+    policy = turn.fanout_policy
+    best_llm = None
+    cached_llms = set()
+    trace.add_span("queue_wait", job.wait_seconds())
+
+    try:
+        # Point every chain at the intent's (smaller) template and a
+        # completion budget that fits the intent and what the prompt leaves
+        # of the model's context window (compacting old turns if needed)
+        too_long = []
+        for llm_name, chain in chains.items():
+            chain.prompt = turn.prompt_template
+            try:
+                max_tokens = fit_context(chain, user_input, INTENT_MAX_TOKENS[intent])
+            except ContextOverflowError as e:
+                too_long.append(llm_name)
+                job.notices.append(f"Skipped {llm_name}: {str(e)}")
+                continue
+            chain.llm_kwargs = max_tokens_kwargs(llm_name, max_tokens)
+        is_competitor_query = intent == "competitor"
+
+        # Pages about a report's target are fetched while the stores below
+        # are checked, to ground the report if one is generated
+        report_target = extract_target(user_input) if is_competitor_query else None
+        grounding = None
+        if report_target and turn.evidence_fetcher is not None:
+            grounding = turn.evidence_fetcher.start([report_target])
+
+        # Query all available LLMs at once, except those whose circuit is
+        # open (see provider_health.available_providers)
+        active_chains = {
+            llm_name: chain
+            for llm_name, chain in chains.items()
+            if os.getenv(PROVIDER_KEYS[llm_name]) and llm_name not in too_long
+        }
+        available = available_providers(active_chains)
+        circuit_open = [n for n in active_chains if n not in available]
+        for llm_name in circuit_open:
+            del active_chains[llm_name]
+            print(f"🔌 Skipping {llm_name}: circuit open")
+        if circuit_open and not active_chains:
+            job.notices.append("❌ Every model is failing right now; retrying them in the background")
+
+        responses = {}
+        scores = {}
+        reports = {}
+
+        # Region and overlap questions about companies already reported on
+        # are answered from the knowledge index, without calling a model
+        knowledge_index = turn.knowledge_index
+        index_answer = None
+        if intent in ("competitor", "followup"):
+            with trace.span("knowledge_lookup"):
+                context_target = knowledge_index.last_target(turn.earlier_questions)
+                index_answer = knowledge_index.answer(user_input, context_target)
+        if index_answer is not None:
+            responses[KNOWLEDGE_INDEX] = index_answer
+            reports[KNOWLEDGE_INDEX] = parse_report(index_answer)
+            scores[KNOWLEDGE_INDEX] = reports[KNOWLEDGE_INDEX].score(is_competitor_query)
+            active_chains = {}
+            print("📚 Answered from the knowledge index")
+
+        # A watched company's precomputed report is served at once; a stale
+        # one is queued for a background refresh (stale-while-revalidate)
+        watch_target = extract_target(user_input) if is_competitor_query and turn.watchlist is not None else None
+        if watch_target and not responses:
+            with trace.span("watchlist_lookup"):
+                watched = turn.watchlist.lookup(watch_target)
+            if watched is not None:
+                responses[WATCHLIST_PROVIDER] = watched.report
+                reports[WATCHLIST_PROVIDER] = parse_report(watched.report)
+                scores[WATCHLIST_PROVIDER] = reports[WATCHLIST_PROVIDER].score(is_competitor_query)
+                active_chains = {}
+                print(f"👀 Served {watched.company} v{watched.version} from the watchlist "
+                      f"({watched.age() / 3600:.1f}h old)")
+
+        fanout_plan = policy.plan(intent, active_chains, streaming=turn.stream_responses)
+        if active_chains:
+            trace.fanout = fanout_plan.mode
+            print(f"🔀 Fan-out {fanout_plan.mode} ({fanout_plan.reason}): {', '.join(fanout_plan.primary)}")
+
+        # Serve repeated queries from the response cache. Follow-ups depend on
+        # the conversation, so only competitor queries and first turns are cached.
+        response_cache = turn.response_cache
+        semantic_index = turn.semantic_index
+        with trace.span("cache_lookup"):
+            similar_query = None
+            if is_competitor_query:
+                similar_query, similarity = semantic_index.lookup(user_input)
+
+            cache_keys = {}
+            for llm_name, chain in list(active_chains.items()):
+                if not (is_competitor_query or not chain.memory.chat_memory.messages):
+                    continue
+                cache_keys[llm_name] = chain_cache_key(llm_name, chain, user_input)
+                cached = response_cache.get(cache_keys[llm_name])
+                if cached is None and similar_query:
+                    cached = response_cache.get(chain_cache_key(llm_name, chain, similar_query))
+                    if cached is not None:
+                        print(f"🧭 '{user_input}' matched cached '{similar_query}' ({similarity:.2f})")
+                if cached is not None:
+                    chain.memory.save_context({chain.input_key: user_input}, {chain.output_key: cached})
+                    responses[llm_name] = cached
+                    reports[llm_name] = parse_report(cached)
+                    scores[llm_name] = reports[llm_name].score(is_competitor_query)
+                    del active_chains[llm_name]
+                    print(f"⚡ Cache hit for {llm_name} ({len(cached)} chars)")
+        cached_llms = set(responses)
+        scoring_seconds = 0.0
+        job.check_cancelled()
+
+        # Call only the providers the plan picked; the rest stand by as
+        # backups. A cached answer from the likely winner needs no call.
+        if fanout_plan.mode != "all" and cached_llms & set(fanout_plan.primary):
+            active_chains = {}
+        primary_chains = {n: c for n, c in active_chains.items() if n in fanout_plan.primary}
+        backup_chains = {n: c for n, c in active_chains.items() if n in fanout_plan.backups}
+
+        # Ground a fresh report with the target's pages that arrived in time,
+        # refitting the completion budget to the longer prompt. Sharded
+        # sections use their own prompts, so they don't wait for the pages.
+        if grounding is not None and active_chains and not turn.sharded_reports:
+            with trace.span("evidence_grounding"):
+                evidence = turn.evidence_fetcher.collect(grounding, EVIDENCE_GROUNDING_WAIT_SECONDS)
+            grounded = grounded_template(turn.prompt_template, format_evidence_prompt(evidence))
+            if grounded is not turn.prompt_template:
+                print(f"🔎 Grounding the report with {sum(map(len, evidence.values()))} page(s) about {report_target}")
+            for llm_name, chain in active_chains.items():
+                chain.prompt = grounded
+                try:
+                    chain.llm_kwargs = max_tokens_kwargs(
+                        llm_name, fit_context(chain, user_input, INTENT_MAX_TOKENS[intent])
+                    )
+                except ContextOverflowError:
+                    chain.prompt = turn.prompt_template
+
+        # Score each response as soon as its provider finishes
+        # Sharded reports missing a failed section; those sections are
+        # cached on their own, so the whole report isn't
+        partial_llms = set()
+        if active_chains and is_competitor_query and turn.sharded_reports:
+            # Publish the provider with the most finished sections so far
+            sections = {llm_name: {} for llm_name in primary_chains}
+            failed_sections = {llm_name: set() for llm_name in primary_chains}
+            llms = {llm_name: chain.llm for llm_name, chain in primary_chains.items()}
+            for llm_name, section, text, error in generate_sharded(llms, user_input, response_cache, trace):
+                job.check_cancelled()
+                if error is not None:
+                    if not failed_sections[llm_name]:
+                        job.notices.append(f"Error with {llm_name} ({section}): {str(error)}")
+                    print(f"❌ Error with {llm_name} ({section}): {str(error)}")
+                    failed_sections[llm_name].add(section)
+                    continue
+                sections[llm_name][section] = text
+
+                leader = max(sections, key=lambda n: len(sections[n]))
+                job.progress = {"llm": leader, "text": assemble_report(sections[leader])}
+
+            # A report is assembled from whatever sections finished, failed
+            # regions marked as missing; only a provider with none fails
+            for llm_name, chain in primary_chains.items():
+                if not sections[llm_name]:
+                    continue
+                responses[llm_name] = assemble_report(sections[llm_name], failed_sections[llm_name])
+                if failed_sections[llm_name]:
+                    partial_llms.add(llm_name)
+                    print(f"⚠️ {llm_name} report is missing {', '.join(sorted(failed_sections[llm_name]))}")
+                chain.memory.save_context({chain.input_key: user_input}, {chain.output_key: responses[llm_name]})
+                print(f"✅ Got sharded report from {llm_name}")
+
+                scoring_started = time.monotonic()
+                reports[llm_name] = parse_report(responses[llm_name])
+                scores[llm_name] = reports[llm_name].score(is_competitor_query)
+                scoring_seconds += time.monotonic() - scoring_started
+                print(f"Score for {llm_name}: {scores[llm_name]}")
+        elif active_chains and is_competitor_query and turn.best_of > 1:
+            # Each batch of candidates (all of a native-n request, or one
+            # concurrent sample) is parsed and scored in one pass; each
+            # provider keeps its best, and a good enough one ends the turn
+            native = {n: samples_kwargs(n, turn.best_of) for n in primary_chains if samples_kwargs(n, turn.best_of)}
+            sampled = {}
+            for llm_name, texts, error in fan_out_samples(primary_chains, user_input, turn.best_of, native, trace=trace):
+                job.check_cancelled()
+                if error is not None:
+                    job.notices.append(f"Error with {llm_name}: {str(error)}")
+                    print(f"❌ Error with {llm_name}: {str(error)}")
+                    continue
+                scoring_started = time.monotonic()
+                batch = {sampled.get(llm_name, 0) + index: text for index, text in enumerate(texts)}
+                sampled[llm_name] = sampled.get(llm_name, 0) + len(batch)
+                best, batch_scores, batch_reports = select_best_response(batch, is_competitor_query)
+                scoring_seconds += time.monotonic() - scoring_started
+                print(f"🎲 {llm_name}: {len(batch)} sample(s), best {batch_scores[best]}")
+                if batch_scores[best] > scores.get(llm_name, -1.0):
+                    responses[llm_name] = batch[best]
+                    reports[llm_name] = batch_reports[best]
+                    scores[llm_name] = batch_scores[best]
+                    leader = max(scores, key=scores.get)
+                    job.progress = {"llm": leader, "text": responses[leader]}
+                if batch_scores[best] >= BEST_OF_STOP_SCORE:
+                    print(f"🎯 {llm_name} sample scored {batch_scores[best]}; not waiting for the rest")
+                    break
+
+            for llm_name, chain in primary_chains.items():
+                if llm_name in responses:
+                    chain.memory.save_context({chain.input_key: user_input}, {chain.output_key: responses[llm_name]})
+                    print(f"Score for {llm_name}: {scores[llm_name]} (best of {sampled[llm_name]} samples)")
+        elif active_chains and turn.stream_responses:
+            streams = StreamingFanOut(
+                primary_chains, user_input, trace=trace,
+                backups=backup_chains, hedge_delay=fanout_plan.hedge_delay
+            )
+            partials = {}
+            parsers = {llm_name: ReportParser() for llm_name in active_chains}
+            score_history = {llm_name: [] for llm_name in active_chains}
+            running_scores = {}
+            scored_at = {llm_name: 0 for llm_name in active_chains}
+
+            for llm_name, kind, payload in streams:
+                if job.cancelled:
+                    for other in streams.started:
+                        streams.cancel(other)
+                    job.check_cancelled()
+                if kind == "error":
+                    partials.pop(llm_name, None)
+                    job.notices.append(f"Error with {llm_name}: {str(payload)}")
+                    print(f"❌ Error with {llm_name}: {str(payload)}")
+                    continue
+
+                # Tokens are parsed as they arrive; the text is never rescanned
+                scoring_started = time.monotonic()
+                if kind == "done":
+                    partials[llm_name] = payload
+                    responses[llm_name] = payload
+                    reports[llm_name] = parsers[llm_name].close()
+                    print(f"✅ Got response from {llm_name}")
+                else:
+                    partials[llm_name] = partials.get(llm_name, "") + payload
+                    parsers[llm_name].feed(payload)
+
+                # Keep a running score and cancel streams that are clearly losing
+                if kind == "done" or len(partials[llm_name]) - scored_at[llm_name] >= STREAM_SCORE_EVERY_CHARS:
+                    running_scores[llm_name] = parsers[llm_name].report.score(is_competitor_query)
+                    scored_at[llm_name] = len(partials[llm_name])
+                    score_history[llm_name].append((scored_at[llm_name], running_scores[llm_name]))
+                    live_history = {n: score_history[n] for n in partials}
+                    for loser in find_losing_streams(live_history):
+                        if loser not in responses:
+                            streams.cancel(loser)
+                            partials.pop(loser)
+                            print(f"✂️ Cancelled {loser} stream (losing on format)")
+
+                if kind == "done":
+                    scores[llm_name] = running_scores[llm_name]
+                    print(f"Score for {llm_name}: {scores[llm_name]}")
+
+                    # A hedged turn takes the first acceptable answer
+                    if fanout_plan.mode == "hedged" and policy.acceptable(scores[llm_name]):
+                        for other in streams.started:
+                            if other not in responses:
+                                streams.cancel(other)
+                                partials.pop(other, None)
+                                print(f"✂️ Cancelled {other} stream ({llm_name} answered first)")
+
+                # Publish the current leader
+                scoring_seconds += time.monotonic() - scoring_started
+                if partials:
+                    leader = max(partials, key=lambda n: (running_scores.get(n, 0.0), len(partials[n])))
+                    job.progress = {"llm": leader, "text": partials[leader]}
+        elif active_chains:
+            results = fan_out(
+                primary_chains, user_input, trace=trace,
+                backups=backup_chains, hedge_delay=fanout_plan.hedge_delay
+            )
+            for llm_name, response, error in results:
+                job.check_cancelled()
+                if error is not None:
+                    job.notices.append(f"Error with {llm_name}: {str(error)}")
+                    print(f"❌ Error with {llm_name}: {str(error)}")
+                    continue
+                responses[llm_name] = response
+                print(f"✅ Got response from {llm_name}")
+
+                scoring_started = time.monotonic()
+                reports[llm_name] = parse_report(response)
+                score = reports[llm_name].score(is_competitor_query)
+                scores[llm_name] = score
+                scoring_seconds += time.monotonic() - scoring_started
+                print(f"Score for {llm_name}: {score}")
+
+                # A hedged turn takes the first acceptable answer; the calls
+                # still pending are abandoned and get the chosen one below
+                if fanout_plan.mode == "hedged" and policy.acceptable(score):
+                    results.close()
+                    break
+        if active_chains:
+            trace.add_span("scoring", scoring_seconds)
+        job.check_cancelled()
+
+        with trace.span("cache_store"):
+            for llm_name, key in cache_keys.items():
+                if llm_name in responses and llm_name not in cached_llms | partial_llms:
+                    response_cache.put(
+                        key, responses[llm_name],
+                        provider=llm_name,
+                        model=model_name_of(active_chains[llm_name].llm),
+                        query=user_input,
+                        intent=intent
+                    )
+                    if is_competitor_query:
+                        semantic_index.add(user_input)
+
+        if not responses:
+            return None
+
+        # Select the response with the highest score
+        # Only a comparison between fresh answers teaches the fan-out policy
+        # anything: cached, indexed and watchlist answers are left out
+        with trace.span("selection"):
+            best_llm = max(scores, key=scores.get)
+            fresh_scores = {n: s for n, s in scores.items() if n in chains and n not in cached_llms}
+            if len(fresh_scores) >= 2:
+                policy.record(intent, max(fresh_scores, key=fresh_scores.get), fresh_scores)
+
+        # Every fresh report's competitors go into the knowledge index
+        if report_target and best_llm not in (KNOWLEDGE_INDEX, WATCHLIST_PROVIDER):
+            with trace.span("knowledge_index"):
+                for llm_name, report in reports.items():
+                    if llm_name not in cached_llms:
+                        knowledge_index.add(report_target, report.competitors, provider=llm_name)
+        best_response = responses[best_llm]
+
+        # Providers the plan skipped (or that failed) still see the
+        # exchange, so their follow-ups have the same context
+        for llm_name, chain in chains.items():
+            if llm_name not in responses:
+                chain.memory.save_context({chain.input_key: user_input}, {chain.output_key: best_response})
+
+        # List pages about the target and the competitors the report names
+        # under the answer, waiting briefly for those not cached yet.
+        # Memories and the response cache keep the bare report.
+        answer = best_response
+        if report_target and best_llm != KNOWLEDGE_INDEX and turn.evidence_fetcher is not None:
+            job.check_cancelled()
+            with trace.span("web_evidence"):
+                names = [report_target] + [c.name for c in reports[best_llm].competitors]
+                names = list(dict.fromkeys(names))[:EVIDENCE_MAX_COMPANIES + 1]
+                sources = format_evidence(turn.evidence_fetcher.enrich(names, EVIDENCE_SOURCES_WAIT_SECONDS))
+            if sources:
+                answer = f"{best_response}\n\n{sources}"
+
+        # Persist the exchange here, so it survives the session that asked
+        # going away; the parsed report rides along for the chat history
+        seq = turn.conversation_store.append_turn(turn.conversation_id, user_input, answer, best_llm)
+        return {
+            "seq": seq,
+            "user": user_input,
+            "bot": answer,
+            "llm": best_llm,
+            "report": reports[best_llm]
+        }
+
+    finally:
+        trace.finish(selected=best_llm, cached=cached_llms)
+        policy.observe(trace.intent, trace.summary["calls"])
+        print(trace.log_line())
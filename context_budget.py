@@ -0,0 +1,145 @@
+import os
+
+from report_parser import REGIONS, parse_report
+from response_cache import model_name_of
+from tokens import MESSAGE_OVERHEAD_TOKENS, count_tokens, model_limits
+
+# Tokens left unused between prompt + completion and the context window,
+# for counting error and the provider's own framing
+CONTEXT_SAFETY_TOKENS = int(os.getenv("CONTEXT_SAFETY_TOKENS", "256"))
+# When less than this (or the intent's budget, if smaller) is left for the
+# answer, old turns are compacted or dropped to make room
+CONTEXT_MIN_COMPLETION_TOKENS = int(os.getenv("CONTEXT_MIN_COMPLETION_TOKENS", "1024"))
+# Older answers are compacted to their first this many characters
+CONTEXT_COMPACT_CHARS = int(os.getenv("CONTEXT_COMPACT_CHARS", "600"))
+
+# Follow-up requests for the rest of an answer cut off at its token limit
+MAX_CONTINUATIONS = int(os.getenv("MAX_CONTINUATIONS", "2"))
+# Finish reasons providers report for an answer that hit its limit
+TRUNCATED_FINISH_REASONS = {"length", "max_tokens", "MAX_TOKENS"}
+# Without a finish reason, an answer using this much of its limit was cut off
+TRUNCATED_BUDGET_SHARE = 0.98
+
+CONTINUE_INSTRUCTION = (
+    "Your previous answer was cut off. Continue exactly where it stops, mid-sentence if need be, "
+    "without repeating anything already written and without any preamble."
+)
+
+
+class ContextOverflowError(Exception):
+    pass
+
+
+def message_tokens(message, model):
+    return count_tokens(message.content, model) + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_tokens(memory, model):
+    messages = memory.chat_memory.messages if memory is not None else []
+    return sum(message_tokens(message, model) for message in messages)
+
+
+# Tokens the chain's prompt will take for user_input: template, history
+# and input, each counted for the chain's model
+def prompt_tokens(chain, user_input, model=None):
+    model = model or model_name_of(chain.llm)
+    return (count_tokens(chain.prompt.template, model) + history_tokens(getattr(chain, "memory", None), model)
+            + count_tokens(user_input, model) + MESSAGE_OVERHEAD_TOKENS)
+
+
+# Free at least needed tokens of the chain's history: first compact older
+# answers (all but the latest turn), then drop turns oldest first, then cut
+# the latest answer. Returns the tokens freed.
+def compact_history(memory, model, needed):
+    messages = memory.chat_memory.messages
+    freed = 0
+    for message in messages[:-2]:
+        if freed >= needed:
+            break
+        if message.type == "ai" and len(message.content) > CONTEXT_COMPACT_CHARS:
+            before = message_tokens(message, model)
+            message.content = message.content[:CONTEXT_COMPACT_CHARS].rsplit(" ", 1)[0] + " …"
+            freed += before - message_tokens(message, model)
+    while freed < needed and len(messages) > 2:
+        freed += sum(message_tokens(message, model) for message in messages[:2])
+        del messages[:2]
+    if freed < needed and messages:
+        last = messages[-1]
+        before = message_tokens(last, model)
+        keep_chars = max(0, len(last.content) - (needed - freed) * len(last.content) // max(before, 1))
+        last.content = last.content[:keep_chars] + " …"
+        freed += before - message_tokens(last, model)
+    return freed
+
+
+# Completion budget for the chain's next call: the intent's max_tokens,
+# capped by the model's output limit and by what the prompt leaves of its
+# context window. History is compacted first when too little would be left;
+# ContextOverflowError when the question alone doesn't fit.
+def fit_context(chain, user_input, max_tokens):
+    model = model_name_of(chain.llm)
+    window, completion_cap = model_limits(model)
+    wanted = min(max_tokens, completion_cap)
+    floor = min(wanted, CONTEXT_MIN_COMPLETION_TOKENS)
+    memory = getattr(chain, "memory", None)
+    available = window - CONTEXT_SAFETY_TOKENS - prompt_tokens(chain, user_input, model)
+    without_history = available + history_tokens(memory, model)
+    if without_history < floor:
+        raise ContextOverflowError(f"the question leaves under {floor} of {model}'s {window} context tokens for the answer")
+    if available < floor:
+        freed = compact_history(memory, model, floor - available)
+        print(f"🗜️ Compacted {model} history by {freed} tokens to fit its {window}-token context")
+        available = window - CONTEXT_SAFETY_TOKENS - prompt_tokens(chain, user_input, model)
+    return min(wanted, available)
+
+
+def finish_reason(metadata):
+    metadata = metadata or {}
+    reason = metadata.get("finish_reason") or metadata.get("stop_reason")
+    return getattr(reason, "name", reason)
+
+
+# Whether an answer stopped at its token limit rather than finishing
+def is_truncated(text, metadata, max_tokens, model=None):
+    reason = finish_reason(metadata)
+    if reason is not None:
+        return str(reason) in TRUNCATED_FINISH_REASONS
+    return bool(max_tokens) and count_tokens(text, model) >= max_tokens * TRUNCATED_BUDGET_SHARE
+
+
+# The instruction for the rest of a cut-off answer. A competitor report
+# is asked only for the sections it hasn't reached.
+def continuation_instruction(partial):
+    report = parse_report(partial)
+    if not report.regions or report.conclusion:
+        return CONTINUE_INSTRUCTION
+    names = [name for name, _ in REGIONS]
+    last = max(names.index(region) for region in report.regions)
+    missing = names[last + 1:] + ["Conclusion"]
+    return f"{CONTINUE_INSTRUCTION} Finish the {names[last]} section, then write only: {', '.join(missing)}."
+
+
+# Messages asking for the rest of partial: the original prompt, the answer
+# so far and the instruction
+def continuation_messages(prompt, partial):
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    return prompt.to_messages() + [AIMessage(content=partial), HumanMessage(content=continuation_instruction(partial))]
+
+
+# Completion budget for a continuation: the original budget, capped by what
+# prompt + partial leave of the context window; None when too little is left
+def continuation_budget(prompt_text, partial, max_tokens, model):
+    window, completion_cap = model_limits(model)
+    used = (count_tokens(prompt_text, model) + count_tokens(partial, model)
+            + count_tokens(continuation_instruction(partial), model) + 3 * MESSAGE_OVERHEAD_TOKENS)
+    available = min(max_tokens, completion_cap, window - CONTEXT_SAFETY_TOKENS - used)
+    return available if available >= min(max_tokens, CONTEXT_MIN_COMPLETION_TOKENS) else None
+
+
+# partial + its continuation; a continuation that opens a new heading or
+# bullet starts on its own line
+def join_continuation(partial, addition):
+    if partial and not partial.endswith("\n") and addition.lstrip(" ").startswith(("#", "- ", "* ")):
+        return partial + "\n" + addition.lstrip(" ")
+    return partial + addition
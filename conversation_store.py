@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", os.path.join(".cache", "conversations.sqlite3"))
+# Conversations untouched for this long are deleted
+CONVERSATION_RETENTION_DAYS = float(os.getenv("CONVERSATION_RETENTION_DAYS", "30"))
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+# Durable chat history: one row per session and one compact row per turn
+# (question, zlib-compressed answer, provider, time). Sessions are resumed
+# by id and their turns read back a page at a time, newest first, so a
+# session only ever holds the turns on screen. Shared by every session.
+class ConversationStore:
+    def __init__(self, path=CONVERSATION_DB_PATH, retention_days=CONVERSATION_RETENTION_DAYS):
+        self.retention_seconds = retention_days * 24 * 3600
+        self._lock = threading.Lock()
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, created_at REAL, updated_at REAL, turns INTEGER DEFAULT 0)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            " session_id TEXT, seq INTEGER, user TEXT, bot BLOB, llm TEXT, created_at REAL,"
+            " PRIMARY KEY (session_id, seq))"
+        )
+        self._db.commit()
+        self.prune()
+
+    def prune(self):
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM turns WHERE session_id IN (SELECT id FROM sessions WHERE updated_at < ?)", (cutoff,)
+            )
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+            self._db.commit()
+
+    def turn_count(self, session_id):
+        with self._lock:
+            row = self._db.execute("SELECT turns FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def has_session(self, session_id):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is not None
+
+    # Append one exchange, creating the session on its first turn; returns
+    # the turn's sequence number
+    def append_turn(self, session_id, user, bot, llm):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
+                (session_id, now, now)
+            )
+            seq = self._db.execute("SELECT turns FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+            self._db.execute(
+                "INSERT INTO turns VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, seq, user, zlib.compress(bot.encode("utf-8")), llm, now)
+            )
+            self._db.execute(
+                "UPDATE sessions SET turns = turns + 1, updated_at = ? WHERE id = ?", (now, session_id)
+            )
+            self._db.commit()
+        return seq
+
+    # Up to limit turns before sequence number `before` (default: the
+    # newest), oldest first, as chat history entries
+    def load_turns(self, session_id, limit, before=None):
+        sql = "SELECT seq, user, bot, llm FROM turns WHERE session_id = ?"
+        params = [session_id]
+        if before is not None:
+            sql += " AND seq < ?"
+            params.append(before)
+        sql += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [
+            {"seq": seq, "user": user, "bot": zlib.decompress(bot).decode("utf-8"), "llm": llm}
+            for seq, user, bot, llm in reversed(rows)
+        ]
+
+    def delete_session(self, session_id):
+        with self._lock:
+            self._db.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
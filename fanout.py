@@ -0,0 +1,502 @@
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+
+from context_budget import (
+    MAX_CONTINUATIONS, continuation_budget, continuation_messages, is_truncated, join_continuation,
+    prompt_tokens as count_prompt_tokens
+)
+from provider_health import get_health
+from rate_limit import get_limiter
+from response_cache import model_name_of
+from telemetry import ProviderCall
+from tokens import count_tokens
+
+# Default per-provider timeout (seconds); override with LLM_TIMEOUT_SECONDS
+# or per provider with e.g. OPENAI_TIMEOUT_SECONDS / GEMINI_TIMEOUT_SECONDS
+DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+
+# One process-wide pool shared by every session. Calls that time out are
+# abandoned here rather than joined, so a hung provider never holds a turn.
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLM_MAX_WORKERS", "16")),
+    thread_name_prefix="llm-fanout"
+)
+
+
+# Run fn(*args) on the shared pool (for other kinds of provider calls)
+def submit(fn, *args):
+    return _executor.submit(fn, *args)
+
+
+# Completion tokens to reserve when the model has no max_tokens setting
+EXPECTED_COMPLETION_TOKENS = 2000
+
+
+def provider_timeout(llm_name, timeouts=None):
+    if timeouts and llm_name in timeouts:
+        return float(timeouts[llm_name])
+    env_value = os.getenv(f"{llm_name.upper()}_TIMEOUT_SECONDS")
+    if env_value:
+        return float(env_value)
+    return DEFAULT_TIMEOUT
+
+
+# The chain's completion limit, or None when it sets none. A per-call limit
+# in its llm_kwargs (see providers.max_tokens_kwargs) takes precedence over
+# the client's own setting.
+def completion_limit(chain):
+    llm_kwargs = getattr(chain, "llm_kwargs", None) or {}
+    generation_config = llm_kwargs.get("generation_config") or {}
+    return (llm_kwargs.get("max_tokens") or generation_config.get("max_output_tokens")
+            or getattr(chain.llm, "max_tokens", None) or getattr(chain.llm, "max_output_tokens", None))
+
+
+def completion_reservation(chain):
+    return completion_limit(chain) or EXPECTED_COMPLETION_TOKENS
+
+
+def history_token_count(chain):
+    memory = getattr(chain, "memory", None)
+    return memory.token_count() if hasattr(memory, "token_count") else 0
+
+
+# The chain's prompt for user_input with its memory filled in, without
+# saving anything to the memory (stateless chains get an empty history)
+def format_chain_prompt(chain, user_input):
+    if getattr(chain, "memory", None) is None:
+        return chain.prompt.format_prompt(input=user_input, history="")
+    inputs = {chain.input_key: user_input}
+    inputs.update(chain.memory.load_memory_variables(inputs))
+    return chain.prompt.format_prompt(**inputs)
+
+
+# Ask for the rest of an answer that stopped at its token limit, up to
+# MAX_CONTINUATIONS times, each a request under the provider's rate limiter
+# with a budget that fits what prompt + answer leave of the context window.
+# on_token, when given, streams the continuation until cancelled is set.
+# Returns the whole answer.
+def complete_truncated(llm_name, chain, prompt, text, metadata, deadline=None, on_token=None, cancelled=None):
+    from providers import max_tokens_kwargs
+
+    model = model_name_of(chain.llm)
+    max_tokens = completion_limit(chain)
+    prompt_text = prompt.to_string()
+    for _ in range(MAX_CONTINUATIONS):
+        if not is_truncated(text, metadata, max_tokens, model):
+            break
+        budget = continuation_budget(prompt_text, text, max_tokens or EXPECTED_COMPLETION_TOKENS, model)
+        if budget is None:
+            print(f"⚠️ {llm_name} answer was cut off and there is no room left to continue it")
+            break
+        print(f"➡️ {llm_name} answer was cut off at {count_tokens(text, model)} tokens; asking for the rest")
+        messages = continuation_messages(prompt, text)
+        kwargs = max_tokens_kwargs(llm_name, budget)
+        used_tokens = count_tokens(prompt_text, model) + count_tokens(text, model)
+
+        def invoke():
+            if on_token is None:
+                message = chain.llm.invoke(messages, **kwargs)
+                return message.content, message.response_metadata
+            parts = []
+            chunk_metadata = {}
+            for chunk in chain.llm.stream(messages, **kwargs):
+                if cancelled is not None and cancelled.is_set():
+                    break
+                chunk_metadata.update(chunk.response_metadata or {})
+                if chunk.content:
+                    parts.append(chunk.content)
+                    on_token(chunk.content)
+            return "".join(parts), chunk_metadata
+
+        addition, metadata = get_limiter(llm_name).call(
+            invoke,
+            reserved_tokens=used_tokens + budget,
+            deadline=deadline,
+            count_tokens=lambda result: used_tokens + count_tokens(result[0], model)
+        )
+        text = join_continuation(text, addition)
+        max_tokens = budget
+    return text
+
+
+# Timing record for one call: part of the turn's trace when there is one.
+# part names the section or sample when the provider gets several calls.
+def start_call(trace, llm_name, prompt_tokens, history_tokens, submitted, part=None):
+    if trace is not None:
+        return trace.provider_call(llm_name, prompt_tokens, history_tokens, submitted, part)
+    return ProviderCall(llm_name, prompt_tokens, history_tokens, submitted, part)
+
+
+# A call that missed its deadline: a failure for the provider's health and
+# a timeout in the trace
+def mark_timed_out(trace, llm_name, part=None):
+    get_health(llm_name).record_failure(f"{llm_name} timed out", timeout=True)
+    call = trace.last_call(llm_name, part) if trace is not None else None
+    if call is not None:
+        call.finish("timeout")
+
+
+# chain.predict under the provider's shared rate limiter (quota, adaptive
+# concurrency and retry with backoff until the deadline); an answer cut off
+# at its token limit is completed with continuation requests before it is
+# saved to the chain's memory. Once abandoned (a threading.Event) is set the
+# caller has moved on without this answer: it is neither continued, nor
+# saved, nor counted toward the provider's health.
+def limited_predict(llm_name, chain, user_input, deadline=None, trace=None, submitted=None, abandoned=None):
+    model = model_name_of(chain.llm)
+    prompt = format_chain_prompt(chain, user_input)
+    prompt_tokens = count_prompt_tokens(chain, user_input)
+    call = start_call(trace, llm_name, prompt_tokens, history_token_count(chain), submitted)
+
+    def predict():
+        call.start()
+        message = chain.llm.invoke(prompt, **(getattr(chain, "llm_kwargs", None) or {}))
+        return message.content, message.response_metadata
+
+    try:
+        response, metadata = get_limiter(llm_name).call(
+            predict,
+            reserved_tokens=prompt_tokens + completion_reservation(chain),
+            deadline=deadline,
+            count_tokens=lambda result: prompt_tokens + count_tokens(result[0], model),
+            abandoned=abandoned
+        )
+        if abandoned is not None and abandoned.is_set():
+            return response
+        response = complete_truncated(llm_name, chain, prompt, response, metadata, deadline)
+    except Exception:
+        call.finish("error")
+        raise
+    call.finish("ok", count_tokens(response, model))
+    if abandoned is not None and abandoned.is_set():
+        return response
+    if getattr(chain, "memory", None) is not None:
+        chain.memory.save_context({chain.input_key: user_input}, {chain.output_key: response})
+    return response
+
+
+# When to start the backup chains of a fan-out (see fanout_policy.FanOutPlan):
+# once every primary has failed, or once hedge_at passes with no output yet
+def backups_due(pending, answered, hedge_at, now):
+    if answered:
+        return False
+    return not pending or (hedge_at is not None and now >= hedge_at)
+
+
+# Send the same input to every chain at once and yield
+# (llm_name, response, error) tuples in completion order, so the caller can
+# score each response as soon as it arrives. A provider that misses its
+# deadline is cancelled and yielded with a TimeoutError. Pass a
+# telemetry.TurnTrace to record each provider call's timing and tokens.
+# backups are only called if every chain fails, or if none has answered
+# within hedge_delay seconds. Calls still pending when the caller stops
+# early are abandoned, so they leave the chains' memory alone.
+def fan_out(chains, user_input, timeouts=None, trace=None, backups=None, hedge_delay=None):
+    futures = {}
+    deadlines = {}
+    abandoned = {}
+    pending = set()
+    backups = dict(backups or {})
+    hedge_at = time.monotonic() + hedge_delay if hedge_delay is not None else None
+    answered = False
+
+    def submit(batch):
+        submitted = time.monotonic()
+        for llm_name, chain in batch.items():
+            deadline = submitted + provider_timeout(llm_name, timeouts)
+            abandoned[llm_name] = threading.Event()
+            future = _executor.submit(
+                limited_predict, llm_name, chain, user_input, deadline, trace, submitted, abandoned[llm_name]
+            )
+            futures[future] = llm_name
+            deadlines[future] = deadline
+            pending.add(future)
+
+    submit(chains)
+    try:
+        while True:
+            now = time.monotonic()
+            if backups and backups_due(pending, answered, hedge_at, now):
+                print(f"🛟 Starting backup {', '.join(backups)}")
+                submit(backups)
+                backups = {}
+            if not pending:
+                break
+
+            wake_at = min(deadlines[f] for f in pending)
+            if backups and hedge_at is not None and not answered:
+                wake_at = min(wake_at, hedge_at)
+            done, _ = concurrent.futures.wait(
+                pending, timeout=max(0.0, wake_at - now), return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            pending -= done
+            for future in done:
+                llm_name = futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    yield llm_name, None, e
+                    continue
+                answered = True
+                yield llm_name, response, None
+
+            now = time.monotonic()
+            expired = [f for f in pending if deadlines[f] <= now]
+            for future in expired:
+                # A call already running can't be stopped; it finishes
+                # without touching the chain's memory or the health stats
+                llm_name = futures[future]
+                abandoned[llm_name].set()
+                future.cancel()
+                pending.discard(future)
+                mark_timed_out(trace, llm_name)
+                yield llm_name, None, TimeoutError(
+                    f"{llm_name} did not respond within {provider_timeout(llm_name, timeouts):g}s"
+                )
+    finally:
+        # Caller stopped early (or errored): don't start work nobody will
+        # read, and let calls already running finish without saving it
+        for future in pending:
+            abandoned[futures[future]].set()
+            future.cancel()
+
+
+# n completions of the chain's prompt (its memory included, but not
+# updated) under the provider's rate limiter: one request when native_kwargs
+# asks the provider for n choices, otherwise a single completion. Returns
+# the list of texts. part names the sample in the trace; abandoned works as
+# in limited_predict.
+def limited_samples(llm_name, chain, user_input, n=1, native_kwargs=None, deadline=None, trace=None,
+                    submitted=None, part=None, abandoned=None):
+    model = model_name_of(chain.llm)
+    prompt = format_chain_prompt(chain, user_input)
+    prompt_tokens = count_prompt_tokens(chain, user_input)
+    llm_kwargs = chain.llm_kwargs or {}
+    call = start_call(trace, llm_name, prompt_tokens, history_token_count(chain), submitted, part)
+
+    def generate():
+        call.start()
+        if native_kwargs:
+            result = chain.llm.generate([prompt.to_messages()], **llm_kwargs, **native_kwargs)
+            return [generation.text for generation in result.generations[0]]
+        return [chain.llm.invoke(prompt, **llm_kwargs).content]
+
+    try:
+        texts = get_limiter(llm_name).call(
+            generate,
+            reserved_tokens=prompt_tokens + completion_reservation(chain) * (n if native_kwargs else 1),
+            deadline=deadline,
+            count_tokens=lambda texts: prompt_tokens + sum(count_tokens(text, model) for text in texts),
+            abandoned=abandoned
+        )
+    except Exception:
+        call.finish("error")
+        raise
+    call.finish("ok", sum(count_tokens(text, model) for text in texts))
+    return texts
+
+
+# Best-of-n sampling: n candidate completions per chain, all at once, as
+# one request for providers listed in native (llm_name -> kwargs asking for
+# n choices, e.g. OpenAI's n) and as n concurrent requests for the rest.
+# Yields (llm_name, texts, error) batches as requests finish; closing the
+# generator early cancels whatever hasn't started. Chain memory is left to
+# the caller, who decides which candidate the conversation keeps.
+def fan_out_samples(chains, user_input, n, native=None, timeouts=None, trace=None):
+    native = native or {}
+    futures = {}
+    deadlines = {}
+    abandoned = {}
+    submitted = time.monotonic()
+    for llm_name, chain in chains.items():
+        deadline = submitted + provider_timeout(llm_name, timeouts)
+        requests = [(n, native[llm_name])] if llm_name in native else [(1, None)] * n
+        for index, (count, native_kwargs) in enumerate(requests, 1):
+            part = f"sample{index}"
+            abandoned[llm_name, part] = threading.Event()
+            future = _executor.submit(
+                limited_samples, llm_name, chain, user_input, count, native_kwargs, deadline, trace,
+                submitted, part, abandoned[llm_name, part]
+            )
+            futures[future] = (llm_name, part)
+            deadlines[future] = deadline
+
+    pending = set(futures)
+    try:
+        while pending:
+            wait_for = max(0.0, min(deadlines[f] for f in pending) - time.monotonic())
+            done, pending = concurrent.futures.wait(
+                pending, timeout=wait_for, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                llm_name = futures[future][0]
+                try:
+                    yield llm_name, future.result(), None
+                except Exception as e:
+                    yield llm_name, None, e
+
+            now = time.monotonic()
+            for future in [f for f in pending if deadlines[f] <= now]:
+                llm_name, part = futures[future]
+                abandoned[llm_name, part].set()
+                future.cancel()
+                pending.discard(future)
+                mark_timed_out(trace, llm_name, part)
+                yield llm_name, None, TimeoutError(
+                    f"{llm_name} did not respond within {provider_timeout(llm_name, timeouts):g}s"
+                )
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# Streaming counterpart of fan_out. Every chain streams concurrently from the
+# shared pool; iterating yields (llm_name, kind, payload) tuples where kind is
+# "token" (payload = new text), "done" (payload = full response) or "error"
+# (payload = exception). The caller publishes tokens as they arrive and
+# can cancel() streams that are clearly losing.
+# backups stream only if every chain fails, or if none has produced a token
+# within hedge_delay seconds; started lists the chains actually called.
+class StreamingFanOut:
+    def __init__(self, chains, user_input, timeouts=None, trace=None, backups=None, hedge_delay=None):
+        self.chains = chains
+        self.user_input = user_input
+        self.timeouts = timeouts
+        self.trace = trace
+        self.backups = backups or {}
+        self.hedge_delay = hedge_delay
+        self.started = []
+        self._events = queue.Queue()
+        self._cancelled = {llm_name: threading.Event() for llm_name in [*chains, *self.backups]}
+
+    def cancel(self, llm_name):
+        self._cancelled[llm_name].set()
+
+    def is_cancelled(self, llm_name):
+        return self._cancelled[llm_name].is_set()
+
+    def _stream(self, llm_name, chain, deadline, submitted):
+        cancelled = self._cancelled[llm_name]
+        limiter = get_limiter(llm_name)
+        call = None
+        try:
+            model = model_name_of(chain.llm)
+            prompt = format_chain_prompt(chain, self.user_input)
+            prompt_tokens = count_prompt_tokens(chain, self.user_input)
+            reserved_tokens = prompt_tokens + completion_reservation(chain)
+            call = start_call(self.trace, llm_name, prompt_tokens, history_token_count(chain), submitted)
+
+            attempt = 0
+            while True:
+                started = limiter.acquire(reserved_tokens, deadline)
+                call.start()
+                parts = []
+                metadata = {}
+                try:
+                    stream = chain.llm.stream(prompt, **(chain.llm_kwargs or {}))
+                    try:
+                        for chunk in stream:
+                            metadata.update(chunk.response_metadata or {})
+                            if cancelled.is_set():
+                                # Closing the generator drops the HTTP stream, so a
+                                # cancelled provider stops billing output tokens
+                                break
+                            if chunk.content:
+                                call.token()
+                                parts.append(chunk.content)
+                                self._events.put((llm_name, "token", chunk.content))
+                    finally:
+                        stream.close()
+                except Exception as e:
+                    limiter.release_failed(started, e, reserved_tokens, record_health=not cancelled.is_set())
+                    # Once tokens are on screen the stream can't be replayed
+                    delay = None if parts else limiter.retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+
+                response = "".join(parts)
+                # A stream cut short (past its deadline, which already counted as a
+                # timeout, or by the caller) says nothing about the provider's health
+                limiter.release(started, "ok", reserved_tokens, prompt_tokens + count_tokens(response, model),
+                                record_health=not cancelled.is_set())
+                break
+
+            if not cancelled.is_set():
+                response = complete_truncated(
+                    llm_name, chain, prompt, response, metadata, deadline,
+                    on_token=lambda text: self._events.put((llm_name, "token", text)), cancelled=cancelled
+                )
+            if cancelled.is_set():
+                call.finish("cancelled", count_tokens(response, model))
+                return
+            call.finish("ok", count_tokens(response, model))
+            if getattr(chain, "memory", None) is not None:
+                chain.memory.save_context(
+                    {chain.input_key: self.user_input}, {chain.output_key: response}
+                )
+            self._events.put((llm_name, "done", response))
+        except Exception as e:
+            if call is not None:
+                call.finish("error")
+            self._events.put((llm_name, "error", e))
+
+    def __iter__(self):
+        started = time.monotonic()
+        deadlines = {}
+        pending = set()
+        backups = dict(self.backups)
+        hedge_at = started + self.hedge_delay if self.hedge_delay is not None else None
+        answered = False
+
+        def submit(batch):
+            submitted = time.monotonic()
+            for llm_name, chain in batch.items():
+                deadlines[llm_name] = submitted + provider_timeout(llm_name, self.timeouts)
+                self.started.append(llm_name)
+                pending.add(llm_name)
+                _executor.submit(self._stream, llm_name, chain, deadlines[llm_name], submitted)
+
+        submit(self.chains)
+        try:
+            while True:
+                # Streams cancelled by the caller end silently
+                pending = {n for n in pending if not self.is_cancelled(n)}
+
+                now = time.monotonic()
+                for llm_name in [n for n in pending if deadlines[n] <= now]:
+                    mark_timed_out(self.trace, llm_name)
+                    self.cancel(llm_name)
+                    pending.discard(llm_name)
+                    yield llm_name, "error", TimeoutError(
+                        f"{llm_name} did not finish within {provider_timeout(llm_name, self.timeouts):g}s"
+                    )
+                if backups and backups_due(pending, answered, hedge_at, now):
+                    print(f"🛟 Starting backup {', '.join(backups)}")
+                    submit(backups)
+                    backups = {}
+                if not pending:
+                    break
+
+                wake_at = min(deadlines[n] for n in pending)
+                if backups and hedge_at is not None and not answered:
+                    wake_at = min(wake_at, hedge_at)
+                try:
+                    llm_name, kind, payload = self._events.get(timeout=max(0.0, wake_at - now))
+                except queue.Empty:
+                    continue
+                if llm_name not in pending or self.is_cancelled(llm_name):
+                    continue
+                if kind != "token":
+                    pending.discard(llm_name)
+                if kind != "error":
+                    answered = True
+                yield llm_name, kind, payload
+        finally:
+            for llm_name in pending:
+                self.cancel(llm_name)
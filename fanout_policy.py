@@ -0,0 +1,232 @@
+import collections
+import os
+import random
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+
+FANOUT_MODES = ("single", "all", "hedged")
+
+# Per-intent mode. Format scoring only pays for itself on competitor
+# reports; everything else goes to the provider that usually wins.
+# Override with e.g. FANOUT_POLICY="general=single,competitor=hedged".
+DEFAULT_FANOUT_POLICY = {
+    "competitor": "all",
+    "comparison": "hedged",
+    "general": "single",
+    "followup": "single",
+}
+
+FANOUT_STATS_PATH = os.getenv("FANOUT_STATS_PATH", os.path.join(".cache", "fanout.sqlite3"))
+# The learned winner is trusted once it has been compared this many
+# (decayed) times and wins at least this share of them
+FANOUT_MIN_SAMPLES = float(os.getenv("FANOUT_MIN_SAMPLES", "5"))
+FANOUT_MIN_CONFIDENCE = float(os.getenv("FANOUT_MIN_CONFIDENCE", "0.7"))
+# Share of single-mode turns that still ask every provider, so the win
+# rates keep up when a provider improves or regresses
+FANOUT_EXPLORE_RATE = float(os.getenv("FANOUT_EXPLORE_RATE", "0.1"))
+# Older comparisons fade by this factor each time a new one is recorded
+FANOUT_WIN_DECAY = float(os.getenv("FANOUT_WIN_DECAY", "0.98"))
+# Hedged mode starts the backup once the first provider is slower than its
+# own p95 for the intent. Until a provider has this many samples for the
+# intent, FANOUT_HEDGE_SECONDS stands in for its p95.
+FANOUT_HEDGE_SECONDS = float(os.getenv("FANOUT_HEDGE_SECONDS", "3"))
+FANOUT_LATENCY_MIN_SAMPLES = int(os.getenv("FANOUT_LATENCY_MIN_SAMPLES", "5"))
+FANOUT_LATENCY_WINDOW = int(os.getenv("FANOUT_LATENCY_WINDOW", "200"))
+# Providers failing more than this share of recent calls are tried last
+FANOUT_MAX_ERROR_RATE = float(os.getenv("FANOUT_MAX_ERROR_RATE", "0.5"))
+# A hedged turn ends at the first answer scoring at least this much
+FANOUT_ACCEPT_SCORE = float(os.getenv("FANOUT_ACCEPT_SCORE", "60"))
+
+
+def parse_policy(spec, default=DEFAULT_FANOUT_POLICY):
+    policy = dict(default)
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        intent, _, mode = item.partition("=")
+        mode = mode.strip().lower()
+        if mode not in FANOUT_MODES:
+            raise ValueError(f"Unknown fan-out mode for {intent.strip()}: {mode!r}")
+        policy[intent.strip()] = mode
+    return policy
+
+
+# Which providers to call for one turn. backups start only when every
+# primary has failed, or (with hedge_delay) when none has produced output
+# within hedge_delay seconds.
+@dataclass
+class FanOutPlan:
+    mode: str
+    primary: list
+    backups: list = field(default_factory=list)
+    hedge_delay: float = None
+    reason: str = ""
+
+
+# Decayed per-intent win counts: how often each provider's answer was
+# selected when it was compared against at least one other. Persisted in
+# SQLite so the policy survives restarts; shared by every session.
+class WinTracker:
+    def __init__(self, path=FANOUT_STATS_PATH, decay=FANOUT_WIN_DECAY):
+        self.decay = decay
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS provider_wins ("
+                " intent TEXT, provider TEXT, wins REAL, contests REAL,"
+                " PRIMARY KEY (intent, provider))"
+            )
+            self._db.commit()
+            for intent, provider, wins, contests in self._db.execute("SELECT * FROM provider_wins"):
+                self._stats.setdefault(intent, {})[provider] = [wins, contests]
+
+    def record(self, intent, winner, contenders):
+        if len(contenders) < 2 or winner not in contenders:
+            return
+        with self._lock:
+            stats = self._stats.setdefault(intent, {})
+            for provider in contenders:
+                entry = stats.setdefault(provider, [0.0, 0.0])
+                entry[0] = entry[0] * self.decay + (provider == winner)
+                entry[1] = entry[1] * self.decay + 1
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO provider_wins VALUES (?, ?, ?, ?)",
+                    [(intent, provider, *stats[provider]) for provider in contenders]
+                )
+                self._db.commit()
+
+    # Smoothed share of comparisons won, and how many comparisons that rests on
+    def win_rate(self, intent, provider):
+        with self._lock:
+            wins, contests = self._stats.get(intent, {}).get(provider, (0.0, 0.0))
+        return (wins + 1) / (contests + 2), contests
+
+    def snapshot(self):
+        with self._lock:
+            return {intent: {provider: {"wins": round(wins, 2), "contests": round(contests, 2)}
+                             for provider, (wins, contests) in stats.items()}
+                    for intent, stats in self._stats.items()}
+
+
+# Rolling latency samples per provider and intent: time to first token
+# ("ttft", what a streaming turn waits for) and total call time ("total",
+# what a non-streaming turn waits for), fed from finished turn traces.
+# Process-local; latency is too volatile to be worth persisting.
+class LatencyTracker:
+    def __init__(self, window=FANOUT_LATENCY_WINDOW, min_samples=FANOUT_LATENCY_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self._outcomes = collections.defaultdict(lambda: collections.deque(maxlen=window))
+
+    # calls are telemetry.ProviderCall summaries. Section and sample calls
+    # share the turn with the provider's other calls, so their timings say
+    # little about a single answer and are left out.
+    def observe(self, intent, calls):
+        with self._lock:
+            for call in calls:
+                if call.get("part"):
+                    continue
+                provider, outcome = call["provider"], call["outcome"]
+                if call["ttft"] is not None:
+                    self._samples[provider, intent, "ttft"].append(call["ttft"])
+                if outcome == "ok":
+                    self._samples[provider, intent, "total"].append(call["total"])
+                elif outcome == "timeout":
+                    # A timeout is a tail sample for whatever it never reached
+                    if call["ttft"] is None:
+                        self._samples[provider, intent, "ttft"].append(call["total"])
+                    self._samples[provider, intent, "total"].append(call["total"])
+                if outcome in ("ok", "error", "timeout"):
+                    self._outcomes[provider].append(outcome == "ok")
+
+    # None until there are min_samples samples
+    def quantile(self, provider, intent, metric, q):
+        with self._lock:
+            samples = sorted(self._samples.get((provider, intent, metric), ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def error_rate(self, provider):
+        with self._lock:
+            outcomes = self._outcomes.get(provider)
+            return 1 - sum(outcomes) / len(outcomes) if outcomes else 0.0
+
+
+# Decides per turn whether to call one provider, all of them, or one with
+# the others as a hedge. Single mode calls the provider that has been
+# winning format scoring for the intent; hedged mode calls the fastest
+# healthy one and hedges with the rest once it is slower than its p95.
+class FanOutPolicy:
+    def __init__(self, policy=None, wins=None, latency=None, min_samples=FANOUT_MIN_SAMPLES,
+                 min_confidence=FANOUT_MIN_CONFIDENCE, explore_rate=FANOUT_EXPLORE_RATE,
+                 hedge_seconds=FANOUT_HEDGE_SECONDS, max_error_rate=FANOUT_MAX_ERROR_RATE,
+                 accept_score=FANOUT_ACCEPT_SCORE, seed=None):
+        self.policy = policy if policy is not None else parse_policy(os.getenv("FANOUT_POLICY"))
+        self.wins = wins if wins is not None else WinTracker()
+        self.latency = latency if latency is not None else LatencyTracker()
+        self.min_samples = min_samples
+        self.min_confidence = min_confidence
+        self.explore_rate = explore_rate
+        self.hedge_seconds = hedge_seconds
+        self.max_error_rate = max_error_rate
+        self.accept_score = accept_score
+        self._random = random.Random(seed)
+
+    def mode_for(self, intent):
+        return self.policy.get(intent, "all")
+
+    # Providers ordered by win rate, with whether the leader is trusted
+    def ranked(self, intent, providers):
+        rates = {provider: self.wins.win_rate(intent, provider) for provider in providers}
+        ranked = sorted(providers, key=lambda provider: rates[provider][0], reverse=True)
+        rate, contests = rates[ranked[0]]
+        return ranked, contests >= self.min_samples and rate >= self.min_confidence
+
+    # Healthy providers first, then by median latency; a provider without
+    # samples yet counts as fastest so it gets measured
+    def fastest(self, intent, providers, metric):
+        def speed(provider):
+            median = self.latency.quantile(provider, intent, metric, 0.5)
+            healthy = self.latency.error_rate(provider) <= self.max_error_rate
+            return (not healthy, median or 0.0)
+        return sorted(providers, key=speed)
+
+    # streaming picks which latency hedging is measured by: time to first
+    # token when answers stream, total time when they don't
+    def plan(self, intent, providers, streaming=True):
+        providers = list(providers)
+        mode = self.mode_for(intent)
+        if mode == "all" or len(providers) < 2:
+            return FanOutPlan(mode, providers, reason="policy" if mode == "all" else "only provider")
+
+        if mode == "hedged":
+            metric = "ttft" if streaming else "total"
+            ranked = self.fastest(intent, providers, metric)
+            p95 = self.latency.quantile(ranked[0], intent, metric, 0.95)
+            return FanOutPlan(mode, ranked[:1], ranked[1:], self.hedge_seconds if p95 is None else p95,
+                              reason=f"fastest, hedge at {metric} p95" if p95 is not None else "fastest")
+
+        ranked, confident = self.ranked(intent, providers)
+        if not confident:
+            return FanOutPlan("all", providers, reason="learning")
+        if self._random.random() < self.explore_rate:
+            return FanOutPlan("all", providers, reason="explore")
+        return FanOutPlan(mode, ranked[:1], ranked[1:], reason="likely winner")
+
+    def record(self, intent, winner, contenders):
+        self.wins.record(intent, winner, list(contenders))
+
+    def observe(self, intent, calls):
+        self.latency.observe(intent, calls)
+
+    # Whether a hedged turn can stop at this answer
+    def acceptable(self, score):
+        return score >= self.accept_score
@@ -0,0 +1,207 @@
+import collections
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+
+from telemetry import get_metrics
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Worker threads shared by every session; each runs one job at a time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# Finished jobs nobody collected (the session went away) are dropped after this long
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "600"))
+# Queue waits kept for the p50/p95 shown in the sidebar
+JOB_WAIT_WINDOW = 200
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# One unit of work and its state: queued, running, then done, failed or
+# cancelled. The worker publishes partial output through progress and
+# non-fatal problems through notices; both are read by the session polling it.
+class Job:
+    def __init__(self, fn, args, session_id=None, priority=0, label=""):
+        self.id = uuid.uuid4().hex[:12]
+        self.fn = fn
+        self.args = args
+        self.session_id = session_id
+        self.priority = priority
+        self.label = label
+        self.state = QUEUED
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.notices = []
+        self._cancelled = threading.Event()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    # Called by the job between steps; ends it if cancel() was requested
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise JobCancelled(self.id)
+
+    def wait_seconds(self):
+        return (self.started_at or time.monotonic()) - self.submitted_at
+
+
+# Process-wide job queue with a fixed worker pool. Lower priority values
+# run first. Jobs with the same session_id run one at a time in submission
+# order (a follow-up needs the answer before it), so only the head of each
+# session's line competes on priority.
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, result_ttl=JOB_RESULT_TTL_SECONDS, registry=None):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.registry = registry or get_metrics()
+        self.running = 0
+        self._jobs = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._lines = {}
+        self._waits = collections.deque(maxlen=JOB_WAIT_WINDOW)
+        self._cond = threading.Condition()
+        for index in range(workers):
+            threading.Thread(target=self._work, daemon=True, name=f"job-worker-{index}").start()
+
+    # Queue fn(job, *args); returns the Job to poll
+    def submit(self, fn, *args, session_id=None, priority=0, label=""):
+        job = Job(fn, args, session_id, priority, label)
+        with self._cond:
+            self._prune()
+            self._jobs[job.id] = job
+            if session_id is None:
+                self._push(job)
+            else:
+                line = self._lines.setdefault(session_id, collections.deque())
+                line.append(job)
+                if len(line) == 1:
+                    self._push(job)
+            self._cond.notify()
+        self.registry.inc("jobs_submitted_total", priority=priority)
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    # A queued job is cancelled at once; a running one stops at its next
+    # check_cancelled()
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return
+            job._cancelled.set()
+            if job.state == QUEUED:
+                self._finish(job, CANCELLED)
+        print(f"🛑 Cancelled job {job_id}")
+
+    def cancel_session(self, session_id):
+        with self._cond:
+            job_ids = [job.id for job in self._jobs.values() if job.session_id == session_id]
+        for job_id in job_ids:
+            self.cancel(job_id)
+
+    # Drop a finished job once its session has collected the result
+    def forget(self, job_id):
+        with self._cond:
+            self._jobs.pop(job_id, None)
+
+    # Queued jobs that will run before this one
+    def position(self, job):
+        with self._cond:
+            return sum(
+                1 for other in self._jobs.values()
+                if other.state == QUEUED and (other.priority, other.submitted_at) < (job.priority, job.submitted_at)
+            )
+
+    def stats(self):
+        with self._cond:
+            queued = [job for job in self._jobs.values() if job.state == QUEUED]
+            waits = sorted(self._waits)
+            running = self.running
+        quantile = lambda q: waits[min(len(waits) - 1, int(q * len(waits)))] if waits else None
+        return {
+            "queued": len(queued),
+            "running": running,
+            "workers": self.workers,
+            "oldest_wait": max((job.wait_seconds() for job in queued), default=0.0),
+            "wait_p50": quantile(0.5),
+            "wait_p95": quantile(0.95),
+        }
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.priority, next(self._counter), job))
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished_at = time.monotonic()
+        self.registry.inc("jobs_total", state=state)
+        line = self._lines.get(job.session_id)
+        if line and line[0] is job:
+            line.popleft()
+            if line:
+                self._push(line[0])
+            else:
+                del self._lines[job.session_id]
+        elif line and job in line:
+            line.remove(job)
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.result_ttl
+        for job_id in [job.id for job in self._jobs.values() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _next(self):
+        with self._cond:
+            while True:
+                while not self._heap:
+                    self._cond.wait()
+                job = heapq.heappop(self._heap)[2]
+                if job.state != QUEUED:
+                    continue
+                job.state = RUNNING
+                job.started_at = time.monotonic()
+                self.running += 1
+                self._waits.append(job.wait_seconds())
+                self.registry.observe("job_wait_seconds", job.wait_seconds())
+                return job
+
+    def _work(self):
+        while True:
+            job = self._next()
+            state = DONE
+            try:
+                job.check_cancelled()
+                job.result = job.fn(job, *job.args)
+            except JobCancelled:
+                state = CANCELLED
+            except Exception as e:
+                job.error = e
+                state = FAILED
+                print(f"❌ Job {job.id} failed: {str(e)}")
+            with self._cond:
+                self.running -= 1
+                self._finish(job, state)
+                self._cond.notify_all()
+            self.registry.observe("job_run_seconds", job.finished_at - job.started_at)
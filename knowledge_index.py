@@ -0,0 +1,227 @@
+import difflib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from report_parser import REGIONS
+from scoring import detect_competitor_query
+
+# Shown as the "provider" of answers served from the index
+KNOWLEDGE_INDEX = "Index"
+
+KNOWLEDGE_DB_PATH = os.getenv("KNOWLEDGE_DB_PATH", os.path.join(".cache", "knowledge.sqlite3"))
+# Names at least this similar (after normalization) are the same company
+KNOWLEDGE_NAME_SIMILARITY = float(os.getenv("KNOWLEDGE_NAME_SIMILARITY", "0.88"))
+
+# Legal-form words that don't tell companies apart
+NAME_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited", "llc", "plc",
+    "ag", "sa", "se", "nv", "bv", "gmbh", "spa", "ab", "asa", "oyj", "kk", "group", "holdings", "holding",
+}
+
+# Where the target company sits in a competitor question
+TARGET_PATTERNS = [
+    re.compile(r"\b(?:competitors?|rivals?|competition|alternatives?|peers|competitor\s+analysis)"
+               r"\s+(?:of|to|for)\s+(?P<target>.+)", re.I),
+    re.compile(r"\b(?:compet\w*\s+(?:with|against)|companies\s+like|similar\s+(?:companies\s+)?to)\s+(?P<target>.+)",
+               re.I),
+    re.compile(r"^(?:(?:who|what)\s+are\s+|which\s+of\s+|list\s+|show\s+me\s+|give\s+me\s+)?(?:the\s+)?(?P<target>.+?)(?:'s|’s)?"
+               r"\s+(?:(?:main|top|biggest|key|major)\s+)*(?:competitors|rivals|competition|peers|alternatives)\b",
+               re.I),
+]
+# Trailing scope ("in Europe and Asia", "globally") that isn't part of the name
+TARGET_TAIL_RE = re.compile(r"\s+(?:in|across|around|globally|worldwide|world-wide)\b.*$|[?.!]+$", re.I)
+
+SHARED_RE = re.compile(r"\b(?:shared|in common|common|both|overlap\w*|each of)\b", re.I)
+# "those", "them" etc.: the question is about the previous answer's company
+REFERENCE_RE = re.compile(r"\b(?:those|these|them|they|their|its|it)\b", re.I)
+# "which of those", "list them" etc.: the question picks from the previous
+# answer's competitors, so it needs no competitor keyword of its own
+PICK_RE = re.compile(r"\b(?:(?:which|what) (?:of|among) (?:those|these|them)|(?:list|show|name) (?:those|these|them))\b", re.I)
+
+
+def normalize_name(name):
+    name = re.sub(r"['’]s\b", "", name.lower())
+    words = re.findall(r"[a-z0-9&]+", name)
+    while len(words) > 1 and words[-1] in NAME_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def extract_target(query):
+    for pattern in TARGET_PATTERNS:
+        match = pattern.search(query.strip())
+        if match:
+            target = TARGET_TAIL_RE.sub("", match.group("target").strip()).strip(" ,")
+            target = re.sub(r"^the\s+|['’]s$", "", target, flags=re.I).strip()
+            if target and normalize_name(target):
+                return target
+    return None
+
+
+def mentioned_region(query):
+    text = query.lower()
+    for name, aliases in REGIONS:
+        if any(re.search(rf"\b{re.escape(alias)}\b", text) for alias in aliases):
+            return name
+    return None
+
+
+# Competitors extracted from every report the app has produced, by target
+# company. Names are deduplicated fuzzily ("Volkswagen AG" and "Volkswagen"
+# are one record) and the whole index lives in memory in front of SQLite, so
+# region and overlap questions are answered without calling a model.
+class KnowledgeIndex:
+    def __init__(self, path=KNOWLEDGE_DB_PATH, similarity=KNOWLEDGE_NAME_SIMILARITY):
+        self.similarity = similarity
+        self.hits = 0
+        self._lock = threading.Lock()
+        # target key -> {"name": display name, "competitors": {name key -> record}}
+        self._targets = {}
+        self._db = None
+        if path:
+            if path != ":memory:" and os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS competitors ("
+                " target_key TEXT, target TEXT, name_key TEXT, name TEXT, country TEXT, region TEXT,"
+                " description TEXT, provider TEXT, updated_at REAL, PRIMARY KEY (target_key, name_key))"
+            )
+            self._db.commit()
+            for row in self._db.execute("SELECT * FROM competitors"):
+                target_key, target, name_key = row[:3]
+                entry = self._targets.setdefault(target_key, {"name": target, "competitors": {}})
+                entry["competitors"][name_key] = dict(zip(
+                    ("name", "country", "region", "description", "provider", "updated_at"), row[3:]
+                ))
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(entry["competitors"]) for entry in self._targets.values())
+
+    def _match_name(self, competitors, name_key):
+        if name_key in competitors:
+            return name_key
+        close = difflib.get_close_matches(name_key, list(competitors), n=1, cutoff=self.similarity)
+        return close[0] if close else None
+
+    # Add a report's competitors (report_parser.Competitor) for target. A
+    # competitor already on record keeps its first name and takes the
+    # newer details.
+    def add(self, target, competitors, provider=""):
+        target_key = normalize_name(target)
+        if not target_key:
+            return 0
+        now = time.time()
+        rows = []
+        with self._lock:
+            entry = self._targets.setdefault(target_key, {"name": target, "competitors": {}})
+            for competitor in competitors:
+                name_key = normalize_name(competitor.name)
+                if not name_key or name_key == target_key:
+                    continue
+                name_key = self._match_name(entry["competitors"], name_key) or name_key
+                previous = entry["competitors"].get(name_key)
+                record = {
+                    "name": previous["name"] if previous else competitor.name,
+                    "country": competitor.country,
+                    "region": competitor.region or (previous or {}).get("region", ""),
+                    "description": competitor.description,
+                    "provider": provider,
+                    "updated_at": now,
+                }
+                entry["competitors"][name_key] = record
+                rows.append((target_key, entry["name"], name_key, record["name"], record["country"],
+                             record["region"], record["description"], provider, now))
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO competitors VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                self._db.commit()
+        return len(rows)
+
+    def competitors(self, target):
+        with self._lock:
+            entry = self._targets.get(normalize_name(target))
+            return dict(entry["competitors"]) if entry else {}
+
+    # Indexed targets named in the query, in order of appearance
+    def mentioned_targets(self, query):
+        text = " " + normalize_name(query) + " "
+        with self._lock:
+            found = [(text.find(f" {key} "), entry["name"]) for key, entry in self._targets.items()
+                     if f" {key} " in text]
+        return [name for _, name in sorted(found)]
+
+    # The indexed company the latest of questions (oldest first) asked about
+    def last_target(self, questions):
+        for question in reversed(questions):
+            targets = self.mentioned_targets(question)
+            if targets:
+                return targets[0]
+        return None
+
+    # Markdown answer from the index, or None when the question isn't one
+    # the index can settle (then the models are asked as usual). Only
+    # questions about competitors qualify: "Tesla's revenue in Europe" names
+    # a company and a region too. context_target is the company the
+    # conversation was last about; a follow-up picking from its competitors
+    # ("Which of those are in Germany?") qualifies as well.
+    def answer(self, query, context_target=None):
+        targets = self.mentioned_targets(query)
+        picks = not targets and context_target and PICK_RE.search(query)
+        if not (picks or detect_competitor_query(query)):
+            return None
+        if not targets and context_target and REFERENCE_RE.search(query):
+            targets = [context_target] if self.competitors(context_target) else []
+        if not targets:
+            return None
+
+        if len(targets) >= 2 and SHARED_RE.search(query):
+            answer = self._shared(targets)
+        else:
+            answer = self._filtered(targets[0], query)
+        if answer is not None:
+            self.hits += 1
+        return answer
+
+    def _shared(self, targets):
+        keyed = [self.competitors(target) for target in targets]
+        common = set(keyed[0]).intersection(*keyed[1:])
+        if not common:
+            return None
+        names = " and ".join(f"**{target}**" for target in targets)
+        lines = [f"Competitors shared by {names}, from earlier reports:", ""]
+        lines += [format_record(keyed[0][key]) for key in sorted(common)]
+        return "\n".join(lines)
+
+    def _filtered(self, target, query):
+        records = self.competitors(target)
+        region = mentioned_region(query)
+        countries = {r["country"] for r in records.values() if r["country"]}
+        country = next((c for c in sorted(countries, key=len, reverse=True) if mentions_country(query, c)), None)
+        if country:
+            scope, matches = country, [r for r in records.values() if r["country"] == country]
+        elif region:
+            scope, matches = region, [r for r in records.values() if r["region"] == region]
+        else:
+            return None
+        if not matches:
+            return None
+        lines = [f"**{target}**'s competitors in **{scope}**, from earlier reports:", ""]
+        lines += [format_record(record) for record in sorted(matches, key=lambda r: r["name"].lower())]
+        return "\n".join(lines)
+
+
+# Codes like "US" or "UK" must appear in capitals, so "tell us" isn't the US
+def mentions_country(query, country):
+    flags = 0 if country.isupper() else re.I
+    return bool(re.search(rf"\b{re.escape(country)}\b", query, flags))
+
+
+def format_record(record):
+    return f"- **{record['name']} ({record['country']})** – {record['description']}"
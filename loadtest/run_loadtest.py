@@ -0,0 +1,319 @@
+"""Load test: many concurrent Streamlit sessions against a local stub provider.
+
+    python loadtest/run_loadtest.py --sessions 20 --turns 3 --latency 1.0 --tokens-per-second 60
+
+Starts the stub provider (loadtest/stub_provider.py) and `streamlit run
+app.py` pointed at it, then drives N simulated browser sessions over the
+Streamlit websocket protocol. Each session types a query into the chat
+input, which queues it as a job, then reruns the page like the browser's
+poll does until the app has appended the answer (a run with no question
+left in flight). Reports throughput, turn latency percentiles
+and the server's CPU and RSS over time. Linux only (reads /proc).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+from tornado.websocket import websocket_connect  # noqa: E402
+
+from loadtest.stub_provider import StubConfig, serve  # noqa: E402
+
+CHAT_INPUT_LABEL = "Message"
+# Shown next to every question still queued or running
+CANCEL_LABEL = "✖️ Cancel"
+# How often a session with a question in flight reruns, like app.JOB_POLL_SECONDS
+POLL_SECONDS = 0.25
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+# Samples CPU% and RSS of one process from /proc at a fixed interval
+class ResourceSampler(threading.Thread):
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._ticks = os.sysconf("SC_CLK_TCK")
+
+    def _cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def _rss_mib(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    def run(self):
+        started = time.monotonic()
+        last_wall, last_cpu = started, self._cpu_seconds()
+        while not self._stop.wait(self.interval):
+            try:
+                wall, cpu = time.monotonic(), self._cpu_seconds()
+                rss = self._rss_mib()
+            except FileNotFoundError:
+                return
+            self.samples.append({
+                "t": round(wall - started, 2),
+                "cpu_percent": round((cpu - last_cpu) / (wall - last_wall) * 100, 1),
+                "rss_mib": round(rss, 1),
+            })
+            last_wall, last_cpu = wall, cpu
+
+    def stop(self):
+        self._stop.set()
+
+
+# One simulated browser tab speaking the Streamlit websocket protocol
+class SimulatedSession:
+    def __init__(self, url, name):
+        self.url = url
+        self.name = name
+        self.ws = None
+        self.page_script_hash = ""
+        self.input_id = None
+        self.in_flight = 0
+        self._cache = {}
+
+    async def connect(self):
+        self.ws = await websocket_connect(self.url, max_message_size=256 * 1024 * 1024)
+        await self._rerun([])
+        await self._wait_for_run()
+
+    async def _rerun(self, widget_states):
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = self.page_script_hash
+        msg.rerun_script.widget_states.widgets.extend(widget_states)
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+
+    # Read messages until a script run finishes; returns the chat input id
+    # seen during that run (None if the run was interrupted for a rerun)
+    async def _wait_for_run(self):
+        seen_input = None
+        in_flight = 0
+        while True:
+            raw = await self.ws.read_message()
+            if raw is None:
+                raise ConnectionError(f"{self.name}: websocket closed")
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            if msg.hash:
+                self._cache[msg.hash] = msg
+            if msg.WhichOneof("type") == "ref_hash":
+                msg = self._cache.get(msg.ref_hash, msg)
+
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.page_script_hash = msg.new_session.page_script_hash
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                if element.WhichOneof("type") == "text_input" and element.text_input.label == CHAT_INPUT_LABEL:
+                    seen_input = element.text_input.id
+                elif element.WhichOneof("type") == "button" and element.button.label == CANCEL_LABEL:
+                    in_flight += 1
+            elif kind == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY:
+                    if seen_input:
+                        self.input_id = seen_input
+                        self.in_flight = in_flight
+                    return seen_input
+                if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError(f"{self.name}: app failed to compile")
+
+    # Submit a query, wait for the run that renders a new (cleared) input,
+    # then poll until no question is in flight, i.e. the answer has been
+    # appended to the history
+    async def ask(self, query):
+        submitted_id = self.input_id
+        state = BackMsg().rerun_script.widget_states.widgets.add()
+        state.id = submitted_id
+        state.string_value = query
+        started = time.monotonic()
+        await self._rerun([state])
+        while True:
+            input_id = await self._wait_for_run()
+            if input_id and input_id != submitted_id:
+                break
+        while self.in_flight:
+            await asyncio.sleep(POLL_SECONDS)
+            await self._rerun([])
+            await self._wait_for_run()
+        return time.monotonic() - started
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+
+async def run_session(index, url, args, results):
+    session = SimulatedSession(url, f"session-{index}")
+    await asyncio.sleep(index * args.ramp_up / max(args.sessions, 1))
+    try:
+        await session.connect()
+        for turn in range(args.turns):
+            query = f"What are the competitors of Company{index}x{turn}?"
+            try:
+                latency = await asyncio.wait_for(session.ask(query), args.turn_timeout)
+                results["latencies"].append(latency)
+            except asyncio.TimeoutError:
+                results["timeouts"] += 1
+                break
+            await asyncio.sleep(args.think_time)
+    except Exception as e:
+        results["errors"].append(f"{session.name}: {e}")
+    finally:
+        session.close()
+
+
+def wait_for_health(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.3)
+    raise TimeoutError(f"{url} not healthy after {timeout}s")
+
+
+# Every SQLite store the app keeps, by the variable that sets its path. A
+# run keeps them all in its workdir, so it starts cold and leaves .cache alone.
+APP_DB_PATHS = {
+    "RESPONSE_CACHE_PATH": "responses.sqlite3",
+    "FANOUT_STATS_PATH": "fanout.sqlite3",
+    "KNOWLEDGE_DB_PATH": "knowledge.sqlite3",
+    "CONVERSATION_DB_PATH": "conversations.sqlite3",
+    "WATCHLIST_DB_PATH": "watchlist.sqlite3",
+    "EVIDENCE_DB_PATH": "web.sqlite3",
+}
+
+
+def start_app(args, stub_port, workdir):
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="stub",
+        GOOGLE_API_KEY="stub",
+        OPENAI_API_BASE=f"http://127.0.0.1:{stub_port}/v1",
+        GEMINI_API_ENDPOINT=f"http://127.0.0.1:{stub_port}",
+    )
+    env.update({variable: os.path.join(workdir, name) for variable, name in APP_DB_PATHS.items()})
+    command = [
+        sys.executable, "-m", "streamlit", "run", os.path.join(ROOT, "app.py"),
+        "--server.headless=true", f"--server.port={args.app_port}",
+        "--browser.gatherUsageStats=false", "--server.fileWatcherType=none",
+    ]
+    log = open(os.path.join(workdir, "streamlit.log"), "w")
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test app.py with simulated sessions and a stub provider.")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=3, help="queries per session")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which sessions connect")
+    parser.add_argument("--think-time", type=float, default=1.0, help="pause between a session's turns")
+    parser.add_argument("--turn-timeout", type=float, default=180.0)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--response-bytes", type=int, default=6000)
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--app-port", type=int, default=8599)
+    parser.add_argument("--json", help="write the summary and resource timeseries to this file")
+    args = parser.parse_args(argv)
+
+    stub_config = StubConfig(args.latency, args.tokens_per_second, args.error_rate, args.response_bytes)
+    stub = serve(args.stub_port, stub_config)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    app = start_app(args, args.stub_port, workdir)
+    sampler = None
+    results = {"latencies": [], "timeouts": 0, "errors": []}
+    try:
+        wait_for_health(f"http://127.0.0.1:{args.app_port}/_stcore/health")
+        print(f"🚀 App up (pid {app.pid}); {args.sessions} sessions × {args.turns} turns")
+        sampler = ResourceSampler(app.pid)
+        sampler.start()
+
+        url = f"ws://127.0.0.1:{args.app_port}/_stcore/stream"
+        started = time.monotonic()
+
+        async def drive():
+            await asyncio.gather(*(run_session(i, url, args, results) for i in range(args.sessions)))
+        asyncio.run(drive())
+        elapsed = time.monotonic() - started
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        app.terminate()
+        app.wait(timeout=10)
+        stub.shutdown()
+
+    latencies = results["latencies"]
+    samples = sampler.samples if sampler else []
+    cpu = [s["cpu_percent"] for s in samples]
+    rss = [s["rss_mib"] for s in samples]
+    summary = {
+        "sessions": args.sessions,
+        "turns_completed": len(latencies),
+        "turns_planned": args.sessions * args.turns,
+        "timeouts": results["timeouts"],
+        "errors": results["errors"],
+        "elapsed_s": round(elapsed, 2),
+        "throughput_turns_per_min": round(len(latencies) / elapsed * 60, 2) if elapsed else 0.0,
+        "latency_s": {p: (round(percentile(latencies, int(p[1:])), 3) if latencies else None)
+                      for p in ("p50", "p95", "p99")},
+        "latency_max_s": round(max(latencies), 3) if latencies else None,
+        "server_cpu_percent": {"mean": round(sum(cpu) / len(cpu), 1) if cpu else None,
+                               "max": max(cpu) if cpu else None},
+        "server_rss_mib": {"start": rss[0] if rss else None, "max": max(rss) if rss else None,
+                           "end": rss[-1] if rss else None},
+        "stub_requests": stub_config.requests,
+        "stub_errors": stub_config.errors,
+    }
+
+    print(f"✅ {summary['turns_completed']}/{summary['turns_planned']} turns in {summary['elapsed_s']}s "
+          f"→ {summary['throughput_turns_per_min']} turns/min")
+    print(f"⏱️ turn latency p50 {summary['latency_s']['p50']}s · p95 {summary['latency_s']['p95']}s · "
+          f"p99 {summary['latency_s']['p99']}s · max {summary['latency_max_s']}s")
+    print(f"🖥️ server CPU mean {summary['server_cpu_percent']['mean']}% · max {summary['server_cpu_percent']['max']}% · "
+          f"RSS {summary['server_rss_mib']['start']} → {summary['server_rss_mib']['max']} MiB (max)")
+    if results["timeouts"] or results["errors"]:
+        print(f"❌ {results['timeouts']} timeouts, {len(results['errors'])} errors: {results['errors'][:3]}")
+    print(f"📄 Streamlit log: {os.path.join(workdir, 'streamlit.log')}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "resources": samples, "latencies": latencies}, f, indent=2)
+    return 0 if latencies and not results["errors"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
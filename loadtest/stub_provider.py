@@ -0,0 +1,202 @@
+"""Local stand-in for the OpenAI and Gemini APIs.
+
+    python loadtest/stub_provider.py --port 8765 --latency 0.8 --tokens-per-second 60 --error-rate 0.02
+
+Serves OpenAI-compatible /v1/chat/completions (plain and SSE streaming) and
+Gemini REST :generateContent / :streamGenerateContent, answering every
+request with a deterministic competitor report after a configurable time to
+first token, token rate and error rate. Point the app at it with
+OPENAI_API_BASE=http://127.0.0.1:8765/v1 and
+GEMINI_API_ENDPOINT=http://127.0.0.1:8765.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_pipeline import make_report  # noqa: E402
+
+# Streamed tokens are flushed in batches at most this often
+FLUSH_INTERVAL = 0.05
+
+
+class StubConfig:
+    def __init__(self, latency=0.5, tokens_per_second=80.0, error_rate=0.0, response_bytes=6000, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.response_bytes = response_bytes
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+
+def report_tokens(prompt, size):
+    text = make_report(size, seed=zlib.crc32(prompt.encode("utf-8")))
+    words = text.split(" ")
+    return [word + " " for word in words[:-1]] + words[-1:]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        data = data.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # Yield batches of tokens paced at the configured rate
+    def _paced(self, tokens):
+        time.sleep(self.config.latency)
+        started = time.monotonic()
+        sent = 0
+        while sent < len(tokens):
+            time.sleep(FLUSH_INTERVAL)
+            due = min(len(tokens), int((time.monotonic() - started) * self.config.tokens_per_second) + 1)
+            if due > sent:
+                yield "".join(tokens[sent:due])
+                sent = due
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"requests": self.config.requests, "errors": self.config.errors})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = self._read_json()
+        if "/chat/completions" in self.path:
+            prompt = json.dumps(body.get("messages", []))
+            self._openai(body, report_tokens(prompt, self.config.response_bytes))
+        elif ":generateContent" in self.path or ":streamGenerateContent" in self.path:
+            prompt = json.dumps(body.get("contents", []))
+            self._gemini(":streamGenerateContent" in self.path, report_tokens(prompt, self.config.response_bytes))
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _openai(self, body, tokens):
+        if self.config.should_fail():
+            self._send_json(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests",
+                                            "code": "rate_limit_exceeded"}})
+            return
+        model = body.get("model", "gpt-4o")
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": model}
+        if not body.get("stream"):
+            time.sleep(self.config.latency + len(tokens) / self.config.tokens_per_second)
+            # n choices, as best-of-N sampling asks for
+            choices = body.get("n") or 1
+            self._send_json(200, dict(base, object="chat.completion", choices=[{
+                "index": index, "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop"} for index in range(choices)], usage={
+                "prompt_tokens": 1000, "completion_tokens": choices * len(tokens),
+                "total_tokens": 1000 + choices * len(tokens)}))
+            return
+
+        self._start_chunked("text/event-stream")
+        for text in self._paced(tokens):
+            chunk = dict(base, object="chat.completion.chunk", choices=[{
+                "index": 0, "delta": {"content": text}, "finish_reason": None}])
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+        done = dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        self._write_chunk(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n")
+        self._end_chunked()
+
+    def _gemini(self, stream, tokens):
+        if self.config.should_fail():
+            self._send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted (stub)",
+                                            "status": "RESOURCE_EXHAUSTED"}})
+            return
+
+        def candidate(text, finished):
+            payload = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+            if finished:
+                payload["candidates"][0]["finishReason"] = "STOP"
+                payload["usageMetadata"] = {"promptTokenCount": 1000, "candidatesTokenCount": len(tokens),
+                                            "totalTokenCount": 1000 + len(tokens)}
+            return payload
+
+        if not stream:
+            time.sleep(self.config.latency + len(tokens) / self.config.tokens_per_second)
+            self._send_json(200, candidate("".join(tokens), True))
+            return
+
+        # The REST client reads a streamed JSON array
+        self._start_chunked("application/json")
+        self._write_chunk("[")
+        first = True
+        for text in self._paced(tokens):
+            self._write_chunk(("" if first else ",\n") + json.dumps(candidate(text, False)))
+            first = False
+        self._write_chunk(("" if first else ",\n") + json.dumps(candidate("", True)) + "]")
+        self._end_chunked()
+
+
+def serve(port=8765, config=None, host="127.0.0.1"):
+    StubHandler.config = config or StubConfig()
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI/Gemini-compatible stub provider for load tests.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--response-bytes", type=int, default=6000, help="size of each generated report")
+    args = parser.parse_args(argv)
+
+    server = serve(args.port, StubConfig(args.latency, args.tokens_per_second, args.error_rate, args.response_bytes))
+    print(f"🧪 Stub provider on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+
+from langchain.memory import ConversationBufferMemory
+
+from tokens import count_tokens, truncate_tokens
+
+# Token budget for the {history} sent with every prompt, per session and
+# per provider. Override with HISTORY_TOKEN_BUDGET.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
+
+
+# ConversationBufferMemory that keeps only the most recent turns fitting in
+# max_token_limit. Whole turns (user + AI message) are dropped oldest first;
+# if the newest turn alone is over budget its answer is truncated, so a
+# follow-up still sees the start of the last report.
+class TokenWindowMemory(ConversationBufferMemory):
+    max_token_limit: int = HISTORY_TOKEN_BUDGET
+    # Model whose tokenizer counts the messages (see tokens.count_tokens)
+    tokenizer_model: str = ""
+
+    def save_context(self, inputs, outputs):
+        super().save_context(inputs, outputs)
+        self.prune()
+
+    def prune(self):
+        messages = self.chat_memory.messages
+        total = sum(count_tokens(m.content, self.tokenizer_model) for m in messages)
+
+        while total > self.max_token_limit and len(messages) > 2:
+            for dropped in messages[:2]:
+                total -= count_tokens(dropped.content, self.tokenizer_model)
+            del messages[:2]
+
+        if total > self.max_token_limit and messages:
+            last = messages[-1]
+            keep_tokens = (count_tokens(last.content, self.tokenizer_model) - (total - self.max_token_limit)
+                           - count_tokens(" …", self.tokenizer_model))
+            last.content = truncate_tokens(last.content, keep_tokens, self.tokenizer_model) + " …"
+
+    def token_count(self):
+        return sum(count_tokens(m.content, self.tokenizer_model) for m in self.chat_memory.messages)
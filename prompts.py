@@ -0,0 +1,163 @@
+from langchain_core.prompts import PromptTemplate
+
+# Prompt sections. ENHANCED_PROMPT is the full original prompt; the
+# per-intent templates below reuse its sections so a routed query only
+# carries the instructions it needs.
+ASSISTANT_INTRO = """You are an expert AI assistant with deep knowledge across all domains. Your responses should be comprehensive, well-structured, and highly informative.
+
+"""
+
+RESPONSE_GUIDELINES_HEADER = """**RESPONSE GUIDELINES:**
+
+"""
+
+COMPETITOR_GUIDELINES = """**For Competitor Analysis Queries:**
+When a user asks about competitors of any company, provide an extremely detailed and comprehensive analysis following this EXACT structure:
+
+1. **Introduction (2-3 sentences):** Briefly introduce the company and the competitive landscape overview.
+
+2. **Regional Analysis:** Organize competitors by these geographical regions:
+   - **North America** (US, Canada, Mexico)
+   - **Europe** (EU countries, UK, Norway, Switzerland, etc.)
+   - **Asia-Pacific** (China, Japan, India, South Korea, Australia, Southeast Asia)
+   - **Middle East & North Africa** (UAE, Saudi Arabia, Israel, Egypt, etc.)
+   - **Latin America** (Brazil, Argentina, Chile, Colombia, etc.)
+   - **Sub-Saharan Africa** (South Africa, Nigeria, Kenya, etc.)
+   - **Russia & CIS** (Russia, Kazakhstan, Ukraine, etc.)
+
+3. **Format for each region:**
+   ```
+   ## [Region Name]
+   [2-3 sentence description of the competitive landscape in this region, market characteristics, and key trends]
+   
+   - **[Company Name] ([Country])** – [Detailed description of company focus, specialties, market position, key products/services, and competitive advantages. Include revenue size if known (small/medium/large), founding year, and any notable achievements or market share information]
+   - **[Next company]** – [Similar detailed description]
+   ```
+
+4. **For regions with no competitors:** Still include the region header and state: "No significant competitors identified in this region based on current market analysis."
+
+5. **Conclusion (2-3 sentences):** Summarize the global competitive landscape and key market dynamics.
+
+"""
+
+GENERAL_GUIDELINES = """**For General Queries:**
+Provide comprehensive, well-researched responses with:
+- Clear structure with logical flow
+- Detailed explanations with context
+- Multiple perspectives when relevant
+- Practical examples and applications
+- Current industry insights when applicable
+- Professional yet conversational tone
+
+"""
+
+QUALITY_STANDARDS = """**QUALITY STANDARDS:**
+- Use specific details, numbers, and facts whenever possible
+- Include recent developments and market trends
+- Explain technical concepts clearly
+- Provide actionable insights
+- Maintain accuracy and cite general knowledge appropriately
+- Use professional language with appropriate technical terminology
+- Elaborate on subtopics and provide comprehensive coverage of all aspects
+
+"""
+
+CONVERSATION_FOOTER = """**Conversation History:** {history}
+
+**User Query:** {input}
+
+**Your Response:**"""
+
+COMPARISON_GUIDELINES = """**For Company Comparisons:**
+Compare the companies side by side:
+
+1. **Overview (2-3 sentences):** What each company does and why they are compared.
+
+2. **Comparison by dimension:** Use a `## [Dimension]` header for each of business model, products and services, market position and share, geographic footprint, financial scale, and strategy. Give each company a short, specific paragraph.
+
+3. **Strengths and weaknesses:** A bullet list per company.
+
+4. **Verdict (2-3 sentences):** Where each company leads and what to watch.
+
+"""
+
+FOLLOWUP_GUIDELINES = """**For Follow-up Questions:**
+Answer only what the follow-up asks, using the conversation history for context. Keep the structure and format of your earlier answer where it applies, and don't repeat parts that are unchanged.
+
+"""
+
+# Enhanced prompt with detailed competitor-analysis instructions
+ENHANCED_PROMPT = (
+    ASSISTANT_INTRO + RESPONSE_GUIDELINES_HEADER + COMPETITOR_GUIDELINES
+    + GENERAL_GUIDELINES + QUALITY_STANDARDS + CONVERSATION_FOOTER
+)
+
+EVIDENCE_HEADER = """**Web Evidence:** Recent pages about the company. Prefer these facts where they are relevant and more current than what you know.
+
+"""
+
+# Smaller template per query intent (see router.py)
+INTENT_PROMPTS = {
+    "competitor": ASSISTANT_INTRO + COMPETITOR_GUIDELINES + QUALITY_STANDARDS + CONVERSATION_FOOTER,
+    "comparison": ASSISTANT_INTRO + COMPARISON_GUIDELINES + CONVERSATION_FOOTER,
+    "general": ASSISTANT_INTRO + GENERAL_GUIDELINES + CONVERSATION_FOOTER,
+    "followup": ASSISTANT_INTRO + FOLLOWUP_GUIDELINES + CONVERSATION_FOOTER,
+}
+
+
+# Section templates for region-sharded competitor reports (see
+# sharded_report.py). Each writes one part of the COMPETITOR_GUIDELINES
+# structure on its own, without the header, so the parts can be generated
+# in parallel and assembled.
+REGION_SCOPES = {
+    "North America": "US, Canada, Mexico",
+    "Europe": "EU countries, UK, Norway, Switzerland, etc.",
+    "Asia-Pacific": "China, Japan, India, South Korea, Australia, Southeast Asia",
+    "Middle East & North Africa": "UAE, Saudi Arabia, Israel, Egypt, etc.",
+    "Latin America": "Brazil, Argentina, Chile, Colombia, etc.",
+    "Sub-Saharan Africa": "South Africa, Nigeria, Kenya, etc.",
+    "Russia & CIS": "Russia, Kazakhstan, Ukraine, etc.",
+}
+
+SECTION_INTRO_PROMPT = ASSISTANT_INTRO + """This is the opening of a competitor analysis organized by region. Write only the introduction: 2-3 sentences that briefly introduce the company and give an overview of its competitive landscape. No headers, lists or conclusion.
+
+**User Query:** {input}
+
+**Introduction:**"""
+
+SECTION_REGION_PROMPT = ASSISTANT_INTRO + """This is one regional section of a competitor analysis. Cover only competitors based in **{region}** ({scope}). Do not write the region header or anything about other regions. Use this EXACT format:
+
+[2-3 sentence description of the competitive landscape in this region, market characteristics, and key trends]
+
+- **[Company Name] ([Country])** – [Detailed description of company focus, specialties, market position, key products/services, and competitive advantages. Include revenue size if known (small/medium/large), founding year, and any notable achievements or market share information]
+- **[Next company]** – [Similar detailed description]
+
+If there are no competitors in this region, write only: "No significant competitors identified in this region based on current market analysis."
+
+""" + QUALITY_STANDARDS + """**User Query:** {input}
+
+**{region} section:**"""
+
+SECTION_CONCLUSION_PROMPT = ASSISTANT_INTRO + """This is the closing of a competitor analysis organized by region (North America, Europe, Asia-Pacific, Middle East & North Africa, Latin America, Sub-Saharan Africa, Russia & CIS). Write only the conclusion: 2-3 sentences summarizing the global competitive landscape and key market dynamics. No headers or lists.
+
+**User Query:** {input}
+
+**Conclusion:**"""
+
+
+# The template for an intent; without one, the full ENHANCED_PROMPT
+def get_prompt_template(intent=None):
+    template = INTENT_PROMPTS.get(intent, ENHANCED_PROMPT)
+    return PromptTemplate(input_variables=["input", "history"], template=template)
+
+
+# prompt_template with web evidence (see web_evidence.format_evidence_prompt)
+# ahead of the conversation
+def grounded_template(prompt_template, evidence):
+    if not evidence or CONVERSATION_FOOTER not in prompt_template.template:
+        return prompt_template
+    evidence = evidence.replace("{", "{{").replace("}", "}}")
+    template = prompt_template.template.replace(
+        CONVERSATION_FOOTER, f"{EVIDENCE_HEADER}{evidence}\n\n{CONVERSATION_FOOTER}"
+    )
+    return PromptTemplate(input_variables=["input", "history"], template=template)
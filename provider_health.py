@@ -0,0 +1,184 @@
+import collections
+import os
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# The circuit opens after this many failures in a row, or when more than
+# CIRCUIT_ERROR_RATE of the last CIRCUIT_WINDOW calls failed (once there
+# are at least CIRCUIT_MIN_CALLS of them)
+CIRCUIT_CONSECUTIVE_FAILURES = int(os.getenv("CIRCUIT_CONSECUTIVE_FAILURES", "3"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "4"))
+# How long an open circuit waits before probing; doubles after each failed
+# probe, up to CIRCUIT_MAX_OPEN_SECONDS
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", "300"))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# Rolling health of one provider and its circuit breaker, shared by every
+# session. Closed: calls go through. Open: calls are refused at once until
+# the cool-down ends. Half-open: one probe decides, either a background
+# probe (see set_prober) or, without one, the next real call.
+class ProviderHealth:
+    def __init__(self, llm_name, window=CIRCUIT_WINDOW):
+        self.llm_name = llm_name
+        self.state = CLOSED
+        self.successes = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.consecutive_failures = 0
+        self.last_error = ""
+        self.opened_at = None
+        self.open_seconds = CIRCUIT_OPEN_SECONDS
+        self._outcomes = collections.deque(maxlen=window)
+        self._latencies = collections.deque(maxlen=window)
+        self.trial_started = None
+        self._prober = None
+        self._lock = threading.Lock()
+
+    def set_prober(self, prober):
+        self._prober = prober
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        print(f"🔌 {self.llm_name} circuit open for {self.open_seconds:g}s: {self.last_error[:80]}")
+
+    def _close(self):
+        if self.state != CLOSED:
+            print(f"🔌 {self.llm_name} circuit closed")
+        self.state = CLOSED
+        self.open_seconds = CIRCUIT_OPEN_SECONDS
+        self.consecutive_failures = 0
+        self._outcomes.clear()
+
+    def record_success(self, latency):
+        with self._lock:
+            self.successes += 1
+            self._latencies.append(latency)
+            # Only the half-open trial closes the circuit; a late answer from
+            # a call abandoned before it opened doesn't
+            if self.state == HALF_OPEN:
+                self._close()
+            self.consecutive_failures = 0
+            self._outcomes.append(True)
+
+    def record_failure(self, error="", timeout=False):
+        now = time.monotonic()
+        with self._lock:
+            if timeout:
+                self.timeouts += 1
+            else:
+                self.errors += 1
+            self.last_error = str(error) or ("timeout" if timeout else "error")
+            self.consecutive_failures += 1
+            self._outcomes.append(False)
+            if self.state == HALF_OPEN:
+                self.open_seconds = min(CIRCUIT_MAX_OPEN_SECONDS, self.open_seconds * 2)
+                self._open(now)
+            elif self.state == CLOSED:
+                failed = len(self._outcomes) - sum(self._outcomes)
+                if self.consecutive_failures >= CIRCUIT_CONSECUTIVE_FAILURES or (
+                        len(self._outcomes) >= CIRCUIT_MIN_CALLS
+                        and failed / len(self._outcomes) > CIRCUIT_ERROR_RATE):
+                    self._open(now)
+
+    # Whether a call may go out now. Once an open circuit's cool-down ends,
+    # the prober runs in the background and calls keep being refused until
+    # it succeeds; without a prober, this call is let through as the trial.
+    # A trial that hasn't reported back within the cool-down is replaced.
+    def allow(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self.opened_at < self.open_seconds:
+                return False
+            if self.state == HALF_OPEN and now - self.trial_started < self.open_seconds:
+                return False
+            self.state = HALF_OPEN
+            self.trial_started = now
+            prober = self._prober
+        if prober is None:
+            return True
+        threading.Thread(target=self._probe, args=(prober,), daemon=True,
+                         name=f"probe-{self.llm_name}").start()
+        return False
+
+    # What allow() would answer now, without changing anything: lets callers
+    # skip a provider while leaving the decision to the call itself
+    def would_allow(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self.opened_at < self.open_seconds:
+                return False
+            if self.state == HALF_OPEN and now - self.trial_started < self.open_seconds:
+                return False
+            return self._prober is None
+
+    def _probe(self, prober):
+        started = time.monotonic()
+        try:
+            prober()
+        except Exception as e:
+            self.record_failure(e)
+        else:
+            self.record_success(time.monotonic() - started)
+
+    def retry_in(self):
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def snapshot(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            latencies = sorted(self._latencies)
+            return {
+                "state": self.state,
+                "error_rate": 1 - sum(outcomes) / len(outcomes) if outcomes else 0.0,
+                "recent_calls": len(outcomes),
+                "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+                "successes": self.successes,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "last_error": self.last_error,
+            }
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_health(llm_name):
+    with _health_lock:
+        if llm_name not in _health:
+            _health[llm_name] = ProviderHealth(llm_name)
+        return _health[llm_name]
+
+
+# The names whose circuit lets a call through. Only the call itself asks
+# allow() (see rate_limit.ProviderLimiter.acquire), so a half-open trial
+# isn't used up by this check; a skipped provider's recovery probe is
+# started here once it's due.
+def available_providers(names):
+    available = []
+    for llm_name in names:
+        health = get_health(llm_name)
+        if health.would_allow():
+            available.append(llm_name)
+        else:
+            health.allow()
+    return available
@@ -0,0 +1,118 @@
+import functools
+import os
+import time
+
+from fanout import provider_timeout
+from provider_health import get_health
+from telemetry import record_startup
+
+# Environment variable holding each provider's API key
+PROVIDER_KEYS = {}
+
+# Client factories by provider name. Each imports its SDK on first use, so
+# a provider without a key never costs import time.
+_FACTORIES = {}
+
+# Per-call keyword arguments that cap the completion length, by provider
+_MAX_TOKENS_KWARGS = {}
+
+# Per-call keyword arguments asking for n completions in one request, for
+# providers whose API supports it
+_SAMPLES_KWARGS = {}
+
+
+def register_provider(llm_name, key_env, max_tokens_kwargs=lambda n: {"max_tokens": n}, samples_kwargs=None):
+    def decorator(factory):
+        PROVIDER_KEYS[llm_name] = key_env
+        _FACTORIES[llm_name] = factory
+        _MAX_TOKENS_KWARGS[llm_name] = max_tokens_kwargs
+        if samples_kwargs is not None:
+            _SAMPLES_KWARGS[llm_name] = samples_kwargs
+        return factory
+    return decorator
+
+
+@register_provider("OpenAI", "OPENAI_API_KEY", samples_kwargs=lambda n: {"n": n})
+def _build_openai(api_key):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model_name="gpt-4o",
+        temperature=0.3,
+        openai_api_key=api_key,
+        max_tokens=8000,
+        request_timeout=provider_timeout("OpenAI"),
+        # Retries are handled by rate_limit.ProviderLimiter
+        max_retries=0
+    )
+
+
+@register_provider("Gemini", "GOOGLE_API_KEY",
+                   max_tokens_kwargs=lambda n: {"generation_config": {"max_output_tokens": n}})
+def _build_gemini(api_key):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # GEMINI_API_ENDPOINT points the REST client elsewhere (e.g. the load-test stub)
+    endpoint = os.getenv("GEMINI_API_ENDPOINT")
+    endpoint_options = {"transport": "rest", "client_options": {"api_endpoint": endpoint}} if endpoint else {}
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",  # FIXED: Changed from gemini-2.5-flash
+        temperature=0.3,
+        google_api_key=api_key,
+        timeout=provider_timeout("Gemini"),
+        **endpoint_options
+    )
+
+
+def build_llm(llm_name, api_key):
+    if llm_name not in _FACTORIES:
+        raise ValueError(f"Unknown provider: {llm_name}")
+    return _FACTORIES[llm_name](api_key)
+
+
+# Invocation kwargs (e.g. for LLMChain.llm_kwargs) limiting one call's
+# completion to max_tokens
+def max_tokens_kwargs(llm_name, max_tokens):
+    return _MAX_TOKENS_KWARGS.get(llm_name, lambda n: {"max_tokens": n})(max_tokens)
+
+
+# Tokens a recovery probe asks for; enough for any provider to accept
+PROBE_MAX_TOKENS = 5
+
+
+# Cheapest real request to a provider, to see whether an open circuit can close
+def probe_provider(llm_name, llm):
+    llm.invoke("ping", **max_tokens_kwargs(llm_name, PROBE_MAX_TOKENS))
+
+
+# Invocation kwargs asking for n completions at once, or None when the
+# provider needs one request per completion
+def samples_kwargs(llm_name, n):
+    factory = _SAMPLES_KWARGS.get(llm_name)
+    return factory(n) if factory is not None and n > 1 else None
+
+
+# Build a client for every provider with a key, each registered as its
+# circuit breaker's recovery probe. Safe to call off the script thread:
+# failures are returned instead of shown.
+def build_llms(api_keys):
+    llms = {}
+    errors = {}
+    for llm_name, api_key in api_keys.items():
+        if not api_key:
+            continue
+        try:
+            started = time.monotonic()
+            llms[llm_name] = build_llm(llm_name, api_key)
+            get_health(llm_name).set_prober(functools.partial(probe_provider, llm_name, llms[llm_name]))
+            record_startup(f"{llm_name} client", time.monotonic() - started)
+            print(f"✅ {llm_name} initialized successfully ({time.monotonic() - started:.2f}s)")
+        except Exception as e:
+            errors[llm_name] = str(e)
+            print(f"❌ {llm_name} error: {str(e)}")
+    return llms, errors
+
+
+# Providers whose API key is set in the environment
+def configured_providers():
+    return [llm_name for llm_name, env_var in PROVIDER_KEYS.items() if os.getenv(env_var)]
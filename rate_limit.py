@@ -0,0 +1,241 @@
+import os
+import random
+import threading
+import time
+
+from provider_health import OPEN, CircuitOpenError, get_health
+
+# Default (requests/min, tokens/min) quotas per provider. Override with
+# e.g. OPENAI_RPM / OPENAI_TPM / OPENAI_MAX_CONCURRENCY.
+DEFAULT_LIMITS = {
+    "OpenAI": (500, 450000),
+    "Gemini": (1000, 1000000),
+}
+FALLBACK_LIMITS = (60, 100000)
+DEFAULT_MAX_CONCURRENCY = 32
+
+# Retry with jittered exponential backoff: base * 2^attempt, capped, full jitter
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+# A call this many times slower than the running average counts as congestion
+LATENCY_BACKOFF_FACTOR = 2.0
+
+
+class RateLimitTimeout(TimeoutError):
+    pass
+
+
+def is_rate_limit_error(error):
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status == 429:
+        return True
+    text = str(error).lower()
+    return "429" in text or "rate limit" in text or "resource exhausted" in text or "quota" in text
+
+
+# Throttling, server-side failures and timeouts are worth retrying;
+# bad requests and auth errors are not
+def is_retryable_error(error):
+    if is_rate_limit_error(error) or isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status in (500, 502, 503, 504):
+        return True
+    return type(error).__name__ in (
+        "APITimeoutError", "APIConnectionError", "InternalServerError",
+        "ServiceUnavailable", "DeadlineExceeded",
+    )
+
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+# Token bucket refilled continuously at per_minute / 60 per second. take()
+# reserves immediately (the balance may go negative) and returns how long
+# the caller must wait, which keeps waiters roughly first-come first-served.
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount):
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    # Return unused tokens (positive) or charge extra (negative)
+    def adjust(self, amount):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+# Per-provider limiter shared by every session in the process: request and
+# token buckets, an AIMD concurrency window (grows by ~1 per window of
+# successful calls, halves on 429s, shrinks on latency spikes) and retries.
+# Every call's outcome feeds the provider's health (see provider_health);
+# while its circuit is open, calls fail at once with CircuitOpenError.
+class ProviderLimiter:
+    def __init__(self, llm_name, rpm, tpm, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 initial_concurrency=4, max_retries=MAX_RETRIES):
+        self.llm_name = llm_name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = float(min(initial_concurrency, max_concurrency))
+        self.max_retries = max_retries
+        self.in_flight = 0
+        self.average_latency = None
+        self.throttled = 0
+        self.retries = 0
+        self.health = get_health(llm_name)
+        self._cond = threading.Condition()
+
+    def acquire(self, reserved_tokens=0, deadline=None):
+        if not self.health.allow():
+            raise CircuitOpenError(
+                f"{self.llm_name} is unavailable (circuit open, retry in {self.health.retry_in():.0f}s)"
+            )
+        with self._cond:
+            while self.in_flight >= int(self.concurrency_limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise RateLimitTimeout(f"{self.llm_name}: no free concurrency slot before deadline")
+                self._cond.wait(remaining)
+            self.in_flight += 1
+
+        wait = max(self.requests.take(1), self.tokens.take(reserved_tokens))
+        if deadline is not None and time.monotonic() + wait > deadline:
+            self.requests.adjust(1)
+            self.tokens.adjust(reserved_tokens)
+            self._release_slot()
+            raise RateLimitTimeout(f"{self.llm_name}: quota exhausted until after the deadline")
+        if wait > 0:
+            time.sleep(wait)
+        return time.monotonic()
+
+    def _release_slot(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    # outcome is "ok", "throttled" or "error". used_tokens, when known,
+    # corrects the bucket for what was reserved up front. Throttling is
+    # handled here and doesn't count against the provider's health, and
+    # neither does a call its caller already gave up on (record_health=False),
+    # which was counted as a timeout then.
+    def release(self, started, outcome, reserved_tokens=0, used_tokens=None, error=None, record_health=True):
+        latency = time.monotonic() - started
+        if outcome == "ok" and record_health:
+            self.health.record_success(latency)
+        elif outcome == "error" and record_health:
+            self.health.record_failure(error)
+        if used_tokens is not None:
+            self.tokens.adjust(reserved_tokens - used_tokens)
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "throttled":
+                self.throttled += 1
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            elif outcome == "ok":
+                if self.average_latency and latency > LATENCY_BACKOFF_FACTOR * self.average_latency:
+                    self.concurrency_limit = max(1.0, self.concurrency_limit * 0.9)
+                else:
+                    self.concurrency_limit = min(
+                        float(self.max_concurrency), self.concurrency_limit + 1.0 / self.concurrency_limit
+                    )
+                self.average_latency = latency if self.average_latency is None else (
+                    0.8 * self.average_latency + 0.2 * latency
+                )
+            self._cond.notify_all()
+
+    # Delay before retrying after error, or None if it should be raised
+    # (including when the failures so far have opened the circuit)
+    def retry_delay(self, error, attempt, deadline=None):
+        if not is_retryable_error(error) or attempt >= self.max_retries or self.health.state == OPEN:
+            return None
+        delay = backoff_delay(attempt)
+        if deadline is not None and time.monotonic() + delay > deadline:
+            return None
+        self.retries += 1
+        print(f"🔁 {self.llm_name} retry {attempt + 1} in {delay:.1f}s: {str(error)[:80]}")
+        return delay
+
+    # Release a slot after a failed call. A throttled request was never
+    # served, so its reserved tokens go back to the bucket.
+    def release_failed(self, started, error, reserved_tokens=0, record_health=True):
+        if is_rate_limit_error(error):
+            self.release(started, "throttled", reserved_tokens, used_tokens=0)
+        else:
+            self.release(started, "error", error=error, record_health=record_health)
+
+    # Run fn() under the limits, retrying retryable failures with backoff
+    # until max_retries or the deadline (a time.monotonic() value). Once
+    # abandoned (a threading.Event) is set, the outcome no longer counts
+    # toward the provider's health and failures aren't retried.
+    def call(self, fn, reserved_tokens=0, deadline=None, count_tokens=None, abandoned=None):
+        attempt = 0
+        while True:
+            started = self.acquire(reserved_tokens, deadline)
+            try:
+                result = fn()
+            except Exception as e:
+                given_up = abandoned is not None and abandoned.is_set()
+                self.release_failed(started, e, reserved_tokens, record_health=not given_up)
+                delay = None if given_up else self.retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+
+            used = count_tokens(result) if count_tokens else None
+            self.release(started, "ok", reserved_tokens, used,
+                         record_health=abandoned is None or not abandoned.is_set())
+            return result
+
+    def set_max_concurrency(self, max_concurrency):
+        with self._cond:
+            self.max_concurrency = max_concurrency
+            self.concurrency_limit = min(self.concurrency_limit, float(max_concurrency))
+            self._cond.notify_all()
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "concurrency_limit": round(self.concurrency_limit, 2),
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "average_latency": self.average_latency,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(llm_name):
+    with _limiters_lock:
+        if llm_name not in _limiters:
+            rpm, tpm = DEFAULT_LIMITS.get(llm_name, FALLBACK_LIMITS)
+            prefix = llm_name.upper()
+            _limiters[llm_name] = ProviderLimiter(
+                llm_name,
+                rpm=int(os.getenv(f"{prefix}_RPM", rpm)),
+                tpm=int(os.getenv(f"{prefix}_TPM", tpm)),
+                max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+            )
+        return _limiters[llm_name]
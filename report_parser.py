@@ -0,0 +1,191 @@
+import re
+from dataclasses import dataclass, field
+
+# The regions the prompt asks for, with the header spellings models use
+REGIONS = [
+    ("North America", ("north america",)),
+    ("Europe", ("europe",)),
+    ("Asia-Pacific", ("asia-pacific", "asia pacific", "apac")),
+    ("Middle East & North Africa", ("middle east", "mena")),
+    ("Latin America", ("latin america", "south america")),
+    ("Sub-Saharan Africa", ("sub-saharan africa", "sub saharan africa", "africa")),
+    ("Russia & CIS", ("russia", "cis")),
+]
+CONCLUSION_HEADERS = ("conclusion", "summary", "global", "overall", "key takeaways")
+
+HEADER_RE = re.compile(r"^\s*#{1,6}\s+(.*)$")
+BULLET_RE = re.compile(r"^\s*[-*•]\s+(.*)$")
+# "Name (Country) – description" once bold markers are removed; the
+# separator may be an en/em dash, a hyphen or a colon
+COMPETITOR_RE = re.compile(r"^(?P<name>[^()]+?)\s*\((?P<country>[^)]+)\)\s*[–—:-]\s*(?P<description>.+)$")
+HEADER_NOISE_RE = re.compile(r"^[\d.\s*_]+|[*_:]+$")
+
+
+@dataclass
+class Competitor:
+    name: str
+    country: str
+    description: str
+    region: str = ""
+
+
+@dataclass
+class RegionSection:
+    name: str
+    description: str = ""
+    competitors: list = field(default_factory=list)
+
+
+@dataclass
+class ParsedReport:
+    intro: str = ""
+    regions: dict = field(default_factory=dict)
+    conclusion: str = ""
+    # Unplaced bullets (before any region header)
+    other_competitors: list = field(default_factory=list)
+    paragraphs: int = 0
+    words: int = 0
+    markup_lines: int = 0
+
+    @property
+    def competitors(self):
+        found = [c for section in self.regions.values() for c in section.competitors]
+        return found + self.other_competitors
+
+    # Format-compliance score in [0, 100]. Competitor reports are scored
+    # on intro, region headers, "Name (Country) – description" entries and
+    # a closing paragraph; other answers on plain, well-developed prose.
+    def score(self, is_competitor_query=False):
+        score = 0.0
+        if is_competitor_query:
+            if self.intro:
+                score += 20.0
+            score += len(self.regions) / len(REGIONS) * 30.0
+            score += min(len(self.competitors) / 5, 1.0) * 30.0
+            if self.conclusion:
+                score += 20.0
+        elif self.paragraphs:
+            score += min(self.paragraphs, 3) * 20.0
+            if self.words > 50:
+                score += 20.0
+            if not self.markup_lines:
+                score += 20.0
+        return score
+
+
+def canonical_region(header):
+    header = HEADER_NOISE_RE.sub("", header.strip()).strip().lower()
+    for name, aliases in REGIONS:
+        if header.startswith(aliases):
+            return name
+    return None
+
+
+# Incremental single-pass parser. feed() accepts arbitrary chunks (e.g.
+# streamed tokens) and only ever looks at each complete line once, so the
+# report and its score are always up to date in linear total time.
+class ReportParser:
+    def __init__(self):
+        self.report = ParsedReport()
+        # Chunks of the line not yet ended by a newline, joined only once it is
+        self._partial_line = []
+        self._block = []
+        self._block_is_text = True
+        self._section = None  # None (intro), a RegionSection, or "other"
+        self._seen_header = False
+
+    def feed(self, text):
+        if "\n" not in text:
+            if text:
+                self._partial_line.append(text)
+            return self.report
+        lines = text.split("\n")
+        self._partial_line.append(lines[0])
+        lines[0] = "".join(self._partial_line)
+        rest = lines.pop()
+        self._partial_line = [rest] if rest else []
+        for line in lines:
+            self._line(line)
+        return self.report
+
+    def close(self):
+        if self._partial_line:
+            self._line("".join(self._partial_line))
+            self._partial_line = []
+        self._end_block()
+        return self.report
+
+    def _end_block(self):
+        if not self._block:
+            return
+        report = self.report
+        text = " ".join(self._block)
+        report.paragraphs += 1
+
+        if self._block_is_text:
+            if not self._seen_header and report.paragraphs == 1:
+                report.intro = text
+            elif isinstance(self._section, RegionSection) and not (
+                    self._section.description or self._section.competitors):
+                self._section.description = text
+            else:
+                # The latest trailing prose is the conclusion until
+                # another header or bullet list follows it
+                report.conclusion = text
+        self._block = []
+        self._block_is_text = True
+
+    def _line(self, line):
+        report = self.report
+        if not line.strip():
+            self._end_block()
+            return
+        report.words += len(line.split())
+
+        header = HEADER_RE.match(line)
+        if header:
+            self._end_block()
+            report.markup_lines += 1
+            report.conclusion = ""
+            self._seen_header = True
+            region = canonical_region(header.group(1))
+            if region:
+                self._section = report.regions.setdefault(region, RegionSection(region))
+            elif header.group(1).strip(" *#").lower().startswith(CONCLUSION_HEADERS):
+                self._section = "conclusion"
+            else:
+                self._section = "other"
+            return
+
+        bullet = BULLET_RE.match(line)
+        if bullet:
+            if self._block_is_text:
+                self._end_block()
+            self._block_is_text = False
+            self._block.append(line.strip())
+            report.markup_lines += 1
+            report.conclusion = ""
+            entry = COMPETITOR_RE.match(bullet.group(1).replace("**", "").strip())
+            if entry:
+                in_region = isinstance(self._section, RegionSection)
+                competitor = Competitor(
+                    name=entry.group("name").strip(),
+                    country=entry.group("country").strip(),
+                    description=entry.group("description").strip(),
+                    region=self._section.name if in_region else "",
+                )
+                if in_region:
+                    self._section.competitors.append(competitor)
+                else:
+                    report.other_competitors.append(competitor)
+            return
+
+        if not self._block_is_text:
+            self._end_block()
+        self._block.append(line.strip())
+
+
+def parse_report(text):
+    parser = ReportParser()
+    parser.feed(text or "")
+    return parser.close()
@@ -0,0 +1,137 @@
+import collections
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(".cache", "responses.sqlite3"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+
+
+# "  Tesla   Competitors?? " and "tesla competitors" share a cache entry
+def normalize_query(query):
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!. ")
+
+
+def model_name_of(llm):
+    return getattr(llm, "model_name", None) or getattr(llm, "model", "") or ""
+
+
+def template_hash(template):
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(query, provider, model, prompt_hash):
+    raw = "\x1f".join([normalize_query(query), provider, model, prompt_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Two-tier response cache: an in-memory LRU in front of a SQLite table, both
+# honouring the same TTL. Safe to share between sessions and threads.
+class ResponseCache:
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, provider TEXT, model TEXT, query TEXT,"
+                " response TEXT, created_at REAL, intent TEXT DEFAULT '')"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(responses)")]
+            if "intent" not in columns:
+                self._db.execute("ALTER TABLE responses ADD COLUMN intent TEXT DEFAULT ''")
+            self._db.commit()
+
+    def _expired(self, created_at):
+        return time.time() - created_at > self.ttl_seconds
+
+    def _remember(self, key, response, created_at):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    entry = row
+                    self._remember(key, *row)
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.bytes_saved += len(entry[0].encode("utf-8"))
+            return entry[0]
+
+    def put(self, key, response, provider="", model="", query="", intent=""):
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, response, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, provider, model, normalize_query(query), response, created_at, intent)
+                )
+                self._db.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (created_at - self.ttl_seconds,)
+                )
+                self._db.commit()
+
+    # Distinct unexpired queries, newest first (used to warm the semantic index)
+    def recent_queries(self, limit, intent=None):
+        if self._db is None:
+            return []
+        sql = "SELECT query, MAX(created_at) AS latest FROM responses WHERE created_at >= ?"
+        params = [time.time() - self.ttl_seconds]
+        if intent is not None:
+            sql += " AND intent = ?"
+            params.append(intent)
+        sql += " GROUP BY query ORDER BY latest DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [row[0] for row in self._db.execute(sql, params)]
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "memory_entries": len(self._memory),
+        }
@@ -0,0 +1,118 @@
+import os
+import re
+import threading
+import time
+
+from scoring import detect_competitor_query
+from telemetry import record_startup
+
+INTENTS = ("competitor", "comparison", "general", "followup")
+
+# Completion budget per intent. A full regional competitor report needs the
+# room; definitions and follow-ups don't.
+INTENT_MAX_TOKENS = {
+    "competitor": 8000,
+    "comparison": 3000,
+    "general": 1500,
+    "followup": 1200,
+}
+
+# Below this classifier confidence the keyword checks decide instead
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.4"))
+COMPARISON_RE = re.compile(r"\b(?:vs|versus|compared?|compares|comparing|difference between)\b", re.IGNORECASE)
+
+# Seed examples the classifier is trained on at startup
+TRAINING_EXAMPLES = {
+    "competitor": [
+        "What are the competitors of Tesla?", "Tesla competitors", "Boeing rivals",
+        "Who are Netflix's main rivals?", "who competes with Spotify", "companies like Airbnb",
+        "alternatives to Slack", "competitive landscape for Zoom", "list the competitors of Nike",
+        "Who does Shopify compete with globally?", "main competition for Uber",
+        "competitors of Infosys in Europe and Asia", "Which companies compete with Siemens?",
+        "top rivals of Coca-Cola", "show me Stripe's competitors", "similar companies to Canva",
+        "Who are the biggest competitors to Amazon Web Services?", "peers of Unilever",
+        "competitor analysis for Peloton", "Give me a competitor analysis of Zara",
+        "what companies compete against Salesforce", "rivals of Samsung Electronics",
+        "Toyota competition worldwide", "who else makes products like Dyson",
+    ],
+    "comparison": [
+        "Tesla vs BYD", "compare Coca-Cola and Pepsi", "How does AMD stack up against Intel?",
+        "difference between Visa and Mastercard", "Netflix versus Disney+ which is better",
+        "compare the business models of Uber and Lyft", "Airbus or Boeing: who is stronger?",
+        "Apple vs Samsung market share", "contrast Shopify with BigCommerce",
+        "which is bigger, Nestle or Unilever?", "AWS compared to Azure for enterprises",
+        "how do McDonald's and Burger King differ", "Zoom vs Microsoft Teams pricing",
+        "compare Nvidia's and AMD's GPU strategy", "pros and cons of Spotify versus Apple Music",
+        "is Adidas or Nike more profitable", "Toyota and Volkswagen head to head",
+        "benchmark Infosys against TCS", "How does Stripe compare to Adyen?",
+        "Ford compared with GM on EVs", "what separates Oracle from SAP",
+    ],
+    "general": [
+        "what is EBITDA?", "explain market segmentation", "how do I calculate CAGR",
+        "what are the latest trends in the EV market", "how big is the cloud computing market",
+        "what is a SWOT analysis", "define total addressable market",
+        "how do investments in canvas production work", "what drives gross margin in retail",
+        "explain Porter's five forces", "what is the outlook for the semiconductor industry",
+        "how does venture capital funding work", "what is product-market fit",
+        "tips for entering the Indian market", "how are SaaS companies valued",
+        "what is a moat in business strategy", "summarize the state of the airline industry",
+        "how do tariffs affect supply chains", "write a short market research plan",
+        "what does a go-to-market strategy include", "how do interest rates affect startups",
+    ],
+    "followup": [
+        "what about Europe?", "tell me more", "tell me more about the second one",
+        "and their revenue?", "why?", "can you elaborate on that", "expand on BYD",
+        "what about Latin America", "which of those is the largest?", "go deeper on the first company",
+        "any others?", "how about in Asia", "more details please", "what did you mean by that",
+        "and in Africa?", "can you summarize that", "which one is growing fastest?",
+        "what about smaller players", "list a few more", "is that still true today?",
+        "how does it compare to the one you mentioned before", "ok and pricing?",
+    ],
+}
+
+
+# Routes each query to an intent with a small local text classifier
+# (word and character n-grams, logistic regression). Follow-ups only exist
+# when there is history to follow; without it the next-best intent wins.
+class QueryRouter:
+    def __init__(self, examples=TRAINING_EXAMPLES, min_confidence=ROUTER_MIN_CONFIDENCE):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline, make_union
+
+        self.min_confidence = min_confidence
+        texts = [text for intent in INTENTS for text in examples[intent]]
+        labels = [intent for intent in INTENTS for _ in examples[intent]]
+        self._model = make_pipeline(
+            make_union(
+                TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True),
+                TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), sublinear_tf=True),
+            ),
+            LogisticRegression(C=10.0, max_iter=1000),
+        )
+        self._model.fit(texts, labels)
+        self._lock = threading.Lock()
+        self.counts = {intent: 0 for intent in INTENTS}
+
+    # Returns (intent, confidence)
+    def route(self, query, has_history=False):
+        probabilities = self._model.predict_proba([query])[0]
+        ranked = sorted(zip(self._model.classes_, probabilities), key=lambda pair: pair[1], reverse=True)
+        if not has_history:
+            ranked = [pair for pair in ranked if pair[0] != "followup"]
+        intent, confidence = ranked[0]
+        if confidence < self.min_confidence:
+            if COMPARISON_RE.search(query):
+                intent = "comparison"
+            else:
+                intent = "competitor" if detect_competitor_query(query) else "general"
+        with self._lock:
+            self.counts[intent] += 1
+        return intent, float(confidence)
+
+
+def build_query_router():
+    started = time.monotonic()
+    router = QueryRouter()
+    record_startup("query router", time.monotonic() - started)
+    return router
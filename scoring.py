@@ -0,0 +1,34 @@
+import re
+
+from report_parser import parse_report
+
+# Phrases that mark a query as a competitor-analysis request
+COMPETITOR_KEYWORDS = [
+    "competitor", "competition", "rival", "versus", "vs", "compare", "competing",
+    "competes", "compete with", "companies like", "alternatives to"
+]
+
+# Keywords match as whole words (plus a plural or past-tense ending), so
+# "vs" no longer fires inside "investments" or "canvas"
+COMPETITOR_RE = re.compile(
+    r"\b(?:" + "|".join(re.escape(keyword) for keyword in COMPETITOR_KEYWORDS) + r")(?:s|d)?\b",
+    re.IGNORECASE
+)
+
+# Check if the query is about competitors
+def detect_competitor_query(query):
+    return bool(COMPETITOR_RE.search(query))
+
+# Function to calculate matching score based on format
+def calculate_format_score(response, is_competitor_query=False):
+    if not response:
+        return 0.0
+    return parse_report(response).score(is_competitor_query)
+
+# Parse and score every response once and pick the highest format score.
+# Returns (best_llm, scores, reports) so callers can reuse the parses.
+def select_best_response(responses, is_competitor_query=False):
+    reports = {llm_name: parse_report(response) for llm_name, response in responses.items()}
+    scores = {llm_name: report.score(is_competitor_query) for llm_name, report in reports.items()}
+    best_llm = max(scores, key=scores.get)
+    return best_llm, scores, reports
@@ -0,0 +1,152 @@
+import collections
+import os
+import re
+import threading
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from response_cache import normalize_query
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "100000"))
+
+# Words that only express "I want competitors". Stripping them makes
+# "who competes with Tesla", "Tesla rivals" and "companies like Tesla" all
+# reduce to "tesla", while "Boeing rivals" stays far away.
+INTENT_WORDS = {
+    "who", "what", "which", "are", "is", "the", "a", "an", "of", "for", "to", "with", "in",
+    "me", "list", "show", "give", "tell", "about", "top", "main", "biggest", "key", "major",
+    "competitor", "competitors", "competition", "competes", "compete", "competing",
+    "rival", "rivals", "alternatives", "alternative", "companies", "company", "like",
+    "similar", "peers", "analysis", "landscape", "its", "their", "s",
+}
+
+# Rows added since the last merge are kept in a small side buffer so inserts
+# never restack the whole matrix
+MERGE_EVERY = 1024
+
+
+def query_subject(query):
+    words = re.findall(r"[a-z0-9&]+", normalize_query(query))
+    subject = [w for w in words if w not in INTENT_WORDS]
+    return " ".join(subject) or " ".join(words)
+
+
+# Nearest-neighbour index over past queries using hashed character n-grams.
+# Vectors are L2-normalised, so a dot product is the cosine similarity. The
+# merged rows are stored column-major, which makes the matrix an inverted
+# index: a lookup only touches rows sharing an n-gram with the query.
+# lookup() returns the closest stored query (to use as the response-cache
+# key) or None below the similarity threshold.
+class SemanticQueryIndex:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._vectorizer = HashingVectorizer(
+            analyzer="char_wb", ngram_range=(2, 4), n_features=2 ** 18,
+            alternate_sign=False, norm="l2"
+        )
+        self._lock = threading.Lock()
+        self._matrix = sp.csc_matrix((0, 2 ** 18), dtype=np.float64)
+        self._buffer = []
+        self._buffered_rows = 0
+        self._buffer_matrix = None
+        self._queries = []
+        self._alive = np.zeros(MERGE_EVERY, dtype=bool)
+        self._rows = {}
+        # Insertion order of live queries, oldest first, for eviction
+        self._order = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._order)
+
+    def _vectorize(self, queries):
+        return self._vectorizer.transform([query_subject(q) for q in queries])
+
+    def _merge(self):
+        if self._buffer:
+            self._matrix = sp.vstack([self._matrix.tocsr()] + self._buffer, format="csc")
+            self._buffer = []
+            self._buffered_rows = 0
+            self._buffer_matrix = None
+
+    def _compact(self):
+        self._merge()
+        keep = np.flatnonzero(self._alive[:len(self._queries)])
+        self._matrix = self._matrix.tocsr()[keep].tocsc()
+        self._queries = [self._queries[i] for i in keep]
+        self._alive = np.ones(max(len(keep), MERGE_EVERY), dtype=bool)
+        self._alive[len(keep):] = False
+        self._rows = {query: row for row, query in enumerate(self._queries)}
+
+    def add(self, query):
+        self.add_many([query])
+
+    def add_many(self, queries):
+        queries = [normalize_query(q) for q in queries]
+        with self._lock:
+            new_queries = []
+            for query in queries:
+                if query in self._order:
+                    self._order.move_to_end(query)
+                else:
+                    self._order[query] = None
+                    self._rows[query] = len(self._queries)
+                    self._queries.append(query)
+                    new_queries.append(query)
+            if not new_queries:
+                return
+
+            while len(self._queries) > len(self._alive):
+                self._alive = np.concatenate([self._alive, np.zeros(len(self._alive), dtype=bool)])
+            self._alive[len(self._queries) - len(new_queries):len(self._queries)] = True
+
+            self._buffer.append(self._vectorize(new_queries))
+            self._buffered_rows += len(new_queries)
+            self._buffer_matrix = None
+            if self._buffered_rows >= MERGE_EVERY:
+                self._merge()
+
+            while len(self._order) > self.max_entries:
+                oldest, _ = self._order.popitem(last=False)
+                self._alive[self._rows.pop(oldest)] = False
+            # Rebuild once tombstones make up a quarter of the rows
+            if len(self._queries) > 4 * MERGE_EVERY and len(self._order) < 0.75 * len(self._queries):
+                self._compact()
+
+    def remove(self, query):
+        query = normalize_query(query)
+        with self._lock:
+            row = self._rows.pop(query, None)
+            if row is not None:
+                self._alive[row] = False
+                del self._order[query]
+
+    def lookup(self, query):
+        vector = self._vectorize([query])
+        columns, weights = vector.indices, vector.data
+        with self._lock:
+            if self._buffer and self._buffer_matrix is None:
+                self._buffer_matrix = sp.vstack(self._buffer, format="csc")
+                self._buffer = [self._buffer_matrix.tocsr()]
+            blocks = [self._matrix]
+            if self._buffer:
+                blocks.append(self._buffer_matrix)
+
+            scores = np.concatenate([block[:, columns] @ weights for block in blocks])
+            scores[~self._alive[:len(scores)]] = -1.0
+            row = int(scores.argmax()) if len(scores) else -1
+            best_score = float(scores[row]) if row >= 0 else 0.0
+
+            if row < 0 or best_score < self.threshold:
+                self.misses += 1
+                return None, max(best_score, 0.0)
+            self.hits += 1
+            return self._queries[row], best_score
+
+    def stats(self):
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,179 @@
+import concurrent.futures
+import os
+import re
+import threading
+import time
+
+from fanout import mark_timed_out, provider_timeout, start_call, submit
+from prompts import REGION_SCOPES, SECTION_CONCLUSION_PROMPT, SECTION_INTRO_PROMPT, SECTION_REGION_PROMPT
+from providers import max_tokens_kwargs
+from rate_limit import get_limiter
+from report_parser import HEADER_RE, REGIONS
+from response_cache import cache_key, model_name_of, normalize_query, template_hash
+from tokens import count_tokens
+
+# Generate competitor reports as parallel sections (off unless set to 1);
+# the chat sidebar can switch this per session
+SHARDED_REPORTS = os.getenv("SHARDED_REPORTS", "0") == "1"
+
+INTRO = "Introduction"
+CONCLUSION = "Conclusion"
+SECTIONS = [INTRO] + [name for name, _ in REGIONS] + [CONCLUSION]
+
+# Completion budget per section; seven regions at 1500 still cover more
+# than the single-call report's 8000
+SECTION_MAX_TOKENS = {
+    INTRO: int(os.getenv("SHARDED_INTRO_MAX_TOKENS", "300")),
+    CONCLUSION: int(os.getenv("SHARDED_CONCLUSION_MAX_TOKENS", "300")),
+}
+REGION_MAX_TOKENS = int(os.getenv("SHARDED_REGION_MAX_TOKENS", "1500"))
+
+NO_COMPETITORS = "No significant competitors identified in this region based on current market analysis."
+# Stands in for a region whose section failed
+MISSING_SECTION = "_This section could not be generated; ask again to retry it._"
+
+# "**Introduction:**", "Europe:" and similar labels models put on top
+LABEL_RE = re.compile(r"^\**[\w &-]{1,40}(:\**|\**:|\*\*)$")
+
+
+def section_template(section):
+    if section == INTRO:
+        return SECTION_INTRO_PROMPT
+    if section == CONCLUSION:
+        return SECTION_CONCLUSION_PROMPT
+    return SECTION_REGION_PROMPT
+
+
+def section_prompt(section, query):
+    if section in (INTRO, CONCLUSION):
+        return section_template(section).format(input=query)
+    return SECTION_REGION_PROMPT.format(input=query, region=section, scope=REGION_SCOPES[section])
+
+
+# Each section is cached on its own, so one region can be regenerated
+# without the rest of the report
+def section_key(llm_name, llm, query, section):
+    return cache_key(
+        f"{normalize_query(query)}\x1f{section}", llm_name, model_name_of(llm),
+        template_hash(section_template(section))
+    )
+
+
+# Drop the header or label a model adds despite the instructions. The intro
+# and conclusion become one paragraph each, which is where the report
+# parser looks for them.
+def clean_section(section, text):
+    lines = text.strip().split("\n")
+    while lines and (HEADER_RE.match(lines[0]) or not lines[0].strip() or LABEL_RE.match(lines[0].strip())):
+        lines.pop(0)
+    if section in (INTRO, CONCLUSION):
+        return " ".join(line.strip() for line in lines if line.strip())
+    return "\n".join(lines).strip() or NO_COMPETITORS
+
+
+# Sections in report order, under the headers calculate_format_score
+# expects; missing sections are left out, except regions listed in failed,
+# which keep their header with MISSING_SECTION under it
+def assemble_report(sections, failed=()):
+    parts = [sections.get(INTRO, "")]
+    parts += [
+        f"## {section}\n{sections.get(section, MISSING_SECTION)}"
+        for section in SECTIONS[1:-1] if section in sections or section in failed
+    ]
+    parts.append(sections.get(CONCLUSION, ""))
+    return "\n\n".join(part for part in parts if part)
+
+
+# One section under the provider's rate limiter, recorded in the trace as
+# a call to the provider for that section; abandoned works as in
+# fanout.limited_predict
+def generate_section(llm_name, llm, section, query, deadline=None, trace=None, submitted=None, abandoned=None):
+    prompt = section_prompt(section, query)
+    max_tokens = SECTION_MAX_TOKENS.get(section, REGION_MAX_TOKENS)
+    model = model_name_of(llm)
+    prompt_tokens = count_tokens(prompt, model)
+    call = start_call(trace, llm_name, prompt_tokens, 0, submitted, section)
+
+    def invoke():
+        call.start()
+        return llm.invoke(prompt, **max_tokens_kwargs(llm_name, max_tokens)).content
+
+    try:
+        text = get_limiter(llm_name).call(
+            invoke,
+            reserved_tokens=prompt_tokens + max_tokens,
+            deadline=deadline,
+            count_tokens=lambda text: prompt_tokens + count_tokens(text, model),
+            abandoned=abandoned
+        )
+    except Exception:
+        call.finish("error")
+        raise
+    call.finish("ok", count_tokens(text, model))
+    return clean_section(section, text)
+
+
+# Generate every section of a competitor report for each provider at once
+# and yield (llm_name, section, text, error) as sections finish; cached
+# sections come first. Sections listed in refresh are regenerated even when
+# cached. A failed section doesn't stop the others, which are still cached
+# for the next attempt.
+def generate_sharded(llms, query, response_cache=None, trace=None, refresh=(), timeouts=None):
+    futures = {}
+    deadlines = {}
+    abandoned = {}
+    cached = []
+    for llm_name, llm in llms.items():
+        submitted = time.monotonic()
+        deadline = submitted + provider_timeout(llm_name, timeouts)
+        for section in SECTIONS:
+            key = section_key(llm_name, llm, query, section)
+            text = None
+            if response_cache is not None and section not in refresh:
+                text = response_cache.get(key)
+            if text is not None:
+                cached.append((llm_name, section, text, None))
+                continue
+            abandoned[llm_name, section] = threading.Event()
+            future = submit(
+                generate_section, llm_name, llm, section, query, deadline, trace, submitted,
+                abandoned[llm_name, section]
+            )
+            futures[future] = (llm_name, section, key)
+            deadlines[future] = deadline
+
+    pending = set(futures)
+    try:
+        yield from cached
+        while pending:
+            wait_for = max(0.0, min(deadlines[f] for f in pending) - time.monotonic())
+            done, pending = concurrent.futures.wait(
+                pending, timeout=wait_for, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                llm_name, section, key = futures[future]
+                try:
+                    text = future.result()
+                except Exception as e:
+                    yield llm_name, section, None, e
+                    continue
+                if response_cache is not None:
+                    response_cache.put(
+                        key, text, provider=llm_name, model=model_name_of(llms[llm_name]),
+                        query=query, intent="section"
+                    )
+                yield llm_name, section, text, None
+
+            now = time.monotonic()
+            for future in [f for f in pending if deadlines[f] <= now]:
+                llm_name, section, _ = futures[future]
+                abandoned[llm_name, section].set()
+                future.cancel()
+                pending.discard(future)
+                mark_timed_out(trace, llm_name, section)
+                yield llm_name, section, None, TimeoutError(
+                    f"{llm_name} did not finish {section} within {provider_timeout(llm_name, timeouts):g}s"
+                )
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,376 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+# Finished turns kept for the diagnostics panel and /metrics.json
+RECENT_TURNS = 50
+
+# Serve /metrics (Prometheus text) and /metrics.json on this port when set
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Modules loaded lazily after the first paint; profiled by import_time_report
+HEAVY_MODULES = (
+    "langchain_openai", "langchain_google_genai", "langchain.chains",
+    "langchain.memory", "sklearn.feature_extraction.text",
+)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                break
+        else:
+            i = len(self.bounds)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    # Estimated quantile, interpolated inside the bucket it falls in
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+# Process-wide counters and histograms keyed by (name, labels)
+class MetricsRegistry:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.recent_turns = deque(maxlen=RECENT_TURNS)
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    def histogram(self, name, **labels):
+        return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def add_turn(self, summary):
+        with self._lock:
+            self.recent_turns.append(summary)
+
+    def prometheus_text(self):
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{label_text(labels)} {value}")
+            for (name, labels), hist in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(list(hist.bounds) + ["+Inf"], hist.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{label_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{label_text(labels)} {hist.sum:.6f}")
+                lines.append(f"{name}_count{label_text(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "count": hist.count, "sum": round(hist.sum, 6),
+                     "p50": hist.quantile(0.5), "p95": hist.quantile(0.95)}
+                    for (name, labels), hist in self.histograms.items()
+                ],
+                "recent_turns": list(self.recent_turns),
+            }
+
+    # Per-provider rollup for the sidebar diagnostics panel
+    def provider_summary(self):
+        summary = {}
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                labels = dict(labels)
+                if name == "llm_calls_total":
+                    row = summary.setdefault(labels["provider"], {})
+                    row[labels["outcome"]] = row.get(labels["outcome"], 0) + value
+            for (name, labels), hist in self.histograms.items():
+                labels = dict(labels)
+                if "provider" in labels and hist.count:
+                    row = summary.setdefault(labels["provider"], {})
+                    row[f"{name}_p50"] = hist.quantile(0.5)
+                    row[f"{name}_p95"] = hist.quantile(0.95)
+        return summary
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    return _registry
+
+
+# Seconds each startup component took the first time it loaded in this
+# process (provider clients, first paint, semantic index, ...)
+STARTUP_TIMES = {}
+
+
+def record_startup(component, seconds):
+    STARTUP_TIMES.setdefault(component, seconds)
+    _registry.observe("startup_seconds", seconds, component=component)
+
+
+# Cold import cost of modules in a fresh interpreter, from -X importtime,
+# down to max_depth levels of nested imports. Returns
+# [(module, self_seconds, cumulative_seconds)] slowest first.
+def import_time_report(modules=HEAVY_MODULES, top=15, max_depth=1):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+        depth = (len(module) - len(module.lstrip()) - 1) // 2
+        if not self_us.strip().isdigit() or depth > max_depth:
+            continue
+        rows.append((module.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return sorted(rows, key=lambda row: row[2], reverse=True)[:top]
+
+
+# Timing of one provider call within a turn. Written from the worker
+# thread; outcome is "ok", "error", "timeout" or "cancelled" ("abandoned"
+# if the turn ended before the call did). part names the report section or
+# sample when the call is one of several for the provider.
+class ProviderCall:
+    def __init__(self, llm_name, prompt_tokens=0, history_tokens=0, submitted=None, part=None):
+        self.llm_name = llm_name
+        self.part = part
+        self.prompt_tokens = prompt_tokens
+        self.history_tokens = history_tokens
+        self.submitted = submitted if submitted is not None else time.monotonic()
+        self.started = None
+        self.first_token = None
+        self.finished = None
+        self.completion_tokens = 0
+        self.attempts = 0
+        self.outcome = None
+
+    # Called when the limiter lets an attempt through
+    def start(self):
+        self.attempts += 1
+        self.started = time.monotonic()
+
+    def token(self):
+        if self.first_token is None:
+            self.first_token = time.monotonic()
+
+    def finish(self, outcome, completion_tokens=0):
+        if self.outcome is None:
+            self.outcome = outcome
+            self.completion_tokens = completion_tokens
+            self.finished = time.monotonic()
+
+    def summary(self):
+        def since(start, end):
+            return round(end - start, 4) if start is not None and end is not None else None
+
+        end = self.finished or time.monotonic()
+        return {
+            "provider": self.llm_name,
+            "part": self.part,
+            "outcome": self.outcome or "abandoned",
+            "attempts": self.attempts,
+            # Time spent in the worker queue and the rate limiter before the
+            # last attempt went out
+            "queue_wait": since(self.submitted, self.started),
+            "ttft": since(self.submitted, self.first_token or (self.finished if self.outcome == "ok" else None)),
+            "total": since(self.submitted, end),
+            "prompt_tokens": self.prompt_tokens,
+            "history_tokens": self.history_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+# "OpenAI" or "OpenAI Europe": a call summary's provider and part
+def call_label(call):
+    return f"{call['provider']} {call['part']}" if call.get("part") else call["provider"]
+
+
+# Spans for one chat turn (cache lookup, provider calls, scoring,
+# selection, rendering). finish() folds them into the process-wide metrics.
+class TurnTrace:
+    def __init__(self, query, intent="", registry=None):
+        self.turn_id = uuid.uuid4().hex[:12]
+        self.query = query
+        self.intent = intent
+        # Fan-out mode the turn ran with (see fanout_policy)
+        self.fanout = ""
+        self.registry = registry or _registry
+        self.started = time.monotonic()
+        self.spans = []
+        self.calls = []
+        self.summary = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        started = time.monotonic()
+        try:
+            yield attrs
+        finally:
+            with self._lock:
+                self.spans.append({"name": name, "start": round(started - self.started, 4),
+                                   "duration": round(time.monotonic() - started, 4), **attrs})
+
+    # Span for work spread over many small slices (e.g. scoring streamed
+    # chunks), recorded with its accumulated duration
+    def add_span(self, name, duration, **attrs):
+        with self._lock:
+            self.spans.append({"name": name, "start": None, "duration": round(duration, 4), **attrs})
+
+    def provider_call(self, llm_name, prompt_tokens=0, history_tokens=0, submitted=None, part=None):
+        call = ProviderCall(llm_name, prompt_tokens, history_tokens, submitted, part)
+        with self._lock:
+            self.calls.append(call)
+        return call
+
+    # The latest call to the provider for part, or None
+    def last_call(self, llm_name, part=None):
+        with self._lock:
+            matching = [call for call in self.calls if call.llm_name == llm_name and call.part == part]
+        return matching[-1] if matching else None
+
+    def finish(self, selected=None, cached=()):
+        if self.summary is not None:
+            return self.summary
+        total = time.monotonic() - self.started
+        with self._lock:
+            spans = list(self.spans)
+            calls = [call.summary() for call in self.calls]
+
+        registry = self.registry
+        intent = self.intent or "general"
+        registry.inc("turns_total", intent=intent)
+        registry.observe("turn_seconds", total, intent=intent)
+        if self.fanout:
+            registry.inc("fanout_turns_total", mode=self.fanout, intent=intent)
+        for span in spans:
+            registry.observe("turn_stage_seconds", span["duration"], stage=span["name"])
+        for llm_name in cached:
+            registry.inc("llm_cache_hits_total", provider=llm_name)
+        for call in calls:
+            provider = call["provider"]
+            registry.inc("llm_calls_total", provider=provider, outcome=call["outcome"])
+            registry.inc("llm_prompt_tokens_total", call["prompt_tokens"], provider=provider)
+            registry.inc("llm_completion_tokens_total", call["completion_tokens"], provider=provider)
+            registry.observe("llm_history_tokens", call["history_tokens"], TOKEN_BUCKETS, provider=provider)
+            for metric in ("queue_wait", "ttft", "total"):
+                if call[metric] is not None:
+                    registry.observe(f"llm_{metric}_seconds", call[metric], provider=provider)
+        if selected:
+            registry.inc("llm_selected_total", provider=selected, intent=intent)
+
+        self.summary = {
+            "turn_id": self.turn_id,
+            "intent": intent,
+            "fanout": self.fanout,
+            "total": round(total, 4),
+            "selected": selected,
+            "cached": list(cached),
+            "spans": spans,
+            "calls": calls,
+            "finished_at": time.time(),
+        }
+        registry.add_turn(self.summary)
+        return self.summary
+
+    # One log line: where the turn's time went
+    def log_line(self):
+        summary = self.finish()
+        parts = [f"{call_label(c)} {c['total']:.2f}s/{c['outcome']}"
+                 + (f" (ttft {c['ttft']:.2f}s)" if c["ttft"] is not None else "")
+                 for c in summary["calls"]]
+        parts += [f"{s['name']} {s['duration'] * 1000:.0f}ms" for s in summary["spans"]]
+        return f"⏱️ Turn {summary['total']:.2f}s: " + ", ".join(parts)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = _registry
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = self.registry.prometheus_text().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body = json.dumps(self.registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Background HTTP server for scrapers; returns None if the port is taken
+def start_metrics_server(port, host="127.0.0.1"):
+    try:
+        server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    except OSError as e:
+        print(f"❌ Metrics server could not bind port {port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    print(f"📈 Metrics on http://{host}:{port}/metrics")
+    return server
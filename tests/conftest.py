@@ -0,0 +1,61 @@
+import http.server
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# The modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Local web server for evidence tests. Pages map a path to (html, delay);
+# each is served with an ETag, answered with a 304 when it matches, and
+# every request is recorded as (path, status).
+class PageServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), PageHandler)
+        self.pages = {}
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        page = self.server.pages.get(self.path)
+        if page is None:
+            self.server.requests.append((self.path, 404))
+            self.send_response(404)
+            self.end_headers()
+            return
+        html, delay = page
+        time.sleep(delay)
+        etag = f'"{hash(html) & 0xffffffff:x}"'
+        status = 304 if self.headers.get("If-None-Match") == etag else 200
+        self.server.requests.append((self.path, status))
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "text/html")
+        body = html.encode("utf-8") if status == 200 else b""
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def page_server():
+    server = PageServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,115 @@
+import json
+import os
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import provider_health
+import rate_limit
+from batch import BatchChain, analyze_company, compact_output, run_batch
+from prompts import get_prompt_template
+from response_cache import ResponseCache
+from sharded_report import MISSING_SECTION
+
+
+class ScriptedChatModel(FakeListChatModel):
+    fail_on: tuple = ()
+
+    def _call(self, messages, *args, **kwargs):
+        text = messages if isinstance(messages, str) else " ".join(str(m.content) for m in messages)
+        if any(marker in text for marker in self.fail_on):
+            raise RuntimeError("provider exploded")
+        return super()._call(messages, *args, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def providers(monkeypatch):
+    monkeypatch.setattr(provider_health, "_health", {})
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+
+
+def make_chains(text, fail_on=()):
+    llm = ScriptedChatModel(responses=[text], fail_on=fail_on)
+    return {"OpenAI": BatchChain("OpenAI", llm, get_prompt_template("competitor"))}
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_rerun_skips_finished_companies(tmp_path):
+    output = str(tmp_path / "reports.jsonl")
+    run_batch(["Tesla"], output, make_chains("- **Ford (USA)** – Cars."))
+    assert run_batch(["Tesla", "Rivian"], output, make_chains("- **Ford (USA)** – Cars.")) == (1, 0)
+    assert [r["company"] for r in read_records(output)] == ["Tesla", "Rivian"]
+
+
+def test_refresh_region_rewrites_finished_rows(tmp_path):
+    output = str(tmp_path / "reports.jsonl")
+    cache = ResponseCache(path=None)
+    run_batch(["Tesla"], output, make_chains("- **Ford (USA)** – Cars."), response_cache=cache, sharded=True)
+    assert "Ford" in read_records(output)[0]["response"]
+
+    succeeded, failed = run_batch(["Tesla"], output, make_chains("- **Volkswagen (Germany)** – Cars."),
+                                  response_cache=cache, sharded=True, refresh=["Europe"])
+    assert (succeeded, failed) == (1, 0)
+    records = read_records(output)
+    assert len(records) == 1
+    report = records[0]["response"]
+    # Only Europe was regenerated; the other sections came from the cache
+    assert report.count("Volkswagen") == 1 and "## Europe\n- **Volkswagen" in report
+    assert "## North America\n- **Ford" in report
+
+
+def test_interrupted_refresh_resumes(tmp_path):
+    output = str(tmp_path / "reports.jsonl")
+    cache = ResponseCache(path=None)
+    run_batch(["Tesla", "Rivian"], output, make_chains("- **Ford (USA)** – Cars."), response_cache=cache, sharded=True)
+
+    chains = make_chains("- **Volkswagen (Germany)** – Cars.", fail_on=("Rivian",))
+    run_batch(["Tesla", "Rivian"], output, chains, response_cache=cache, sharded=True, refresh=["Europe"])
+    assert os.path.exists(output + ".refresh")
+    # Rivian's refresh came back without Europe, so its old report stays
+    assert "## Europe\n- **Ford" in {r["company"]: r["response"] for r in read_records(output)}["Rivian"]
+
+    # Only Rivian is redone; Tesla's refreshed section isn't paid for again
+    chains = make_chains("- **Renault (France)** – Cars.")
+    assert run_batch(["Tesla", "Rivian"], output, chains, response_cache=cache, sharded=True,
+                     refresh=["Europe"]) == (1, 0)
+    reports = {r["company"]: r["response"] for r in read_records(output)}
+    assert "Volkswagen" in reports["Tesla"] and "Renault" in reports["Rivian"]
+    assert not os.path.exists(output + ".refresh")
+
+
+def test_sharded_report_keeps_the_sections_that_finished():
+    cache = ResponseCache(path=None)
+    chains = make_chains("- **Ford (USA)** – Cars.", fail_on=("**Europe**",))
+    record = analyze_company("Tesla", chains, "What are the competitors of {company}?", cache, sharded=True)
+    assert f"## Europe\n{MISSING_SECTION}" in record["response"]
+    assert "## North America\n- **Ford" in record["response"]
+    assert record["errors"]["OpenAI"].startswith("Europe: ")
+    # Only the sections were cached, not the partial report
+    assert cache.get(chains["OpenAI"].cache_key(record["query"])) is None
+
+
+def test_sharded_provider_without_sections_fails():
+    chains = make_chains("- **Ford (USA)** – Cars.", fail_on=("",))
+    record = analyze_company("Tesla", chains, "What are the competitors of {company}?", sharded=True)
+    assert "response" not in record and "Europe: " in record["errors"]["OpenAI"]
+
+
+def test_compact_output_keeps_the_last_success(tmp_path):
+    output = tmp_path / "reports.jsonl"
+    lines = [
+        {"company": "Tesla", "response": "old"},
+        {"company": "Rivian", "errors": {"OpenAI": "boom"}},
+        {"company": "Tesla", "errors": {"OpenAI": "boom"}},
+        {"company": "Rivian", "response": "new"},
+    ]
+    output.write_text("".join(json.dumps(line) + "\n" for line in lines) + '{"company": "Ha', encoding="utf-8")
+    compact_output(str(output))
+    assert read_records(str(output)) == [
+        {"company": "Tesla", "response": "old"},
+        {"company": "Rivian", "response": "new"},
+    ]
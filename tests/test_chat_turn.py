@@ -0,0 +1,152 @@
+import time
+
+import pytest
+from langchain.chains import ConversationChain
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import provider_health
+import rate_limit
+from chat_turn import Turn, chain_cache_key, run_turn
+from conversation_store import ConversationStore
+from fanout_policy import FanOutPolicy, WinTracker
+from job_queue import Job
+from knowledge_index import KnowledgeIndex
+from memory import TokenWindowMemory
+from prompts import get_prompt_template
+from response_cache import ResponseCache
+from semantic_cache import SemanticQueryIndex
+from sharded_report import MISSING_SECTION, SECTIONS, assemble_report
+from telemetry import TurnTrace
+from web_evidence import WebEvidenceFetcher
+
+SECTION_TEXT = "- **Ford (USA)** – Legacy automaker."
+
+
+# Answers every prompt with the next response, failing those that mention
+# any of fail_on
+class ScriptedChatModel(FakeListChatModel):
+    fail_on: tuple = ()
+
+    def _call(self, messages, *args, **kwargs):
+        text = messages if isinstance(messages, str) else " ".join(str(m.content) for m in messages)
+        if self.sleep:
+            time.sleep(self.sleep)
+        if any(marker in text for marker in self.fail_on):
+            raise RuntimeError("provider exploded")
+        return super()._call(messages, *args, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def providers(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("GOOGLE_API_KEY", "AIza-test")
+    monkeypatch.setattr(provider_health, "_health", {})
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+
+
+def make_chain(responses, fail_on=(), sleep=None):
+    llm = ScriptedChatModel(responses=responses, fail_on=fail_on, sleep=sleep)
+    return ConversationChain(llm=llm, memory=TokenWindowMemory(return_messages=True), verbose=False)
+
+
+def make_turn(user_input, chains, intent="competitor", **settings):
+    return Turn(
+        user_input=user_input,
+        chains=chains,
+        intent=intent,
+        prompt_template=get_prompt_template(intent),
+        trace=TurnTrace(user_input, intent),
+        conversation_id="test",
+        fanout_policy=FanOutPolicy(wins=WinTracker(path=None)),
+        response_cache=ResponseCache(path=None),
+        semantic_index=SemanticQueryIndex(),
+        knowledge_index=KnowledgeIndex(path=":memory:"),
+        conversation_store=ConversationStore(path=":memory:"),
+        **settings
+    )
+
+
+def run(turn):
+    job = Job(run_turn, (turn,))
+    return job, run_turn(job, turn)
+
+
+def test_sharded_report_keeps_the_sections_that_finished():
+    chains = {
+        "OpenAI": make_chain([SECTION_TEXT], fail_on=("**Europe**",)),
+        "Gemini": make_chain([SECTION_TEXT], fail_on=("",)),
+    }
+    turn = make_turn("Who are Tesla's competitors?", chains, sharded_reports=True, stream_responses=False)
+    _, entry = run(turn)
+
+    assert entry["llm"] == "OpenAI"
+    assert "## North America\n" + SECTION_TEXT in entry["bot"]
+    assert "## Europe\n" + MISSING_SECTION in entry["bot"]
+    # The partial report isn't cached whole, so asking again retries Europe
+    assert turn.response_cache.get(chain_cache_key("OpenAI", chains["OpenAI"], turn.user_input)) is None
+
+
+def test_report_prompt_is_grounded_with_web_evidence(page_server):
+    page_server.pages["/Tesla.html"] = ("<p>Tesla opened a new factory in Berlin.</p>", 0)
+    prompts = []
+
+    class RecordingChatModel(ScriptedChatModel):
+        def _call(self, messages, *args, **kwargs):
+            prompts.append(messages if isinstance(messages, str) else " ".join(str(m.content) for m in messages))
+            return super()._call(messages, *args, **kwargs)
+
+    chain = ConversationChain(
+        llm=RecordingChatModel(responses=["## North America\n" + SECTION_TEXT]),
+        memory=TokenWindowMemory(return_messages=True), verbose=False
+    )
+    fetcher = WebEvidenceFetcher(path=":memory:", sources=f"company={page_server.url}/{{slug}}.html",
+                                 render_js=False)
+    turn = make_turn("Who are Tesla's competitors?", {"OpenAI": chain}, stream_responses=False,
+                     evidence_fetcher=fetcher)
+    _, entry = run(turn)
+
+    assert "Tesla opened a new factory in Berlin." in prompts[0]
+    assert "### 🔎 Sources" in entry["bot"]
+    # The memory keeps the bare question and report
+    assert "Web Evidence" not in chain.memory.chat_memory.messages[0].content
+
+
+def test_sharded_report_does_not_wait_for_grounding(page_server):
+    page_server.pages["/Tesla.html"] = ("<p>Tesla opened a new factory in Berlin.</p>", 0)
+    fetcher = WebEvidenceFetcher(path=":memory:", sources=f"company={page_server.url}/{{slug}}.html",
+                                 render_js=False)
+    turn = make_turn("Who are Tesla's competitors?", {"OpenAI": make_chain([SECTION_TEXT])},
+                     sharded_reports=True, stream_responses=False, evidence_fetcher=fetcher)
+    run(turn)
+    assert "evidence_grounding" not in [span["name"] for span in turn.trace.spans]
+
+
+def test_policy_learns_only_from_fresh_answers():
+    report = assemble_report({section: SECTION_TEXT for section in SECTIONS})
+    chains = {"OpenAI": make_chain([report]), "Gemini": make_chain(["A short answer."])}
+    turn = make_turn("Who are Tesla's competitors?", chains, stream_responses=False)
+    run(turn)
+    assert turn.fanout_policy.wins.snapshot()["competitor"]["OpenAI"] == {"wins": 1.0, "contests": 1.0}
+
+    # Asked again, OpenAI's answer comes from the cache: nothing to learn
+    chains["Gemini"].memory.clear()
+    cached_turn = make_turn("Who are Tesla's competitors?", chains, stream_responses=False)
+    cached_turn.response_cache = turn.response_cache
+    cached_turn.fanout_policy = turn.fanout_policy
+    chains["Gemini"].llm.responses = ["A short answer."]
+    run(cached_turn)
+    assert turn.fanout_policy.wins.snapshot()["competitor"]["OpenAI"] == {"wins": 1.0, "contests": 1.0}
+
+
+def test_hedged_turn_gives_the_abandoned_backup_the_chosen_answer():
+    report = assemble_report({section: SECTION_TEXT for section in SECTIONS})
+    chains = {"OpenAI": make_chain([report], sleep=0.2), "Gemini": make_chain(["Late answer."], sleep=0.4)}
+    turn = make_turn("Who are Tesla's competitors?", chains, stream_responses=False)
+    turn.fanout_policy = FanOutPolicy(policy={"competitor": "hedged"}, wins=WinTracker(path=None),
+                                      hedge_seconds=0.05, accept_score=0)
+    _, entry = run(turn)
+    assert entry["llm"] == "OpenAI"
+
+    # Gemini's call finishes after the turn without saving its own answer
+    time.sleep(0.5)
+    assert [m.content for m in chains["Gemini"].memory.chat_memory.messages] == [turn.user_input, report]
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+from langchain.chains import ConversationChain
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import fanout
+from memory import TokenWindowMemory
+from provider_health import get_health
+from telemetry import MetricsRegistry, TurnTrace
+
+
+# FakeListChatModel only sleeps between streamed chunks; this one also
+# takes its time over a plain invoke
+class SlowChatModel(FakeListChatModel):
+    def _call(self, *args, **kwargs):
+        if self.sleep:
+            time.sleep(self.sleep)
+        return super()._call(*args, **kwargs)
+
+
+def make_chain(responses, sleep=None):
+    llm = SlowChatModel(responses=responses, sleep=sleep)
+    return ConversationChain(llm=llm, memory=TokenWindowMemory(return_messages=True), verbose=False)
+
+
+def test_answer_is_saved_to_memory():
+    chain = make_chain(["Hello there"])
+    results = list(fanout.fan_out({"FanoutOk": chain}, "hi", timeouts={"FanoutOk": 5}))
+    assert results == [("FanoutOk", "Hello there", None)]
+    assert [m.content for m in chain.memory.chat_memory.messages] == ["hi", "Hello there"]
+    assert get_health("FanoutOk").successes == 1
+
+
+def test_timed_out_call_neither_saves_memory_nor_counts_twice():
+    chain = make_chain(["Too late"], sleep=0.5)
+    results = list(fanout.fan_out({"FanoutSlow": chain}, "hi", timeouts={"FanoutSlow": 0.1}))
+    assert len(results) == 1 and isinstance(results[0][2], TimeoutError)
+
+    # Let the abandoned call run to completion in the background
+    time.sleep(0.8)
+    assert chain.memory.chat_memory.messages == []
+    health = get_health("FanoutSlow")
+    assert (health.timeouts, health.errors, health.successes) == (1, 0, 0)
+
+
+def test_stopping_early_abandons_pending_calls():
+    primary = make_chain(["first"], sleep=0.2)
+    backup = make_chain(["second"], sleep=0.4)
+    results = fanout.fan_out({"FanoutFirst": primary}, "hi", backups={"FanoutBackup": backup}, hedge_delay=0.05,
+                             timeouts={"FanoutFirst": 5, "FanoutBackup": 5})
+    assert next(results) == ("FanoutFirst", "first", None)
+    results.close()
+
+    # The backup was already running; it finishes without saving its answer
+    time.sleep(0.5)
+    assert backup.memory.chat_memory.messages == []
+    assert get_health("FanoutBackup").successes == 0
+
+
+def test_streaming_chain_without_memory():
+    chain = make_chain(["streamed answer"])
+    chain.memory = None
+    events = list(fanout.StreamingFanOut({"FanoutStream": chain}, "hi", timeouts={"FanoutStream": 5}))
+    assert events[-1] == ("FanoutStream", "done", "streamed answer")
+
+
+def test_timed_out_stream_counts_once():
+    chain = make_chain(["slow stream"], sleep=0.3)
+    events = list(fanout.StreamingFanOut({"FanoutSlowStream": chain}, "hi", timeouts={"FanoutSlowStream": 0.1}))
+    assert [kind for _, kind, _ in events] == ["error"]
+
+    time.sleep(0.5)
+    assert chain.memory.chat_memory.messages == []
+    health = get_health("FanoutSlowStream")
+    assert (health.timeouts, health.errors, health.successes) == (1, 0, 0)
+
+
+def test_provider_timeout_prefers_explicit_value(monkeypatch):
+    monkeypatch.setenv("FANOUTENV_TIMEOUT_SECONDS", "7")
+    assert fanout.provider_timeout("FanoutEnv") == 7
+    assert fanout.provider_timeout("FanoutEnv", {"FanoutEnv": 3}) == 3
+    assert fanout.provider_timeout("FanoutOther") == pytest.approx(fanout.DEFAULT_TIMEOUT)
+
+
+def test_timed_out_sample_counts_once():
+    chain = make_chain(["late sample"], sleep=0.3)
+    results = list(fanout.fan_out_samples({"FanoutSlowSample": chain}, "hi", 1, timeouts={"FanoutSlowSample": 0.1}))
+    assert len(results) == 1 and isinstance(results[0][2], TimeoutError)
+
+    time.sleep(0.5)
+    health = get_health("FanoutSlowSample")
+    assert (health.timeouts, health.errors, health.successes) == (1, 0, 0)
+
+
+def test_samples_are_traced_under_their_provider():
+    chains = {"FanoutTraced": make_chain(["one", "two"]), "FanoutTracedSlow": make_chain(["late"], sleep=0.3)}
+    registry = MetricsRegistry()
+    trace = TurnTrace("hi", "competitor", registry=registry)
+    list(fanout.fan_out_samples(chains, "hi", 2, trace=trace, timeouts={"FanoutTraced": 5, "FanoutTracedSlow": 0.1}))
+    calls = trace.finish()["calls"]
+
+    assert sorted((c["provider"], c["part"], c["outcome"]) for c in calls) == [
+        ("FanoutTraced", "sample1", "ok"), ("FanoutTraced", "sample2", "ok"),
+        ("FanoutTracedSlow", "sample1", "timeout"), ("FanoutTracedSlow", "sample2", "timeout"),
+    ]
+    assert set(registry.provider_summary()) == {"FanoutTraced", "FanoutTracedSlow"}
+    assert registry.provider_summary()["FanoutTraced"]["ok"] == 2
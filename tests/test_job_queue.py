@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from job_queue import CANCELLED, DONE, FAILED, QUEUED, JobQueue
+from telemetry import MetricsRegistry
+
+
+def wait_for(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.finished, f"job {job.label} still {job.state}"
+
+
+# One worker held busy until release is set, so queued jobs stay queued
+@pytest.fixture
+def blocked_queue():
+    queue = JobQueue(workers=1, registry=MetricsRegistry())
+    release = threading.Event()
+    blocker = queue.submit(lambda job: release.wait(5), label="blocker")
+    while blocker.state == QUEUED:
+        time.sleep(0.01)
+    yield queue, release
+    release.set()
+
+
+def test_result_and_failure():
+    queue = JobQueue(workers=2, registry=MetricsRegistry())
+    ok = queue.submit(lambda job, a, b: a + b, 2, 3)
+    bad = queue.submit(lambda job: 1 / 0)
+    wait_for(ok)
+    wait_for(bad)
+    assert (ok.state, ok.result) == (DONE, 5)
+    assert bad.state == FAILED and isinstance(bad.error, ZeroDivisionError)
+
+
+def test_lower_priority_values_run_first(blocked_queue):
+    queue, release = blocked_queue
+    order = []
+    jobs = [queue.submit(lambda job, name: order.append(name), name, priority=priority, label=name)
+            for name, priority in [("batch", 5), ("chat", 0), ("report", 1)]]
+    assert queue.position(jobs[0]) == 2 and queue.position(jobs[1]) == 0
+    release.set()
+    for job in jobs:
+        wait_for(job)
+    assert order == ["chat", "report", "batch"]
+
+
+def test_a_session_runs_in_submission_order(blocked_queue):
+    queue, release = blocked_queue
+    order = []
+    first = queue.submit(lambda job: order.append("first"), session_id="s1", priority=5)
+    second = queue.submit(lambda job: order.append("second"), session_id="s1", priority=0)
+    other = queue.submit(lambda job: order.append("other"), session_id="s2", priority=1)
+    release.set()
+    for job in (first, second, other):
+        wait_for(job)
+    assert order == ["other", "first", "second"]
+
+
+def test_cancel_queued_and_running_jobs(blocked_queue):
+    queue, release = blocked_queue
+    queued = queue.submit(lambda job: "ran", session_id="s1")
+    queue.cancel(queued.id)
+    assert queued.state == CANCELLED and queued.result is None
+
+    started = threading.Event()
+
+    def steps(job):
+        started.set()
+        while True:
+            job.check_cancelled()
+            time.sleep(0.01)
+
+    release.set()
+    running = queue.submit(steps)
+    assert started.wait(5)
+    queue.cancel(running.id)
+    wait_for(running)
+    assert running.state == CANCELLED
+
+
+def test_wait_seconds_and_stats(blocked_queue):
+    queue, release = blocked_queue
+    job = queue.submit(lambda job: None)
+    time.sleep(0.05)
+    stats = queue.stats()
+    assert stats["queued"] == 1 and stats["running"] == 1
+    assert stats["oldest_wait"] >= 0.05
+    release.set()
+    wait_for(job)
+    assert job.wait_seconds() >= 0.05
+    assert queue.stats()["wait_p95"] >= job.wait_seconds() - 1e-6
+
+
+def test_uncollected_results_expire():
+    queue = JobQueue(workers=1, result_ttl=0, registry=MetricsRegistry())
+    job = queue.submit(lambda job: None)
+    wait_for(job)
+    queue.submit(lambda job: None)
+    assert queue.get(job.id) is None
@@ -0,0 +1,72 @@
+import pytest
+
+from knowledge_index import KnowledgeIndex, extract_target, normalize_name
+from report_parser import Competitor
+
+
+@pytest.fixture
+def index():
+    index = KnowledgeIndex(path=None)
+    index.add("Tesla", [
+        Competitor("Ford", "US", "Legacy automaker", "North America"),
+        Competitor("Volkswagen AG", "Germany", "Largest European carmaker", "Europe"),
+        Competitor("BYD", "China", "EV maker", "Asia-Pacific"),
+    ], provider="OpenAI")
+    index.add("Rivian", [Competitor("Ford", "US", "Legacy automaker", "North America")])
+    return index
+
+
+def test_normalize_name_drops_legal_suffixes():
+    assert normalize_name("Volkswagen AG") == normalize_name("volkswagen") == "volkswagen"
+
+
+def test_extract_target():
+    assert extract_target("Who are the competitors of Tesla in Europe?") == "Tesla"
+    assert extract_target("Tesla's main rivals") == "Tesla"
+    assert extract_target("what is ebitda") is None
+
+
+def test_fuzzy_duplicates_are_one_record(index):
+    index.add("Tesla", [Competitor("Volkswagen", "Germany", "Newer details", "Europe")])
+    records = index.competitors("Tesla")
+    assert len(records) == 3
+    assert records["volkswagen"]["name"] == "Volkswagen AG"
+    assert records["volkswagen"]["description"] == "Newer details"
+
+
+def test_region_question_is_answered(index):
+    answer = index.answer("Which of Tesla's competitors are in Europe?")
+    assert "Volkswagen AG" in answer and "BYD" not in answer
+
+
+def test_country_code_question_is_answered(index):
+    assert "Ford" in index.answer("Tesla competitors in the US")
+
+
+def test_shared_competitors(index):
+    answer = index.answer("Which competitors do Tesla and Rivian have in common?")
+    assert "Ford" in answer and "BYD" not in answer
+
+
+def test_reference_uses_context_target(index):
+    assert "BYD" in index.answer("Which of their competitors are in Asia-Pacific?", context_target="Tesla")
+
+
+@pytest.mark.parametrize("query", ["Which of those are in Germany?", "list those based in Germany"])
+def test_follow_up_picks_from_the_previous_answer(index, query):
+    answer = index.answer(query, context_target="Tesla")
+    assert "Volkswagen AG" in answer and "Ford" not in answer
+    assert index.answer(query) is None
+
+
+@pytest.mark.parametrize("query", [
+    "Tell us more about Tesla",
+    "Which of those is growing fastest?",
+    "How big are those in Germany?",
+    "How is Tesla doing in China?",
+    "What was Tesla's revenue in Europe last year?",
+    "what is their market share in Europe?",
+])
+def test_non_competitor_questions_go_to_the_models(index, query):
+    assert index.answer(query, context_target="Tesla") is None
+    assert index.hits == 0
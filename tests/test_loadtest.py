@@ -0,0 +1,16 @@
+import glob
+import os
+import re
+
+from loadtest.run_loadtest import APP_DB_PATHS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# A store added to the app must be redirected by the load test too
+def test_every_store_path_is_redirected():
+    variables = set()
+    for path in glob.glob(os.path.join(ROOT, "*.py")):
+        with open(path, encoding="utf-8") as f:
+            variables.update(re.findall(r'os\.getenv\("(\w+_PATH)"', f.read()))
+    assert variables and variables <= set(APP_DB_PATHS)
@@ -0,0 +1,49 @@
+import re
+
+import pytest
+
+import tokens
+from memory import TokenWindowMemory
+
+
+# One token per word (with its trailing space), far from 4 characters a token
+class WordEncoding:
+    name = "words"
+
+    def encode(self, text, disallowed_special=()):
+        return re.findall(r"\S+\s*|\s+", text)
+
+    def decode(self, pieces):
+        return "".join(pieces)
+
+
+@pytest.fixture
+def word_tokenizer(monkeypatch):
+    encoding = WordEncoding()
+    monkeypatch.setattr(tokens, "_encodings", {"gpt-words": encoding})
+    monkeypatch.setattr(tokens, "_encoded_length", lambda name, text: len(encoding.encode(text)))
+    return "gpt-words"
+
+
+def save_turns(memory, count, answer):
+    for i in range(count):
+        memory.save_context({"input": f"question {i}"}, {"output": answer})
+
+
+def test_old_turns_are_dropped_first():
+    memory = TokenWindowMemory(max_token_limit=40)
+    save_turns(memory, 3, "a short answer")
+    assert [m.content for m in memory.chat_memory.messages][::2] == ["question 0", "question 1", "question 2"]
+    save_turns(memory, 10, "an answer " * 10)
+    assert len(memory.chat_memory.messages) == 2
+    assert memory.token_count() <= 40
+
+
+@pytest.mark.parametrize("model", ["", "gpt-words"])
+def test_latest_answer_is_cut_to_the_budget(word_tokenizer, model):
+    memory = TokenWindowMemory(max_token_limit=50, tokenizer_model=model)
+    memory.save_context({"input": "Who are Tesla's competitors?"}, {"output": "competitor " * 200})
+    answer = memory.chat_memory.messages[-1].content
+    assert answer.startswith("competitor competitor") and answer.endswith(" …")
+    # Cut with the tokenizer prune counts with, so the budget is used, not overshot
+    assert 45 <= memory.token_count() <= 50
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+import provider_health
+from provider_health import CLOSED, OPEN, CircuitOpenError, available_providers, get_health
+from rate_limit import ProviderLimiter
+
+
+@pytest.fixture(autouse=True)
+def fresh_health(monkeypatch):
+    monkeypatch.setattr(provider_health, "_health", {})
+
+
+def open_circuit(llm_name, cool_down=0.05):
+    health = get_health(llm_name)
+    health.open_seconds = cool_down
+    for _ in range(provider_health.CIRCUIT_CONSECUTIVE_FAILURES):
+        health.record_failure("boom")
+    assert health.state == OPEN
+    return health
+
+
+def test_timeouts_and_errors_open_the_circuit():
+    health = get_health("Flaky")
+    health.record_failure("boom")
+    health.record_failure(timeout=True)
+    assert health.state == CLOSED
+    health.record_failure("boom")
+    assert health.state == OPEN and (health.errors, health.timeouts) == (2, 1)
+    assert available_providers(["Flaky"]) == []
+
+
+def test_trial_call_closes_the_circuit_without_a_prober():
+    health = open_circuit("NoProber")
+    time.sleep(0.06)
+    # Checking availability doesn't use up the half-open trial...
+    assert available_providers(["NoProber"]) == ["NoProber"]
+    assert health.state == OPEN
+
+    # ...so the call itself goes out as the trial and closes the circuit
+    limiter = ProviderLimiter("NoProber", rpm=600, tpm=100000)
+    assert limiter.call(lambda: "ok") == "ok"
+    assert health.state == CLOSED
+
+
+def test_skipped_provider_starts_its_probe():
+    health = open_circuit("Probed")
+    probed = threading.Event()
+    health.set_prober(probed.set)
+    assert available_providers(["Probed"]) == []
+    assert not probed.is_set()
+
+    time.sleep(0.06)
+    assert available_providers(["Probed"]) == []
+    assert probed.wait(1)
+    time.sleep(0.05)
+    assert health.state == CLOSED
+
+
+def test_refused_call_raises_without_recording():
+    health = open_circuit("Refused", cool_down=30)
+    limiter = ProviderLimiter("Refused", rpm=600, tpm=100000)
+    with pytest.raises(CircuitOpenError):
+        limiter.call(lambda: "ok")
+    assert (health.successes, health.state) == (0, OPEN)
+
+
+def test_abandoned_call_is_not_recorded():
+    health = get_health("Abandoned")
+    limiter = ProviderLimiter("Abandoned", rpm=600, tpm=100000)
+    abandoned = threading.Event()
+    abandoned.set()
+    assert limiter.call(lambda: "late", abandoned=abandoned) == "late"
+    with pytest.raises(ValueError):
+        limiter.call(lambda: (_ for _ in ()).throw(ValueError("late failure")), abandoned=abandoned)
+    assert (health.successes, health.errors) == (0, 0)
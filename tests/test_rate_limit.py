@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+import provider_health
+import rate_limit
+from rate_limit import ProviderLimiter, RateLimitTimeout, TokenBucket, is_rate_limit_error, is_retryable_error
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, message="failed"):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(provider_health, "_health", {})
+    monkeypatch.setattr(rate_limit, "backoff_delay", lambda attempt: 0.0)
+
+
+def test_error_classification():
+    assert is_rate_limit_error(StatusError(429))
+    assert is_rate_limit_error(Exception("Resource exhausted: quota"))
+    assert is_retryable_error(StatusError(503)) and is_retryable_error(TimeoutError())
+    assert not is_retryable_error(StatusError(401)) and not is_retryable_error(ValueError("bad request"))
+
+
+def test_token_bucket_reports_the_wait():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.take(60) == 0.0
+    assert bucket.take(3) == pytest.approx(3.0, abs=0.1)
+    bucket.adjust(3)
+    assert bucket.take(1) == pytest.approx(1.0, abs=0.1)
+
+
+def test_throttled_call_is_retried_and_halves_concurrency():
+    limiter = ProviderLimiter("Throttled", rpm=600, tpm=100000, initial_concurrency=8)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise StatusError(429, "rate limit")
+        return "ok"
+
+    assert limiter.call(flaky, reserved_tokens=100) == "ok"
+    assert len(attempts) == 2 and limiter.throttled == 1 and limiter.retries == 1
+    assert limiter.concurrency_limit < 8
+    # Throttling isn't a health failure
+    assert limiter.health.errors == 0 and limiter.in_flight == 0
+
+
+def test_bad_request_is_raised_at_once():
+    limiter = ProviderLimiter("BadRequest", rpm=600, tpm=100000)
+    calls = []
+
+    def bad():
+        calls.append(1)
+        raise StatusError(400, "bad request")
+
+    with pytest.raises(StatusError):
+        limiter.call(bad)
+    assert len(calls) == 1 and limiter.health.errors == 1 and limiter.in_flight == 0
+
+
+def test_quota_past_the_deadline_fails_fast():
+    limiter = ProviderLimiter("Quota", rpm=600, tpm=1000)
+    limiter.call(lambda: "ok", reserved_tokens=1000)
+    started = time.monotonic()
+    with pytest.raises(RateLimitTimeout):
+        limiter.call(lambda: "ok", reserved_tokens=1000, deadline=time.monotonic() + 1)
+    assert time.monotonic() - started < 0.5 and limiter.in_flight == 0
+
+
+def test_concurrency_window_caps_calls_in_flight():
+    limiter = ProviderLimiter("Window", rpm=6000, tpm=1000000, max_concurrency=2, initial_concurrency=2)
+    peak = []
+    lock = threading.Lock()
+
+    def slow():
+        with lock:
+            peak.append(limiter.in_flight)
+        time.sleep(0.05)
+
+    threads = [threading.Thread(target=limiter.call, args=(slow,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 2 and limiter.in_flight == 0
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from report_parser import ReportParser, canonical_region, parse_report
+from scoring import calculate_format_score
+
+REPORT = """Tesla is an EV maker. Its landscape is crowded.
+
+## North America
+The US market is mature.
+
+- **Ford (USA)** – Legacy automaker.
+- **GM (USA)** - Another one.
+
+## 3. Asia Pacific:
+- **BYD (China)**: Big EV maker.
+- Not a competitor line
+
+## Conclusion
+The market is competitive and growing."""
+
+
+@pytest.mark.parametrize("header, region", [
+    ("North America", "North America"),
+    ("**3. Asia Pacific:**", "Asia-Pacific"),
+    ("Middle East & North Africa (MENA)", "Middle East & North Africa"),
+    ("South America", "Latin America"),
+    ("Market overview", None),
+])
+def test_canonical_region(header, region):
+    assert canonical_region(header) == region
+
+
+def test_report_structure():
+    report = parse_report(REPORT)
+    assert report.intro == "Tesla is an EV maker. Its landscape is crowded."
+    assert list(report.regions) == ["North America", "Asia-Pacific"]
+    assert report.regions["North America"].description == "The US market is mature."
+    assert [(c.name, c.country, c.region) for c in report.competitors] == [
+        ("Ford", "USA", "North America"), ("GM", "USA", "North America"), ("BYD", "China", "Asia-Pacific"),
+    ]
+    assert report.conclusion == "The market is competitive and growing."
+
+
+def test_streamed_chunks_parse_like_the_whole_text():
+    parser = ReportParser()
+    for start in range(0, len(REPORT), 7):
+        parser.feed(REPORT[start:start + 7])
+    assert parser.close() == parse_report(REPORT)
+
+
+@pytest.mark.parametrize("size", [1, 3, 64])
+def test_chunks_split_anywhere_parse_alike(size):
+    parser = ReportParser()
+    for start in range(0, len(REPORT), size):
+        parser.feed(REPORT[start:start + size])
+        parser.feed("")
+    assert parser.close() == parse_report(REPORT)
+
+
+def test_long_lines_stream_in_linear_time():
+    text = "word " * 20_000
+    started = time.perf_counter()
+    parser = ReportParser()
+    for start in range(0, len(text), 4):
+        parser.feed(text[start:start + 4])
+    assert parser.close().words == 20_000
+    assert time.perf_counter() - started < 0.5
+
+
+def test_trailing_bullets_are_not_a_conclusion():
+    report = parse_report("Intro.\n\n## Europe\nSome prose.\n\nMore prose.\n\n- **VW (Germany)** – Big.")
+    assert report.conclusion == ""
+
+
+def test_scores():
+    assert parse_report(REPORT).score(True) == pytest.approx(20 + 2 / 7 * 30 + 3 / 5 * 30 + 20)
+    assert calculate_format_score(REPORT, True) == parse_report(REPORT).score(True)
+    prose = "\n\n".join(["word " * 30] * 3)
+    assert calculate_format_score(prose, False) == 100.0
+    assert calculate_format_score("## Header\n- bullet", False) < 100.0
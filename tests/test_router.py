@@ -0,0 +1,38 @@
+import pytest
+
+from router import INTENT_MAX_TOKENS, INTENTS, QueryRouter
+
+
+@pytest.fixture(scope="module")
+def router():
+    return QueryRouter()
+
+
+def test_every_intent_has_a_budget():
+    assert set(INTENT_MAX_TOKENS) == set(INTENTS)
+    assert INTENT_MAX_TOKENS["competitor"] == max(INTENT_MAX_TOKENS.values())
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("Who are the competitors of Rivian?", "competitor"),
+    ("Heineken rivals", "competitor"),
+    ("Rivian vs Lucid", "comparison"),
+    ("compare Heineken and Carlsberg", "comparison"),
+    ("what is free cash flow?", "general"),
+    ("explain the Rule of 40", "general"),
+])
+def test_routes_unseen_queries(router, query, intent):
+    assert router.route(query)[0] == intent
+
+
+def test_followups_need_history(router):
+    assert router.route("what about Europe?", has_history=True)[0] == "followup"
+    assert router.route("what about Europe?", has_history=False)[0] != "followup"
+
+
+def test_keyword_checks_decide_below_min_confidence():
+    router = QueryRouter(min_confidence=1.0)
+    assert router.route("Rivian versus Lucid")[0] == "comparison"
+    assert router.route("Who are the competitors of Rivian?")[0] == "competitor"
+    assert router.route("what is free cash flow?")[0] == "general"
+    assert router.counts == {"competitor": 1, "comparison": 1, "general": 1, "followup": 0}
@@ -0,0 +1,42 @@
+import pytest
+
+from semantic_cache import MERGE_EVERY, SemanticQueryIndex, query_subject
+
+
+def test_query_subject_strips_intent_words():
+    assert query_subject("Who are the main competitors of Tesla?") == "tesla"
+    assert query_subject("companies like Tesla") == query_subject("Tesla rivals") == "tesla"
+    assert query_subject("who are the competitors") == "who are the competitors"
+
+
+@pytest.mark.parametrize("query", ["Tesla rivals", "who competes with Tesla", "companies like Tesla"])
+def test_paraphrases_match(query):
+    index = SemanticQueryIndex()
+    index.add_many(["Who are the competitors of Tesla?", "Boeing rivals"])
+    match, similarity = index.lookup(query)
+    assert match == "who are the competitors of tesla" and similarity >= index.threshold
+
+
+def test_other_companies_and_removed_queries_miss():
+    index = SemanticQueryIndex()
+    index.add_many(["Who are the competitors of Tesla?", "Boeing rivals"])
+    assert index.lookup("Rivian rivals")[0] is None
+    index.remove("Boeing rivals")
+    assert index.lookup("Boeing competitors")[0] is None
+    assert index.stats() == {"entries": 1, "hits": 0, "misses": 2}
+
+
+def test_oldest_entries_are_evicted():
+    index = SemanticQueryIndex(max_entries=2)
+    index.add_many(["Tesla rivals", "Boeing rivals", "Apple rivals"])
+    assert len(index) == 2
+    assert index.lookup("Tesla competitors")[0] is None
+    assert index.lookup("Apple competitors")[0] == "apple rivals"
+
+
+def test_lookups_span_merged_and_buffered_rows():
+    index = SemanticQueryIndex()
+    index.add_many([f"Company{i} rivals" for i in range(MERGE_EVERY)])
+    index.add("Tesla rivals")
+    assert index.lookup("Company7 competitors")[0] == "company7 rivals"
+    assert index.lookup("Tesla competitors")[0] == "tesla rivals"
@@ -0,0 +1,33 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from sharded_report import (
+    CONCLUSION, INTRO, MISSING_SECTION, NO_COMPETITORS, SECTIONS, assemble_report, clean_section, generate_sharded
+)
+from telemetry import MetricsRegistry, TurnTrace
+
+
+def test_clean_section_drops_headers_and_labels():
+    assert clean_section("Europe", "## Europe\n**Europe:**\n- **VW (Germany)** – Big.") == "- **VW (Germany)** – Big."
+    assert clean_section("Europe", "## Europe\n") == NO_COMPETITORS
+    assert clean_section(INTRO, "**Introduction:**\nTesla makes EVs.\nIt has rivals.") == "Tesla makes EVs. It has rivals."
+
+
+def test_assemble_report_marks_failed_regions_only():
+    sections = {INTRO: "Intro.", "North America": "- **Ford (USA)** – Cars.", CONCLUSION: "Done."}
+    report = assemble_report(sections, failed={"Europe"})
+    assert report.startswith("Intro.\n\n## North America\n")
+    assert f"## Europe\n{MISSING_SECTION}" in report
+    assert "## Asia-Pacific" not in report
+    assert report.endswith("Done.")
+
+
+def test_sections_are_traced_under_their_provider():
+    registry = MetricsRegistry()
+    trace = TurnTrace("Tesla competitors", "competitor", registry=registry)
+    llms = {"ShardTraced": FakeListChatModel(responses=["- **Ford (USA)** – Cars."])}
+    list(generate_sharded(llms, "Tesla competitors", trace=trace))
+    calls = trace.finish()["calls"]
+
+    assert sorted(c["part"] for c in calls) == sorted(SECTIONS)
+    assert {c["provider"] for c in calls} == {"ShardTraced"}
+    assert registry.provider_summary()["ShardTraced"]["ok"] == len(SECTIONS)
@@ -0,0 +1,43 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from knowledge_index import KnowledgeIndex
+from sharded_report import SECTIONS, assemble_report
+from watchlist import Watchlist
+
+REPORT = assemble_report({section: "- **Ford (USA)** – Legacy automaker." for section in SECTIONS})
+
+
+def test_refresher_starts_with_the_first_company():
+    watchlist = Watchlist(path=":memory:", llms=lambda: {"OpenAI": FakeListChatModel(responses=[REPORT])},
+                          offpeak_hours="0-0").start()
+    assert watchlist._thread is None
+    watchlist.add("Tesla")
+    assert watchlist._thread is not None and watchlist._thread.is_alive()
+    watchlist.stop(timeout=5)
+    assert not watchlist._thread.is_alive()
+
+
+def test_no_llms_means_no_providers():
+    watchlist = Watchlist(path=":memory:")
+    watchlist.add("Tesla")
+    assert watchlist.refresh("Tesla") is None
+    assert not watchlist._providers_busy()
+    assert watchlist.entries()[0][3] == "no provider available"
+
+
+def test_knowledge_index_is_only_built_for_a_refresh():
+    built = []
+
+    def knowledge_index():
+        built.append(KnowledgeIndex(path=None))
+        return built[-1]
+
+    watchlist = Watchlist(path=":memory:", llms=lambda: {"OpenAI": FakeListChatModel(responses=[REPORT])},
+                          knowledge_index=knowledge_index)
+    watchlist.add("Tesla")
+    assert watchlist.lookup("Tesla") is None and not built
+
+    watched = watchlist.refresh("Tesla")
+    assert (watched.version, watched.provider) == (1, "OpenAI")
+    assert watchlist.lookup("Tesla").report == REPORT
+    assert "ford" in built[0].competitors("Tesla")
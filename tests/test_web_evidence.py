@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from prompts import get_prompt_template, grounded_template
+from web_evidence import WebEvidenceFetcher, format_evidence, format_evidence_prompt
+
+TESLA_PAGE = "<html><head><title>Tesla, Inc.</title></head><body><p>Tesla builds electric cars in Texas.</p></body></html>"
+
+
+@pytest.fixture
+def fetcher(page_server):
+    return WebEvidenceFetcher(path=":memory:", sources=f"company={page_server.url}/{{slug}}.html",
+                              render_js=False, timeout=5)
+
+
+def test_pages_are_cached_and_revalidated(page_server, fetcher):
+    page_server.pages["/Tesla.html"] = (TESLA_PAGE, 0)
+    page = fetcher.fetch(f"{page_server.url}/Tesla.html")
+    assert (page.title, page.text) == ("Tesla, Inc.", "Tesla builds electric cars in Texas.")
+
+    fetcher.fetch(f"{page_server.url}/Tesla.html")
+    assert page_server.requests == [("/Tesla.html", 200)]
+
+    fetcher.fresh_seconds = 0
+    assert fetcher.fetch(f"{page_server.url}/Tesla.html").text == page.text
+    assert page_server.requests[-1] == ("/Tesla.html", 304)
+    assert fetcher.stats["fresh"] == 1 and fetcher.stats["revalidated"] == 1
+
+
+def test_failed_render_keeps_the_plain_page(page_server, fetcher):
+    class TimingOutDriver:
+        def get(self, url):
+            raise TimeoutError("page load timed out")
+
+    script_page = "<html><head><title>Rivian</title></head><body><div id='root'></div>" + "<script></script>" * 3
+    page_server.pages["/Rivian.html"] = (script_page + "<p>Rivian makes trucks.</p></body></html>", 0)
+    fetcher.render_js, fetcher._driver = True, TimingOutDriver()
+    page = fetcher.fetch(f"{page_server.url}/Rivian.html")
+    assert (page.title, page.text, page.rendered) == ("Rivian", "Rivian makes trucks.", False)
+    assert fetcher.stats["fetched"] == 1
+
+
+def test_collect_waits_no_longer_than_asked(page_server, fetcher):
+    page_server.pages["/Tesla.html"] = (TESLA_PAGE, 0)
+    page_server.pages["/BYD.html"] = ("<p>BYD makes batteries and cars.</p>", 1.0)
+    started = time.monotonic()
+    evidence = fetcher.collect(fetcher.start(["Tesla", "BYD", "Nobody"]), timeout=0.3)
+    assert time.monotonic() - started < 0.8
+    assert [page.title for _, page in evidence["Tesla"]] == ["Tesla, Inc."]
+    assert evidence["BYD"] == [] and evidence["Nobody"] == []
+
+    # The late page still lands in the cache
+    time.sleep(1.0)
+    assert fetcher.enrich(["BYD"], timeout=0.3)["BYD"][0][1].text == "BYD makes batteries and cars."
+
+
+def test_evidence_formats(page_server, fetcher):
+    page_server.pages["/Tesla.html"] = (TESLA_PAGE, 0)
+    evidence = fetcher.enrich(["Tesla"])
+    assert format_evidence(evidence).startswith("### 🔎 Sources\n\n1. **Tesla** (company) · [Tesla, Inc.](")
+
+    template = grounded_template(get_prompt_template("competitor"), format_evidence_prompt(evidence))
+    prompt = template.format(input="Who are Tesla's competitors?", history="")
+    assert "Tesla builds electric cars in Texas." in prompt
+    assert prompt.index("**Web Evidence:**") < prompt.index("**User Query:**")
+    assert grounded_template(template, "") is template
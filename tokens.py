@@ -0,0 +1,99 @@
+import functools
+import os
+import threading
+
+# Rough chars-per-token ratio for English prose; good enough to keep the
+# prompt size flat without a tokenizer round-trip
+CHARS_PER_TOKEN = 4
+
+# (context window, max completion) in tokens by model-name prefix; the
+# longest matching prefix wins. Unknown models get CONTEXT_WINDOW_TOKENS
+# and MAX_COMPLETION_TOKENS.
+MODEL_LIMITS = {
+    "gpt-4o": (128000, 16384),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4": (8192, 8192),
+    "gpt-3.5-turbo": (16385, 4096),
+    "gemini-2.5": (1048576, 65536),
+    "gemini-2.0": (1048576, 8192),
+    "gemini-1.5": (1048576, 8192),
+}
+DEFAULT_MODEL_LIMITS = (
+    int(os.getenv("CONTEXT_WINDOW_TOKENS", "8192")),
+    int(os.getenv("MAX_COMPLETION_TOKENS", "4096")),
+)
+
+# Tokens each chat message costs on top of its text (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Token counts remembered by text; history messages are the same strings
+# on every turn, so re-counting them is a lookup
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "2048"))
+
+# Models whose tokenizer tiktoken has
+TIKTOKEN_PREFIXES = ("gpt-", "o1", "o3", "text-")
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def model_limits(model):
+    matches = [prefix for prefix in MODEL_LIMITS if (model or "").startswith(prefix)]
+    return MODEL_LIMITS[max(matches, key=len)] if matches else DEFAULT_MODEL_LIMITS
+
+
+def _load_encoding(model):
+    try:
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model(model)
+    except Exception as e:
+        print(f"⚠️ No tokenizer for {model}, estimating its token counts: {str(e)[:80]}")
+        encoding = None
+    with _encodings_lock:
+        _encodings[model] = encoding
+
+
+# tiktoken encoding for model, or None while it loads (its first use may
+# download it, so that happens on a background thread) and for models
+# without one
+def encoding_for(model):
+    if not model or not model.startswith(TIKTOKEN_PREFIXES):
+        return None
+    with _encodings_lock:
+        if model in _encodings:
+            return _encodings[model]
+        _encodings[model] = None
+    threading.Thread(target=_load_encoding, args=(model,), daemon=True, name=f"tokenizer-{model}").start()
+    return None
+
+
+@functools.lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def _encoded_length(encoding_name, text):
+    import tiktoken
+
+    return len(tiktoken.get_encoding(encoding_name).encode(text, disallowed_special=()))
+
+
+# Tokens in text for model: exact where a tokenizer is available, estimated otherwise
+def count_tokens(text, model=None):
+    encoding = encoding_for(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return _encoded_length(encoding.name, text)
+
+
+# The start of text that fits in max_tokens for model, cut with the same
+# tokenizer count_tokens uses
+def truncate_tokens(text, max_tokens, model=None):
+    if max_tokens <= 0:
+        return ""
+    encoding = encoding_for(model)
+    if encoding is None:
+        return text[:(max_tokens - 1) * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
@@ -0,0 +1,437 @@
+"""Companies whose competitor reports are kept precomputed.
+
+    python watchlist.py add Tesla "Nvidia Corp"
+    python watchlist.py list
+    python watchlist.py run --budget 50000
+
+The chat app refreshes stale reports on a background thread during off-peak
+hours (WATCHLIST_OFFPEAK_HOURS) and serves them instantly; `run` does one
+refresh pass now, e.g. from cron, within the same daily token budget.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from knowledge_index import normalize_name
+from provider_health import available_providers
+from rate_limit import get_limiter
+from report_parser import parse_report
+from telemetry import get_metrics
+
+# Shown as the "provider" of answers served from the watchlist
+WATCHLIST_PROVIDER = "Watchlist"
+
+WATCHLIST_DB_PATH = os.getenv("WATCHLIST_DB_PATH", os.path.join(".cache", "watchlist.sqlite3"))
+# Companies added at startup: a comma-separated list and/or a file in any
+# format batch.py reads
+WATCHLIST = os.getenv("WATCHLIST", "")
+WATCHLIST_FILE = os.getenv("WATCHLIST_FILE", "")
+# Reports older than this are refreshed; the chat serves them for up to
+# WATCHLIST_SERVE_SECONDS, asking for a background refresh once they're stale
+WATCHLIST_REFRESH_SECONDS = float(os.getenv("WATCHLIST_REFRESH_SECONDS", str(24 * 3600)))
+WATCHLIST_SERVE_SECONDS = float(os.getenv("WATCHLIST_SERVE_SECONDS", str(7 * 24 * 3600)))
+WATCHLIST_REVALIDATE = os.getenv("WATCHLIST_REVALIDATE", "1") == "1"
+# Local hours ("start-end", may wrap midnight) when scheduled refreshes run;
+# refreshes the chat asks for run at any hour
+WATCHLIST_OFFPEAK_HOURS = os.getenv("WATCHLIST_OFFPEAK_HOURS", "1-6")
+# Prompt + completion tokens the refresher may spend per day, and the guess
+# for a company that has never been refreshed
+WATCHLIST_DAILY_TOKENS = int(os.getenv("WATCHLIST_DAILY_TOKENS", "200000"))
+WATCHLIST_REPORT_TOKENS = int(os.getenv("WATCHLIST_REPORT_TOKENS", "12000"))
+WATCHLIST_POLL_SECONDS = float(os.getenv("WATCHLIST_POLL_SECONDS", "60"))
+# A company whose refresh failed isn't tried again for this long
+WATCHLIST_RETRY_SECONDS = float(os.getenv("WATCHLIST_RETRY_SECONDS", "900"))
+WATCHLIST_SHARDED = os.getenv("WATCHLIST_SHARDED", "0") == "1"
+
+
+def parse_hours(spec):
+    if not spec.strip():
+        return 0, 24
+    start, _, end = spec.partition("-")
+    return int(start), int(end or 24)
+
+
+def in_hours(hours, now=None):
+    start, end = hours
+    hour = time.localtime(now).tm_hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+@dataclass
+class WatchedReport:
+    company: str
+    version: int
+    report: str
+    provider: str
+    score: float
+    refreshed_at: float
+    tokens: int
+
+    def age(self):
+        return time.time() - self.refreshed_at
+
+
+# Watched companies and their latest precomputed report (with a version
+# that goes up on every refresh), in SQLite. start() runs the refresher
+# once a company is watched: stale reports, least recently refreshed
+# first, one company at a time, only in off-peak hours, within the daily
+# token budget and only while the providers have spare concurrency. Calls
+# go through the usual rate limiters and skip providers whose circuit is
+# open.
+class Watchlist:
+    def __init__(self, path=WATCHLIST_DB_PATH, llms=None, knowledge_index=None,
+                 refresh_seconds=WATCHLIST_REFRESH_SECONDS, serve_seconds=WATCHLIST_SERVE_SECONDS,
+                 daily_tokens=WATCHLIST_DAILY_TOKENS, offpeak_hours=WATCHLIST_OFFPEAK_HOURS,
+                 sharded=WATCHLIST_SHARDED, registry=None):
+        # llms: callable returning {llm_name: llm}; knowledge_index: callable
+        # returning the index refreshed reports go into. Both are called on
+        # the first refresh.
+        self.llms = llms
+        self.knowledge_index = knowledge_index
+        self.refresh_seconds = refresh_seconds
+        self.serve_seconds = serve_seconds
+        self.daily_tokens = daily_tokens
+        self.offpeak_hours = parse_hours(offpeak_hours)
+        self.sharded = sharded
+        self.registry = registry or get_metrics()
+        self.refreshing = None
+        self.hits = 0
+        self._urgent = []
+        self._chains = None
+        self._thread = None
+        self._autostart = False
+        self._stopped = False
+        self._budget_warned = None
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            " company_key TEXT PRIMARY KEY, company TEXT, added_at REAL, version INTEGER DEFAULT 0,"
+            " report TEXT, provider TEXT, score REAL, refreshed_at REAL DEFAULT 0, tokens INTEGER,"
+            " attempted_at REAL DEFAULT 0, last_error TEXT)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS spend (day TEXT PRIMARY KEY, tokens INTEGER)")
+        self._db.commit()
+
+    def add(self, company):
+        company = company.strip()
+        key = normalize_name(company)
+        if not key:
+            return False
+        with self._lock:
+            added = self._db.execute(
+                "INSERT OR IGNORE INTO reports (company_key, company, added_at) VALUES (?, ?, ?)",
+                (key, company, time.time())
+            ).rowcount
+            self._db.commit()
+        if added and self._autostart:
+            self._start_thread()
+        return bool(added)
+
+    def remove(self, company):
+        with self._lock:
+            self._db.execute("DELETE FROM reports WHERE company_key = ?", (normalize_name(company),))
+            self._db.commit()
+
+    # (company, version, refreshed_at, last_error) for every watched company
+    def entries(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT company, version, refreshed_at, last_error FROM reports ORDER BY company"
+            ).fetchall()
+
+    def get(self, company):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT company, version, report, provider, score, refreshed_at, tokens FROM reports"
+                " WHERE company_key = ? AND version > 0",
+                (normalize_name(company),)
+            ).fetchone()
+        return WatchedReport(*row) if row else None
+
+    # The precomputed report the chat may serve for company, or None. A
+    # stale one is still served and queued for a background refresh.
+    def lookup(self, company, revalidate=WATCHLIST_REVALIDATE):
+        watched = self.get(company)
+        if watched is None or watched.age() >= self.serve_seconds:
+            return None
+        stale = watched.age() >= self.refresh_seconds
+        self.hits += 1
+        self.registry.inc("watchlist_served_total", state="stale" if stale else "fresh")
+        if stale and revalidate:
+            self.revalidate(watched.company)
+        return watched
+
+    # Refresh company soon, whatever the hour
+    def revalidate(self, company):
+        with self._cond:
+            if company not in self._urgent and company != self.refreshing:
+                self._urgent.append(company)
+                self._cond.notify()
+
+    # Companies with a stale report, least recently refreshed first; those
+    # that failed recently wait their turn
+    def due(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT company FROM reports WHERE refreshed_at < ? AND attempted_at < ?"
+                " ORDER BY refreshed_at, added_at",
+                (now - self.refresh_seconds, now - WATCHLIST_RETRY_SECONDS)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def tokens_spent(self, day=None):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tokens FROM spend WHERE day = ?", (day or time.strftime("%Y-%m-%d"),)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def _spend(self, tokens):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO spend VALUES (?, ?) ON CONFLICT(day) DO UPDATE SET tokens = tokens + excluded.tokens",
+                (time.strftime("%Y-%m-%d"), tokens)
+            )
+            self._db.commit()
+        self.registry.inc("watchlist_tokens_total", tokens)
+
+    # What refreshing company is expected to cost: its last refresh, or the default guess
+    def estimated_tokens(self, company):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tokens FROM reports WHERE company_key = ?", (normalize_name(company),)
+            ).fetchone()
+        return row[0] if row and row[0] else WATCHLIST_REPORT_TOKENS
+
+    def affordable(self, company):
+        return self.tokens_spent() + self.estimated_tokens(company) <= self.daily_tokens
+
+    def _build_chains(self):
+        if self._chains is None:
+            from batch import BatchChain
+            from prompts import get_prompt_template
+
+            # Without llms there are no providers to refresh with
+            llms = self.llms() if self.llms is not None else {}
+            prompt = get_prompt_template("competitor")
+            self._chains = {llm_name: BatchChain(llm_name, llm, prompt) for llm_name, llm in (llms or {}).items()}
+        return self._chains
+
+    # Regenerate company's report now (no budget or hour check); returns
+    # the new WatchedReport, or None when no provider answered
+    def refresh(self, company):
+        from batch import DEFAULT_QUESTION, analyze_company
+
+        chains = self._build_chains()
+        chains = {n: chains[n] for n in available_providers(chains)}
+        if not chains:
+            self._failed(company, "no provider available")
+            return None
+
+        print(f"👀 Refreshing {company}")
+        record = analyze_company(company, chains, DEFAULT_QUESTION, sharded=self.sharded)
+        self._spend(record.get("tokens", 0))
+        if "response" not in record:
+            self._failed(company, "; ".join(f"{n}: {e}" for n, e in record.get("errors", {}).items()))
+            return None
+
+        with self._lock:
+            self._db.execute(
+                "UPDATE reports SET version = version + 1, report = ?, provider = ?, score = ?, refreshed_at = ?,"
+                " tokens = ?, last_error = NULL WHERE company_key = ?",
+                (record["response"], record["llm"], record["score"], time.time(), record["tokens"],
+                 normalize_name(company))
+            )
+            self._db.commit()
+        if self.knowledge_index is not None:
+            self.knowledge_index().add(company, parse_report(record["response"]).competitors, provider=record["llm"])
+        self.registry.inc("watchlist_refreshes_total", outcome="ok")
+        watched = self.get(company)
+        if watched is not None:
+            print(f"✅ Watchlist: {company} v{watched.version} from {watched.provider} "
+                  f"({watched.tokens} tokens, {record['elapsed']}s)")
+        return watched
+
+    def _failed(self, company, error):
+        with self._lock:
+            self._db.execute(
+                "UPDATE reports SET attempted_at = ?, last_error = ? WHERE company_key = ?",
+                (time.time(), error, normalize_name(company))
+            )
+            self._db.commit()
+        self.registry.inc("watchlist_refreshes_total", outcome="error")
+        print(f"❌ Watchlist refresh of {company} failed: {error[:120]}")
+
+    # Refresh due companies, oldest first, until the budget runs out;
+    # returns how many were refreshed
+    def run_once(self, limit=None):
+        refreshed = 0
+        for company in self.due()[:limit]:
+            if not self.affordable(company):
+                print(f"💸 Watchlist budget spent ({self.tokens_spent()}/{self.daily_tokens} tokens today)")
+                break
+            if self.refresh(company) is not None:
+                refreshed += 1
+        return refreshed
+
+    # Every provider with a key is busy with chat traffic
+    def _providers_busy(self):
+        limiters = [get_limiter(llm_name) for llm_name in self._build_chains()]
+        return bool(limiters) and all(l.in_flight >= l.concurrency_limit for l in limiters)
+
+    def _next_company(self):
+        with self._cond:
+            urgent = list(self._urgent)
+        due = self.due()
+        candidates = [c for c in urgent if normalize_name(c) in {normalize_name(d) for d in due}]
+        if not candidates and in_hours(self.offpeak_hours):
+            candidates = due[:1]
+        with self._cond:
+            self._urgent = [c for c in self._urgent if c in candidates]
+        if not candidates:
+            return None
+
+        company = candidates[0]
+        if not self.affordable(company):
+            day = time.strftime("%Y-%m-%d")
+            if self._budget_warned != day:
+                self._budget_warned = day
+                print(f"💸 Watchlist budget spent ({self.tokens_spent()}/{self.daily_tokens} tokens today)")
+            return None
+        if self._providers_busy():
+            return None
+        return company
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                company = self._next_company()
+                if company is not None:
+                    with self._cond:
+                        if company in self._urgent:
+                            self._urgent.remove(company)
+                        self.refreshing = company
+                    try:
+                        self.refresh(company)
+                    finally:
+                        self.refreshing = None
+                    continue
+            except Exception as e:
+                print(f"❌ Watchlist refresher: {str(e)}")
+            with self._cond:
+                if self._stopped:
+                    break
+                if not self._urgent:
+                    self._cond.wait(WATCHLIST_POLL_SECONDS)
+                else:
+                    self._cond.wait(1.0)
+
+    def _start_thread(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="watchlist")
+                self._thread.start()
+
+    # Run the refresher now if anything is watched, else from the first add()
+    def start(self):
+        self._autostart = True
+        if self.entries():
+            self._start_thread()
+        return self
+
+    # End the refresher after the refresh in progress, if any
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        entries = self.entries()
+        now = time.time()
+        return {
+            "watched": len(entries),
+            "fresh": sum(1 for _, version, refreshed_at, _ in entries
+                         if version and now - refreshed_at < self.refresh_seconds),
+            "tokens_today": self.tokens_spent(),
+            "daily_tokens": self.daily_tokens,
+            "refreshing": self.refreshing,
+            "hits": self.hits,
+        }
+
+
+# Companies named in WATCHLIST and WATCHLIST_FILE
+def configured_companies():
+    companies = [c.strip() for c in WATCHLIST.split(",") if c.strip()]
+    if WATCHLIST_FILE and os.path.exists(WATCHLIST_FILE):
+        from batch import read_companies
+
+        companies += read_companies(WATCHLIST_FILE)
+    return companies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage and refresh precomputed competitor reports.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("add", help="watch companies").add_argument("companies", nargs="+")
+    commands.add_parser("remove", help="stop watching companies").add_argument("companies", nargs="+")
+    commands.add_parser("list", help="show watched companies and report ages")
+    run = commands.add_parser("run", help="refresh stale reports now, within the daily budget")
+    run.add_argument("--budget", type=int, default=WATCHLIST_DAILY_TOKENS, help="tokens the refresher may spend today")
+    run.add_argument("--limit", type=int, help="refresh at most this many companies")
+    run.add_argument("--sharded", action="store_true", default=WATCHLIST_SHARDED,
+                     help="generate each report as parallel per-region sections")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if args.command == "run":
+        from providers import PROVIDER_KEYS, build_llms
+
+        llms, _ = build_llms({n: os.getenv(env_var) for n, env_var in PROVIDER_KEYS.items()})
+        if not llms:
+            print("⚠️ No API key for any provider")
+            return 2
+        watchlist = Watchlist(llms=lambda: llms, daily_tokens=args.budget, sharded=args.sharded)
+    else:
+        watchlist = Watchlist()
+    for company in configured_companies():
+        watchlist.add(company)
+
+    if args.command == "add":
+        for company in args.companies:
+            print(f"👀 {'Watching' if watchlist.add(company) else 'Already watching'} {company}")
+    elif args.command == "remove":
+        for company in args.companies:
+            watchlist.remove(company)
+            print(f"🗑️ Stopped watching {company}")
+    elif args.command == "list":
+        now = time.time()
+        for company, version, refreshed_at, last_error in watchlist.entries():
+            age = f"{(now - refreshed_at) / 3600:.1f}h old" if version else "never refreshed"
+            print(f"{company}: v{version}, {age}" + (f" (last error: {last_error[:80]})" if last_error else ""))
+        print(f"💸 {watchlist.tokens_spent()}/{watchlist.daily_tokens} tokens spent today")
+    else:
+        refreshed = watchlist.run_once(args.limit)
+        print(f"🏁 {refreshed} report(s) refreshed, {watchlist.tokens_spent()} tokens spent today")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
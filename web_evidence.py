@@ -0,0 +1,294 @@
+import concurrent.futures
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+from dataclasses import dataclass
+
+# Ground competitor reports with web evidence (off unless set to 1); the
+# chat sidebar can switch this per session
+WEB_EVIDENCE = os.getenv("WEB_EVIDENCE", "0") == "1"
+
+EVIDENCE_DB_PATH = os.getenv("EVIDENCE_DB_PATH", os.path.join(".cache", "web.sqlite3"))
+# Pages fetched within this long are used without asking the server; older
+# ones are revalidated with a conditional GET
+EVIDENCE_FRESH_SECONDS = float(os.getenv("EVIDENCE_FRESH_SECONDS", str(24 * 3600)))
+EVIDENCE_TIMEOUT_SECONDS = float(os.getenv("EVIDENCE_TIMEOUT_SECONDS", "8"))
+# How long a report waits for pages about its target before it is generated
+# (without them, if they're late), and how long the Sources list under it
+# waits for the competitors' pages. Late pages are still cached.
+EVIDENCE_GROUNDING_WAIT_SECONDS = float(os.getenv("EVIDENCE_GROUNDING_WAIT_SECONDS", "2"))
+EVIDENCE_SOURCES_WAIT_SECONDS = float(os.getenv("EVIDENCE_SOURCES_WAIT_SECONDS", "2"))
+EVIDENCE_MAX_WORKERS = int(os.getenv("EVIDENCE_MAX_WORKERS", "16"))
+EVIDENCE_PER_HOST = int(os.getenv("EVIDENCE_PER_HOST", "4"))
+# The target plus at most this many of its competitors are looked up
+EVIDENCE_MAX_COMPANIES = int(os.getenv("EVIDENCE_MAX_COMPANIES", "8"))
+EVIDENCE_SNIPPET_CHARS = 240
+# Text of each page given to the model
+EVIDENCE_PROMPT_CHARS = int(os.getenv("EVIDENCE_PROMPT_CHARS", "800"))
+# Pages with less text than this that look script-rendered are loaded in a
+# headless browser, if Selenium and a driver are available
+EVIDENCE_RENDER_JS = os.getenv("EVIDENCE_RENDER_JS", "1") == "1"
+EVIDENCE_MIN_TEXT_CHARS = 200
+
+# Where to look for each company: "kind=url template" pairs, with {slug}
+# (Wikipedia-style title) and {query} (URL-encoded name) filled in. Point
+# them at a local server to test without the network.
+DEFAULT_EVIDENCE_SOURCES = (
+    "company=https://en.wikipedia.org/wiki/{slug},"
+    "news=https://news.google.com/rss/search?q={query}"
+)
+USER_AGENT = "Mozilla/5.0 (compatible; CompetitorAnalysisBot/1.0)"
+
+# Markers of pages that render their content with JavaScript
+JS_APP_RE = re.compile(r'id="(?:root|app|__next|__nuxt)"|enable javascript|requires javascript', re.I)
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def parse_sources(spec):
+    sources = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, template = item.partition("=")
+        sources.append((kind.strip(), template.strip()))
+    return sources
+
+
+def source_url(template, name):
+    return template.format(
+        slug=urllib.parse.quote(name.strip().replace(" ", "_")),
+        query=urllib.parse.quote_plus(name.strip()),
+    )
+
+
+@dataclass
+class Page:
+    url: str
+    title: str
+    text: str
+    status: int = 200
+    rendered: bool = False
+
+
+# Title and readable text of a page: headlines of a news feed, otherwise
+# the meta description and paragraphs. Only the tags that carry text are
+# parsed. Returns (title, text, script_count).
+def extract_text(html, content_type=""):
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    if "xml" in content_type or html.lstrip().startswith("<?xml"):
+        soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer(["title", "item"]))
+        titles = [t.get_text(" ", strip=True) for t in soup.find_all("title")]
+        return (titles[0] if titles else ""), " · ".join(titles[1:]), 0
+
+    soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer(["title", "meta", "p", "script"]))
+    title = soup.title.get_text(" ", strip=True) if soup.title else ""
+    description = soup.find("meta", attrs={"name": "description"})
+    parts = [description["content"]] if description and description.get("content") else []
+    parts += [p.get_text(" ", strip=True) for p in soup.find_all("p")]
+    text = WHITESPACE_RE.sub(" ", " ".join(part for part in parts if part)).strip()
+    return title, text, len(soup.find_all("script"))
+
+
+def needs_javascript(html, text, script_count):
+    return len(text) < EVIDENCE_MIN_TEXT_CHARS and (script_count >= 3 or bool(JS_APP_RE.search(html)))
+
+
+# Company pages and news for a competitor report, fetched in parallel over
+# one keep-alive connection pool with at most per_host requests per host.
+# Pages are cached in SQLite with their ETag/Last-Modified: fresh ones cost
+# no request, stale ones a conditional GET (usually a 304). Selenium is
+# only started for pages that need JavaScript. Shared by every session.
+class WebEvidenceFetcher:
+    def __init__(self, path=EVIDENCE_DB_PATH, sources=None, fresh_seconds=EVIDENCE_FRESH_SECONDS,
+                 timeout=EVIDENCE_TIMEOUT_SECONDS, per_host=EVIDENCE_PER_HOST,
+                 max_workers=EVIDENCE_MAX_WORKERS, render_js=EVIDENCE_RENDER_JS):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.sources = parse_sources(sources or os.getenv("EVIDENCE_SOURCES", DEFAULT_EVIDENCE_SOURCES))
+        self.fresh_seconds = fresh_seconds
+        self.timeout = timeout
+        self.per_host = per_host
+        self.render_js = render_js
+        self.stats = {"fresh": 0, "revalidated": 0, "fetched": 0, "rendered": 0, "errors": 0}
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix="web-evidence")
+        self._host_slots = {}
+        self._driver = None
+        self._driver_lock = threading.Lock()
+        self._lock = threading.Lock()
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " url TEXT PRIMARY KEY, status INTEGER, etag TEXT, last_modified TEXT, fetched_at REAL,"
+            " html BLOB, title TEXT, text TEXT, rendered INTEGER)"
+        )
+        self._db.commit()
+
+    def _host_slot(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _cached(self, url):
+        with self._lock:
+            return self._db.execute(
+                "SELECT status, etag, last_modified, fetched_at, title, text, rendered FROM pages WHERE url = ?",
+                (url,)
+            ).fetchone()
+
+    def _store(self, url, status, etag, last_modified, html, title, text, rendered):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, status, etag, last_modified, time.time(), zlib.compress(html.encode("utf-8")),
+                 title, text, int(rendered))
+            )
+            self._db.commit()
+
+    def _touch(self, url):
+        with self._lock:
+            self._db.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+
+    # The page's HTML after scripts ran, from one shared headless Chrome;
+    # None (and no further attempts) when Selenium can't start a browser,
+    # and None for a page that fails or times out while rendering
+    def _render(self, url):
+        with self._driver_lock:
+            if self._driver is None:
+                try:
+                    from selenium import webdriver
+
+                    options = webdriver.ChromeOptions()
+                    options.add_argument("--headless=new")
+                    options.add_argument("--no-sandbox")
+                    self._driver = webdriver.Chrome(options=options)
+                    self._driver.set_page_load_timeout(self.timeout)
+                except Exception as e:
+                    print(f"⚠️ JavaScript rendering unavailable: {str(e)[:80]}")
+                    self.render_js = False
+                    return None
+            try:
+                self._driver.get(url)
+                return self._driver.page_source
+            except Exception as e:
+                print(f"⚠️ Couldn't render {url}: {str(e)[:80]}")
+                return None
+
+    def fetch(self, url):
+        cached = self._cached(url)
+        if cached is not None and time.time() - cached[3] < self.fresh_seconds:
+            self._count("fresh")
+            return Page(url, cached[4], cached[5], cached[0], bool(cached[6]))
+
+        headers = {}
+        if cached is not None:
+            if cached[1]:
+                headers["If-None-Match"] = cached[1]
+            if cached[2]:
+                headers["If-Modified-Since"] = cached[2]
+        with self._host_slot(url):
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached is not None:
+            self._touch(url)
+            self._count("revalidated")
+            return Page(url, cached[4], cached[5], cached[0], bool(cached[6]))
+        # A missing page stays missing until it goes stale, like any other
+        if response.status_code in (404, 410):
+            self._store(url, response.status_code, None, None, "", "", "", False)
+            self._count("fetched")
+            return Page(url, "", "", response.status_code)
+        response.raise_for_status()
+
+        html = response.text
+        title, text, script_count = extract_text(html, response.headers.get("Content-Type", ""))
+        rendered = False
+        if self.render_js and needs_javascript(html, text, script_count):
+            rendered_html = self._render(url)
+            if rendered_html:
+                html, rendered = rendered_html, True
+                title, text, _ = extract_text(html)
+                self._count("rendered")
+        self._store(url, response.status_code, response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"), html, title, text, rendered)
+        self._count("fetched")
+        return Page(url, title, text, response.status_code, rendered)
+
+    # Start fetching every source for each company name; collect() the
+    # pages later, so the fetches overlap other work
+    def start(self, names):
+        futures = {}
+        for name in names:
+            for kind, template in self.sources:
+                futures[self._executor.submit(self.fetch, source_url(template, name))] = (name, kind)
+        return futures
+
+    # Pages for each company name of started fetches, in the order given,
+    # from every source that answered within the timeout. Fetches already
+    # running when it passes finish into the cache.
+    def collect(self, futures, timeout=None):
+        names = list(dict.fromkeys(name for name, _ in futures.values()))
+        done, pending = concurrent.futures.wait(futures, timeout=self.timeout if timeout is None else timeout)
+        for future in pending:
+            future.cancel()
+
+        evidence = {name: [] for name in names}
+        for future, (name, kind) in futures.items():
+            if future not in done:
+                continue
+            try:
+                page = future.result()
+            except Exception as e:
+                self._count("errors")
+                print(f"⚠️ No {kind} evidence for {name}: {str(e)[:80]}")
+                continue
+            if page.text:
+                evidence[name].append((kind, page))
+        return evidence
+
+    def enrich(self, names, timeout=None):
+        return self.collect(self.start(names), timeout)
+
+
+def snippet(text, chars):
+    return text[:chars].rsplit(" ", 1)[0] if len(text) > chars else text
+
+
+# Markdown block listing the evidence under the report. Numbered lines
+# rather than bullets, so the report parser never reads them as competitors.
+def format_evidence(evidence, snippet_chars=EVIDENCE_SNIPPET_CHARS):
+    lines = []
+    for name, pages in evidence.items():
+        for kind, page in pages:
+            title = (page.title or kind).replace("[", "(").replace("]", ")")
+            lines.append(f"{len(lines) + 1}. **{name}** ({kind}) · [{title}]({page.url}): "
+                         f"{snippet(page.text, snippet_chars)}")
+    if not lines:
+        return ""
+    return "\n".join(["### 🔎 Sources", ""] + lines)
+
+
+# The evidence as plain lines for the model's prompt (see
+# prompts.grounded_template); empty when there is none
+def format_evidence_prompt(evidence, chars=EVIDENCE_PROMPT_CHARS):
+    return "\n".join(
+        f"- {name} ({kind}, {page.url}): {snippet(page.text, chars)}"
+        for name, pages in evidence.items() for kind, page in pages
+    )